@@ -0,0 +1,10 @@
+"""
+asv benchmarks for the load, fit, save and figure stages, run on synthetic fixtures.
+
+    uv sync --group bench
+    uv run asv run --environment existing        # benchmark the current commit
+    uv run asv compare <commit1> <commit2>       # compare stored results
+
+Set BETATA_BENCH_SCALES (default "1,10") to benchmark other multiples of our real trace
+counts, e.g. BETATA_BENCH_SCALES=1,10,100.
+"""
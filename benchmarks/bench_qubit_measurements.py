@@ -0,0 +1,149 @@
+"""Benchmarks for the qubit load, fit, save and figure stages"""
+
+import io
+from pathlib import Path
+
+from benchmarks.common import NUM_FIT_TRACES, NUM_PLOT_TRACES, SCALES
+from benchmarks import synthetic
+
+from betata import plt
+from betata.qubit_measurements.qubit import load_qubit, load_qubits, save_qubit
+from betata.qubit_measurements.traces import (
+    load_t1_traces,
+    load_t2e_traces,
+    load_t2r_traces,
+)
+from betata.qubit_measurements.fit_t1_traces.fit_t1_traces import (
+    fit_t1_trace,
+    plot_t1_trace,
+    plot_t1_vs_time,
+)
+from betata.qubit_measurements.fit_t2e_traces.fit_t2e_traces import fit_t2e_trace
+from betata.qubit_measurements.fit_t2r_traces.fit_t2r_traces import fit_t2r_trace
+
+
+def write_fixtures() -> dict[int, Path]:
+    """one folder of qubit fixtures per scale, written in the asv setup_cache directory"""
+    folders = {}
+    for scale in SCALES:
+        folder = Path.cwd() / f"qubit_measurements_x{scale}"
+        synthetic.write_t1_traces(folder / "T1", scale=scale)
+        synthetic.write_t2e_traces(folder / "T2E", scale=scale)
+        synthetic.write_t2r_traces(folder / "T2R", scale=scale)
+        synthetic.write_qubit(folder / "qubits" / "Q0_4p69.h5", scale=scale)
+        folders[scale] = folder
+    return folders
+
+
+class LoadQubitTraces:
+    """ """
+
+    params = SCALES
+    param_names = ["scale"]
+    timeout = 1200
+
+    def setup_cache(self):
+        """ """
+        return write_fixtures()
+
+    def time_load_t1_traces(self, folders, scale):
+        """ """
+        load_t1_traces(folders[scale] / "T1")
+
+    def time_load_t2e_traces(self, folders, scale):
+        """ """
+        load_t2e_traces(folders[scale] / "T2E")
+
+    def time_load_t2r_traces(self, folders, scale):
+        """ """
+        load_t2r_traces(folders[scale] / "T2R")
+
+    def time_load_qubits(self, folders, scale):
+        """ """
+        load_qubits(folders[scale] / "qubits")
+
+    def peakmem_load_t1_traces(self, folders, scale):
+        """ """
+        load_t1_traces(folders[scale] / "T1")
+
+
+class FitQubitTraces:
+    """ """
+
+    timeout = 600
+
+    def setup_cache(self):
+        """ """
+        return write_fixtures()
+
+    def setup(self, folders):
+        """ """
+        folder = folders[SCALES[0]]
+        self.t1_traces = load_t1_traces(folder / "T1")[:NUM_FIT_TRACES]
+        self.t2e_traces = load_t2e_traces(folder / "T2E")[:NUM_FIT_TRACES]
+        self.t2r_traces = load_t2r_traces(folder / "T2R")[:NUM_FIT_TRACES]
+
+    def time_fit_t1_traces(self, folders):
+        """ """
+        for trace in self.t1_traces:
+            fit_t1_trace(trace, plot=False)
+
+    def time_fit_t2e_traces(self, folders):
+        """ """
+        for trace in self.t2e_traces:
+            fit_t2e_trace(trace, plot=False)
+
+    def time_fit_t2r_traces(self, folders):
+        """ """
+        for trace in self.t2r_traces:
+            fit_t2r_trace(trace, plot=False)
+
+
+class SaveQubit:
+    """ """
+
+    params = SCALES
+    param_names = ["scale"]
+    timeout = 1200
+
+    def setup_cache(self):
+        """ """
+        return write_fixtures()
+
+    def setup(self, folders, scale):
+        """ """
+        self.qubit_file = folders[scale] / "qubits" / "Q0_4p69.h5"
+        self.qubit = load_qubit(self.qubit_file)
+
+    def time_save_qubit(self, folders, scale):
+        """ """
+        save_qubit(self.qubit, self.qubit_file)
+
+
+class QubitFigures:
+    """ """
+
+    timeout = 600
+
+    def setup_cache(self):
+        """ """
+        return write_fixtures()
+
+    def setup(self, folders):
+        """ """
+        self.traces = load_t1_traces(folders[SCALES[0]] / "T1")
+        for trace in self.traces:
+            fit_t1_trace(trace, plot=False)
+
+    def time_plot_t1_traces(self, folders):
+        """ """
+        for trace in self.traces[:NUM_PLOT_TRACES]:
+            fig, _ = plot_t1_trace(trace)
+            fig.savefig(io.BytesIO(), dpi=50)
+            plt.close(fig)
+
+    def time_plot_t1_vs_time(self, folders):
+        """ """
+        fig = plot_t1_vs_time(self.traces, "Q0_4p69")
+        fig.savefig(io.BytesIO(), dpi=300)
+        plt.close(fig)
@@ -0,0 +1,131 @@
+"""Benchmarks for the resonator load, fit, save and figure stages"""
+
+import io
+from pathlib import Path
+
+from benchmarks.common import SCALES
+from benchmarks import synthetic
+
+from betata import plt
+from betata.resonator_studies.fit_s21_traces.fit_s21_traces import fit_s21_batch
+from betata.resonator_studies.resonator import (
+    load_resonator,
+    load_resonators,
+    save_resonator,
+)
+from betata.resonator_studies.trace import load_fitted_traces, load_traces, save_traces
+from betata.resonator_studies.tls_losses.pms_vs_qtls0 import (
+    plot_data as plot_qtls0_vs_pms,
+)
+
+
+def write_fixtures() -> dict[int, Path]:
+    """one folder of resonator fixtures per scale, written in the asv setup_cache directory"""
+    folders = {}
+    for scale in SCALES:
+        folder = Path.cwd() / f"resonator_studies_x{scale}"
+        synthetic.write_s21_traces(folder / "R0_F0_5p00", scale=scale)
+        synthetic.write_resonators(folder / "resonators", scale=scale)
+        folders[scale] = folder
+    return folders
+
+
+class LoadResonators:
+    """ """
+
+    params = SCALES
+    param_names = ["scale"]
+    timeout = 1200
+
+    def setup_cache(self):
+        """ """
+        return write_fixtures()
+
+    def time_load_traces(self, folders, scale):
+        """ """
+        load_traces(folders[scale] / "R0_F0_5p00")
+
+    def time_load_resonators(self, folders, scale):
+        """ """
+        load_resonators(folder=folders[scale] / "resonators")
+
+    def time_load_resonators_without_traces(self, folders, scale):
+        """ """
+        load_resonators(with_traces=False, folder=folders[scale] / "resonators")
+
+    def peakmem_load_resonators(self, folders, scale):
+        """ """
+        load_resonators(folder=folders[scale] / "resonators")
+
+
+class FitS21Traces:
+    """ """
+
+    params = SCALES
+    param_names = ["scale"]
+    timeout = 1200
+
+    def setup_cache(self):
+        """ """
+        return write_fixtures()
+
+    def setup(self, folders, scale):
+        """ """
+        self.traces = load_traces(folders[scale] / "R0_F0_5p00")
+
+    def time_fit_s21_batch(self, folders, scale):
+        """ """
+        fit_s21_batch(self.traces)
+
+    def peakmem_fit_s21_batch(self, folders, scale):
+        """ """
+        fit_s21_batch(self.traces)
+
+
+class SaveResonator:
+    """ """
+
+    timeout = 600
+
+    def setup_cache(self):
+        """ """
+        return write_fixtures()
+
+    def setup(self, folders):
+        """ """
+        folder = folders[SCALES[0]] / "resonators"
+        self.resonator_file = next(folder.iterdir())
+        self.resonator = load_resonator(self.resonator_file)
+        self.traces = load_fitted_traces(self.resonator_file)
+
+    def time_save_resonator(self, folders):
+        """ """
+        save_resonator(self.resonator, self.resonator_file)
+
+    def time_save_traces(self, folders):
+        """ """
+        save_traces(self.traces, self.resonator_file)
+
+
+class ResonatorFigures:
+    """ """
+
+    timeout = 600
+
+    def setup_cache(self):
+        """ """
+        return write_fixtures()
+
+    def setup(self, folders):
+        """ """
+        folder = folders[SCALES[0]] / "resonators"
+        self.resonators = load_resonators(with_traces=False, folder=folder)
+
+    def time_plot_qtls0_vs_pms(self, folders):
+        """ """
+        p_ms = [res.p_ms for res in self.resonators]
+        q_tls0 = [res.qpt_fit_params["Q_TLS0"]["value"] for res in self.resonators]
+        q_tls0_err = [res.qpt_fit_params["Q_TLS0"]["stderr"] for res in self.resonators]
+        fig, _ = plot_qtls0_vs_pms(p_ms, q_tls0, q_tls0_err)
+        fig.savefig(io.BytesIO(), dpi=300)
+        plt.close(fig)
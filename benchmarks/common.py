@@ -0,0 +1,14 @@
+""" """
+
+import os
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+# multiples of the real dataset's trace counts to benchmark, e.g. "1,10,100"
+SCALES = [int(s) for s in os.environ.get("BETATA_BENCH_SCALES", "1,10").split(",")]
+
+# number of traces fitted or plotted per benchmark, independent of scale
+NUM_FIT_TRACES = 100
+NUM_PLOT_TRACES = 10
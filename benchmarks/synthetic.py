@@ -0,0 +1,271 @@
+"""
+Synthetic data generators that write HDF5 fixtures in the exact layouts read by the
+betata loaders, with realistic signal shapes and noise.
+
+Trace counts are given per device and default to those of our real dataset, pass
+`scale` to generate 10x - 100x larger fixtures.
+"""
+
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import h5py
+import numpy as np
+
+from betata.qubit_measurements.qubit import Qubit, save_qubit
+from betata.resonator_studies.resonator import Resonator, save_resonator
+from betata.resonator_studies.trace import Trace, save_traces
+
+# approximate trace counts of the real dataset
+NUM_T1_TRACES = 800
+NUM_T2E_TRACES = 550
+NUM_T2R_TRACES = 700
+NUM_S21_TRACES = 150
+NUM_RESONATORS = 96
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+START_TIME = datetime(2025, 12, 1, 0, 0, 0)
+TRACE_INTERVAL = timedelta(minutes=3)
+
+
+def write_qubit_trace_attrs(file: h5py.File, idx: int, qubit_name: str, pulse: str):
+    """attributes common to T1, T2E and T2R trace files"""
+    file.attrs["id"] = idx
+    file.attrs["qubit_name"] = qubit_name
+    file.attrs["qubit_frequency"] = 4.69e9
+    file.attrs["readout_frequency"] = 7.75e9
+    file.attrs["repetitions"] = 1000
+    file.attrs[f"{pulse}_pulse_amplitude"] = 0.25
+    file.attrs[f"{pulse}_pulse_length"] = 40
+    file.attrs["readout_pulse_amplitude"] = 0.05
+    file.attrs["readout_pulse_length"] = 2000
+    timestamp = START_TIME + idx * TRACE_INTERVAL
+    file.attrs["timestamp"] = timestamp.strftime(TIMESTAMP_FORMAT)
+
+
+def write_t1_traces(
+    folder: Path,
+    qubit_name: str = "Q0_4p69",
+    num_traces: int = NUM_T1_TRACES,
+    num_tau: int = 61,
+    scale: int = 1,
+    seed: int = 0,
+):
+    """files in the layout read by `load_t1_trace`"""
+    rng = np.random.default_rng(seed)
+    folder.mkdir(parents=True, exist_ok=True)
+    tau = np.logspace(-7, np.log10(2e-3), num_tau)
+    for idx in range(num_traces * scale):
+        T1 = rng.normal(250e-6, 40e-6)
+        population = 0.85 * np.exp(-tau / T1) + 0.05 + rng.normal(0, 0.02, num_tau)
+        with h5py.File(folder / f"{qubit_name}_T1_{idx}.h5", "w") as file:
+            write_qubit_trace_attrs(file, idx, qubit_name, "pi")
+            file.create_dataset("tau", data=tau)
+            file.create_dataset("population", data=population)
+
+
+def write_t2e_traces(
+    folder: Path,
+    qubit_name: str = "Q0_4p69",
+    num_traces: int = NUM_T2E_TRACES,
+    num_tau: int = 61,
+    scale: int = 1,
+    seed: int = 0,
+):
+    """files in the layout read by `load_t2e_trace`"""
+    rng = np.random.default_rng(seed)
+    folder.mkdir(parents=True, exist_ok=True)
+    tau = np.logspace(-7, np.log10(1e-3), num_tau)
+    for idx in range(num_traces * scale):
+        T2E = rng.normal(200e-6, 40e-6)
+        population = 0.4 * (1 - np.exp(-tau / T2E)) + 0.05
+        population += rng.normal(0, 0.02, num_tau)
+        with h5py.File(folder / f"{qubit_name}_T2E_{idx}.h5", "w") as file:
+            write_qubit_trace_attrs(file, idx, qubit_name, "pi2")
+            file.create_dataset("tau", data=tau)
+            file.create_dataset("population", data=population)
+
+
+def write_t2r_traces(
+    folder: Path,
+    qubit_name: str = "Q0_4p69",
+    num_traces: int = NUM_T2R_TRACES,
+    num_tau: int = 201,
+    detuning: float = 0.2e6,
+    scale: int = 1,
+    seed: int = 0,
+):
+    """files in the layout read by `load_t2r_trace`"""
+    rng = np.random.default_rng(seed)
+    folder.mkdir(parents=True, exist_ok=True)
+    tau = np.linspace(0, 50e-6, num_tau)
+    for idx in range(num_traces * scale):
+        T2R = rng.normal(30e-6, 5e-6)
+        freq = detuning + rng.normal(0, 5e3)
+        population = 0.45 * np.exp(-tau / T2R) * np.cos(2 * np.pi * freq * tau) + 0.5
+        population += rng.normal(0, 0.02, num_tau)
+        with h5py.File(folder / f"{qubit_name}_T2R_{idx}.h5", "w") as file:
+            write_qubit_trace_attrs(file, idx, qubit_name, "pi2")
+            file.attrs["detuning"] = detuning
+            file.create_dataset("tau", data=tau)
+            file.create_dataset("population", data=population)
+
+
+def write_qubit(filepath: Path, name: str = "Q0_4p69", scale: int = 1, seed: int = 0):
+    """qubit file in the layout read by `load_qubit`, with fitted T1, T2R and T2E series"""
+    rng = np.random.default_rng(seed)
+    qubit = Qubit(
+        name=name,
+        design_name="TATQ01KI-V2",
+        f_q=4.696e9,
+        f_r=7.750e9,
+        chi=-0.258e6,
+        kappa=0.488e6,
+        Ej=14.85e9,
+        Ec=202e6,
+    )
+    for series, num_traces, value in (
+        ("t1", NUM_T1_TRACES, 250e-6),
+        ("t2e", NUM_T2E_TRACES, 200e-6),
+    ):
+        num = num_traces * scale
+        setattr(qubit, series, rng.normal(value, 0.15 * value, num))
+        setattr(qubit, f"{series}_err", rng.normal(0.05 * value, 0.01 * value, num))
+        setattr(qubit, f"{series}_timestamp", np.arange(num) * 180.0)
+        setattr(qubit, f"{series}_trace_id", np.arange(num))
+        setattr(qubit, f"{series}_A", rng.normal(0.85, 0.02, num))
+        setattr(qubit, f"{series}_A_err", rng.normal(0.01, 0.001, num))
+        setattr(qubit, f"{series}_B", rng.normal(0.05, 0.01, num))
+        setattr(qubit, f"{series}_B_err", rng.normal(0.005, 0.001, num))
+        setattr(qubit, f"{series}_avg", np.mean(getattr(qubit, series)))
+        setattr(qubit, f"{series}_avg_err", np.std(getattr(qubit, series)))
+
+    num = NUM_T2R_TRACES * scale
+    qubit.t2r = rng.normal(30e-6, 5e-6, num)
+    qubit.t2r_err = rng.normal(1e-6, 0.2e-6, num)
+    qubit.t2r_timestamp = np.arange(num) * 180.0
+    qubit.t2r_trace_id = np.arange(num)
+    qubit.t2r_offsets = np.arange(num + 1) * 2  # two frequency components per fit
+    qubit.t2r_As = rng.normal(0.45, 0.02, 2 * num)
+    qubit.t2r_A_errs = rng.normal(0.01, 0.001, 2 * num)
+    qubit.t2r_freqs = rng.normal(0.2e6, 5e3, 2 * num)
+    qubit.t2r_freq_errs = rng.normal(1e3, 1e2, 2 * num)
+    qubit.t2r_B = rng.normal(0.5, 0.01, num)
+    qubit.t2r_B_err = rng.normal(0.005, 0.001, num)
+    qubit.t2r_avg, qubit.t2r_avg_err = np.mean(qubit.t2r), np.std(qubit.t2r)
+
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    save_qubit(qubit, filepath)
+    return qubit
+
+
+def s21_hanger(frequency, fr, Ql, absQc, phi, a=1.0, alpha=0.0, tau=0.0):
+    """notch-type (hanger) resonator transmission with cable delay and background"""
+    background = a * np.exp(1j * (alpha + 2 * np.pi * frequency * tau))
+    resonance = (Ql / absQc) * np.exp(1j * phi) / (1 + 2j * Ql * (frequency / fr - 1))
+    return background * (1 - resonance)
+
+
+def get_sweep_points(num_traces: int) -> list[tuple[float, float]]:
+    """(power, temperature) grid of a power-temperature sweep with num_traces points"""
+    powers = np.arange(-20, -100, -10)
+    num_temps = int(np.ceil(num_traces / len(powers)))
+    temperatures = np.linspace(10e-3, 130e-3, num_temps)
+    points = [(p, t) for p in powers for t in temperatures]
+    return points[:num_traces]
+
+
+def write_s21_traces(
+    folder: Path,
+    resonator_name: str = "R0_F0_5p00",
+    num_traces: int = NUM_S21_TRACES,
+    num_freqs: int = 1001,
+    scale: int = 1,
+    seed: int = 0,
+):
+    """files in the layout read by `load_trace`"""
+    rng = np.random.default_rng(seed)
+    folder.mkdir(parents=True, exist_ok=True)
+    fr, Ql, absQc, tau = 5e9, 2e5, 4e5, 50e-9
+    frequency = np.linspace(fr - 5 * fr / Ql, fr + 5 * fr / Ql, num_freqs)
+    for idx, (power, temperature) in enumerate(get_sweep_points(num_traces * scale)):
+        s21 = s21_hanger(frequency, fr, Ql, absQc, 0.1, a=0.02, alpha=0.3, tau=tau)
+        noise = rng.normal(0, 2e-4, num_freqs) + 1j * rng.normal(0, 2e-4, num_freqs)
+        s21 += noise
+        filename = f"{resonator_name}_{power}dBm_{temperature * 1e3:.1f}mK_{idx}.h5"
+        with h5py.File(folder / filename, "w") as file:
+            file.attrs["resonator_name"] = resonator_name
+            file.attrs["power"] = power
+            file.attrs["tau"] = tau
+            file.create_dataset("frequency", data=frequency)
+            file.create_dataset("s21real", data=s21.real)
+            file.create_dataset("s21imag", data=s21.imag)
+            file.create_dataset("temperature", data=rng.normal(temperature, 1e-4, 20))
+
+
+def write_resonators(
+    folder: Path,
+    num_resonators: int = NUM_RESONATORS,
+    num_traces: int = NUM_S21_TRACES,
+    scale: int = 1,
+    seed: int = 0,
+):
+    """files in the layout read by `load_resonator` and `load_fitted_traces`"""
+    rng = np.random.default_rng(seed)
+    folder.mkdir(parents=True, exist_ok=True)
+    pitches = [2e-6, 4e-6, 6e-6, 8e-6, 10e-6, 12e-6, 14e-6, 16e-6]
+    for idx in range(num_resonators * scale):
+        film = idx // len(pitches)
+        name = f"R{idx}_F{film}_5p00"
+        fr_geom = rng.uniform(6e9, 25e9)
+        resonator = Resonator(
+            name=name,
+            type="CPW",
+            design_name="TAHP02KI-200",
+            cooldown_name="2025-09-23_BFD",
+            film_thickness=rng.choice([20e-9, 50e-9, 100e-9, 263e-9, 1000e-9]),
+            pitch=pitches[idx % len(pitches)],
+            length=2700e-6,
+            width=2 * pitches[idx % len(pitches)],
+            fr_geom=fr_geom,
+            l_geom=rng.uniform(1e-9, 3e-9),
+            N_sq=rng.uniform(100, 1000),
+            N_sq_err=1.0,
+            p_ms=rng.uniform(1e-4, 3e-3),
+            p_ma=rng.uniform(1e-4, 1e-3),
+            p_sa=rng.uniform(1e-4, 2e-3),
+            p_sub=0.9,
+            line_attenuation=79.0,
+            qpt_fit_params={"Q_TLS0": {"value": 1e6, "stderr": 1e5, "correl": None}},
+        )
+        filepath = folder / f"{name}.h5"
+        save_resonator(resonator, filepath)
+
+        fr = fr_geom * rng.uniform(0.3, 0.9)
+        traces = []
+        for trace_idx, (power, temp) in enumerate(get_sweep_points(num_traces)):
+            traces.append(
+                Trace(
+                    filename=f"{name}_{power}dBm_{temp * 1e3:.1f}mK_{trace_idx}",
+                    resonator_name=name,
+                    id=trace_idx,
+                    temperature=temp,
+                    temperature_err=1e-4,
+                    power=power,
+                    tau=50e-9,
+                    background_amp=0.02,
+                    background_phase=0.3,
+                    fr=fr * (1 - 1e-6 * temp / 0.13),
+                    fr_err=10.0,
+                    Qi=rng.uniform(1e5, 1e7),
+                    Qi_err=1e4,
+                    Ql=2e5,
+                    Ql_err=1e3,
+                    absQc=4e5,
+                    absQc_err=1e3,
+                    phi=0.1,
+                    phi_err=0.01,
+                    is_excluded=False,
+                )
+            )
+        save_traces(traces, filepath)
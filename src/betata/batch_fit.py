@@ -0,0 +1,100 @@
+"""
+Levenberg-Marquardt least squares fits vectorized over many datasets.
+
+All fits advance together, one batched linear solve per iteration, and fits drop out of
+later iterations as they converge. The model function must broadcast parameters of
+shape (..., 1) against x, so fitting a thousand datasets costs about as much Python as
+fitting one.
+"""
+
+from typing import Callable
+
+import numpy as np
+
+NUM_ITER = 50
+
+
+def fit_batch(
+    fit_fn: Callable,
+    x: np.ndarray,
+    y: np.ndarray,
+    p0: np.ndarray,
+    lower: np.ndarray = None,
+    upper: np.ndarray = None,
+    num_iter: int = NUM_ITER,
+    tol: float = 1e-8,
+) -> np.ndarray:
+    """
+    least squares fits of fit_fn(x, *params) to the datasets y of shape (..., n), all at
+    once. p0 has shape (..., num_params) and fit_fn must broadcast parameters of shape
+    (..., 1) against x. Iterations stop once every fit's relative step or cost reduction
+    is below tol. Fits that end with a non-finite cost are NaN.
+    """
+    x, y = np.broadcast_arrays(x, y)
+    shape = y.shape[:-1]
+    num_params = np.shape(p0)[-1]
+    # fits are flattened so that converged ones can be dropped from later iterations
+    x, y = x.reshape(-1, x.shape[-1]), y.reshape(-1, y.shape[-1])
+    p = np.array(np.broadcast_to(p0, (*shape, num_params)), dtype=float)
+    p = p.reshape(-1, num_params)
+    lower = np.full(num_params, -np.inf) if lower is None else np.asarray(lower)
+    upper = np.full(num_params, np.inf) if upper is None else np.asarray(upper)
+
+    def get_residuals(x, y, p):
+        """ """
+        return y - fit_fn(x, *p.T[..., None])
+
+    def get_jacobian(x, y, p, residuals):
+        """forward differences, of shape (num_fits, n, num_params)"""
+        # absolute floor, so that parameters at 0 still get a finite step
+        step = 1e-7 * (np.abs(p) + 1e-7)
+        jacobian = np.empty((*residuals.shape, num_params))
+        for k in range(num_params):
+            p_step = p.copy()
+            p_step[:, k] += step[:, k]
+            jacobian[..., k] = residuals - get_residuals(x, y, p_step)
+            jacobian[..., k] /= step[:, k, None]
+        return jacobian
+
+    residuals = get_residuals(x, y, p)
+    cost = np.sum(residuals**2, axis=-1)
+    damping = np.full(cost.shape, 1e-3)
+    active = np.flatnonzero(np.isfinite(cost))
+    for _ in range(num_iter):
+        if len(active) == 0:
+            break
+        x_a, y_a, p_a = x[active], y[active], p[active]
+        residuals_a, cost_a, damping_a = (
+            residuals[active],
+            cost[active],
+            damping[active],
+        )
+
+        jacobian = get_jacobian(x_a, y_a, p_a, residuals_a)
+        jacobian_t = np.swapaxes(jacobian, -1, -2)
+        jtj = jacobian_t @ jacobian
+        gradient = (jacobian_t @ residuals_a[..., None])[..., 0]
+        diagonal = np.einsum("...ii->...i", jtj)
+        # floor keeps parameters that don't affect the data from making lhs singular
+        diagonal = np.maximum(
+            diagonal, 1e-12 * np.max(diagonal, axis=-1, keepdims=True)
+        )
+        lhs = jtj + (damping_a[:, None] * diagonal)[..., None] * np.eye(num_params)
+        step = np.linalg.solve(lhs, gradient[..., None])[..., 0]
+
+        p_new = np.clip(p_a + step, lower, upper)
+        residuals_new = get_residuals(x_a, y_a, p_new)
+        cost_new = np.sum(residuals_new**2, axis=-1)
+        is_better = cost_new < cost_a
+        p[active] = np.where(is_better[:, None], p_new, p_a)
+        residuals[active] = np.where(is_better[:, None], residuals_new, residuals_a)
+        cost[active] = np.where(is_better, cost_new, cost_a)
+        damping[active] = np.where(is_better, damping_a / 3, damping_a * 3)
+
+        # converged once the step or the cost reduction it brings is negligible
+        is_small_step = np.all(np.abs(p_new - p_a) <= tol * np.abs(p_a), axis=-1)
+        is_converged = is_small_step | (is_better & (cost_a - cost_new <= tol * cost_a))
+        active = active[~is_converged & np.isfinite(cost[active])]
+
+    p[~np.isfinite(cost)] = np.nan
+    return p.reshape(*shape, num_params)
@@ -0,0 +1,236 @@
+"""
+Bootstrap and jackknife confidence intervals of fitted parameters.
+
+Replicate datasets are made either by resampling the residuals of the best fit (the
+default, which keeps the x grid fixed as in a repeated measurement) or by resampling the
+(x, y) points, and each replicate is refitted. Models whose function broadcasts over
+arrays are refitted all at once by `betata.batch_fit.fit_batch`, vectorized over
+replicates (and over datasets, e.g. all traces of a qubit). Any other fit, such as
+an lmfit model with constraints, is refitted replicate by replicate across a process
+pool. Percentile intervals are attached to lmfit results in the format of `ci_out`.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+import copy
+import os
+from typing import Callable
+
+import lmfit
+import numpy as np
+from scipy import stats
+
+from betata.batch_fit import fit_batch
+from betata.profiling import instrument
+
+NUM_REPLICATES = 200
+LEVEL = 0.6827  # one standard deviation of a normal distribution
+CHUNK_SIZE = 16  # replicates per process pool task
+
+
+@dataclass
+class BootstrapResult:
+    """ """
+
+    names: list[str]
+    estimate: np.ndarray  # (..., num_params), best fit to the original data
+    replicates: np.ndarray  # (..., num_replicates, num_params), NaN for failed refits
+    method: str  # "residuals", "points" or "jackknife"
+    level: float = LEVEL
+
+    @property
+    def interval(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        percentile interval at level for bootstrap replicates, and the normal interval
+        from the jackknife standard error for jackknife replicates
+        """
+        if self.method == "jackknife":
+            z = stats.norm.ppf((1 + self.level) / 2)
+            return self.estimate - z * self.stderr, self.estimate + z * self.stderr
+        tail = 100 * (1 - self.level) / 2
+        low, high = np.nanpercentile(self.replicates, [tail, 100 - tail], axis=-2)
+        return low, high
+
+    @property
+    def stderr(self) -> np.ndarray:
+        """ """
+        if self.method == "jackknife":
+            num = np.sum(np.isfinite(self.replicates[..., 0]), axis=-1)[..., None]
+            deviation = (
+                self.replicates - np.nanmean(self.replicates, axis=-2)[..., None, :]
+            )
+            return np.sqrt((num - 1) / num * np.nansum(deviation**2, axis=-2))
+        return np.nanstd(self.replicates, axis=-2, ddof=1)
+
+    def get_interval(self, name: str) -> tuple[np.ndarray, np.ndarray]:
+        """ """
+        idx = self.names.index(name)
+        low, high = self.interval
+        return low[..., idx], high[..., idx]
+
+    def __getitem__(self, idx) -> "BootstrapResult":
+        """result of the idx-th dataset of a batched bootstrap"""
+        return BootstrapResult(
+            self.names,
+            self.estimate[idx],
+            self.replicates[idx],
+            self.method,
+            self.level,
+        )
+
+
+def resample_residuals(
+    best_fit: np.ndarray, residuals: np.ndarray, num_replicates: int, rng
+) -> np.ndarray:
+    """
+    replicate data best_fit + resampled residuals, with residuals of shape (..., n)
+    giving replicates of shape (..., num_replicates, n)
+    """
+    n = residuals.shape[-1]
+    idx = rng.integers(0, n, size=(*residuals.shape[:-1], num_replicates, n))
+    resampled = np.take_along_axis(residuals[..., None, :], idx, axis=-1)
+    return best_fit[..., None, :] + resampled
+
+
+def resample_points(shape: tuple, num_replicates: int, rng) -> np.ndarray:
+    """indices of (x, y) points of datasets of shape (..., n) drawn with replacement"""
+    n = shape[-1]
+    return rng.integers(0, n, size=(*shape[:-1], num_replicates, n))
+
+
+def get_jackknife_indices(n: int) -> np.ndarray:
+    """(n, n - 1) indices that leave each point out once"""
+    idx = np.arange(n - 1)[None, :]
+    return idx + (idx >= np.arange(n)[:, None])
+
+
+@instrument
+def bootstrap_batch(
+    fit_fn: Callable,
+    x: np.ndarray,
+    y: np.ndarray,
+    estimate: np.ndarray,
+    names: list[str],
+    method: str = "residuals",
+    num_replicates: int = NUM_REPLICATES,
+    level: float = LEVEL,
+    lower: np.ndarray = None,
+    upper: np.ndarray = None,
+    seed: int = None,
+) -> BootstrapResult:
+    """
+    bootstrap (or jackknife) of the fits of fit_fn to datasets (x, y) of shape (..., n),
+    whose best fit parameters estimate have shape (..., num_params). Replicates are
+    refitted with fit_batch starting from the best fit.
+    """
+    x, y = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+    estimate = np.asarray(estimate, dtype=float)
+    rng = np.random.default_rng(seed)
+
+    if method == "residuals":
+        best_fit = fit_fn(x, *np.moveaxis(estimate[..., None], -2, 0))
+        residuals = y - best_fit
+        n, num_params = y.shape[-1], estimate.shape[-1]
+        # undo the shrinkage of the residuals by the fit
+        residuals *= np.sqrt(n / max(n - num_params, 1))
+        y_rep = resample_residuals(best_fit, residuals, num_replicates, rng)
+        x_rep = np.broadcast_to(x[..., None, :], y_rep.shape)
+    elif method in ("points", "jackknife"):
+        if method == "points":
+            idx = resample_points(y.shape, num_replicates, rng)
+        else:
+            idx = np.broadcast_to(
+                get_jackknife_indices(y.shape[-1]),
+                (*y.shape[:-1], y.shape[-1], y.shape[-1] - 1),
+            )
+        x_rep = np.take_along_axis(x[..., None, :], idx, axis=-1)
+        y_rep = np.take_along_axis(y[..., None, :], idx, axis=-1)
+    else:
+        raise ValueError(f"Unknown bootstrap method {method}.")
+
+    replicates = fit_batch(
+        fit_fn, x_rep, y_rep, estimate[..., None, :], lower=lower, upper=upper
+    )
+    return BootstrapResult(names, estimate, replicates, method, level)
+
+
+def refit_model_result(
+    result: lmfit.model.ModelResult, x: np.ndarray, y_reps: np.ndarray
+) -> np.ndarray:
+    """
+    best values of result's model and parameters refitted to each row of y_reps, with the
+    result's fitting method
+    """
+    values = np.full((len(y_reps), len(result.var_names)), np.nan)
+    for idx, y in enumerate(y_reps):
+        params = copy.deepcopy(result.params)
+        try:
+            fit = result.model.fit(
+                y, params=params, x=x, weights=result.weights, method=result.method
+            )
+        except Exception:
+            continue
+        values[idx] = [fit.params[name].value for name in result.var_names]
+    return values
+
+
+@instrument
+def bootstrap_model_result(
+    result: lmfit.model.ModelResult,
+    method: str = "residuals",
+    num_replicates: int = NUM_REPLICATES,
+    level: float = LEVEL,
+    jobs: int = None,
+    seed: int = None,
+) -> BootstrapResult:
+    """
+    bootstrap of an lmfit fit of a model with a single independent variable x, refitting
+    each replicate with the result's own model, parameters and constraints across a
+    process pool of jobs workers (all cpus if None, in this process if 1)
+    """
+    x = np.asarray(result.userkws["x"], dtype=float)
+    y = np.asarray(result.data, dtype=float)
+    rng = np.random.default_rng(seed)
+    if method != "residuals":
+        raise ValueError("Only residual resampling keeps x fixed for lmfit refits.")
+
+    # weighted residuals are exchangeable, so they are resampled and then unweighted
+    weights = np.ones_like(y) if result.weights is None else np.asarray(result.weights)
+    residuals = (y - result.best_fit) * weights * np.sqrt(len(y) / max(result.nfree, 1))
+    y_reps = resample_residuals(np.zeros_like(y), residuals, num_replicates, rng)
+    y_reps = result.best_fit + y_reps / weights
+
+    chunks = np.array_split(y_reps, max(num_replicates // CHUNK_SIZE, 1))
+    jobs = os.cpu_count() if jobs is None else jobs
+    if jobs == 1:
+        values = [refit_model_result(result, x, chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [
+                executor.submit(refit_model_result, result, x, chunk)
+                for chunk in chunks
+            ]
+            values = [future.result() for future in futures]
+
+    estimate = np.array([result.params[name].value for name in result.var_names])
+    return BootstrapResult(
+        list(result.var_names), estimate, np.concatenate(values), method, level
+    )
+
+
+def attach_intervals(result, bootstrap: BootstrapResult):
+    """
+    store the intervals on a fit result as result.ci_out, in the format of lmfit's
+    conf_interval: {name: [(level, low), (0, best), (level, high)]}
+    """
+    low, high = bootstrap.interval
+    result.ci_out = {
+        name: [
+            (bootstrap.level, float(low[idx])),
+            (0.0, float(bootstrap.estimate[idx])),
+            (bootstrap.level, float(high[idx])),
+        ]
+        for idx, name in enumerate(bootstrap.names)
+    }
+    result.bootstrap = bootstrap
+    return result
@@ -0,0 +1,50 @@
+"""
+Composite paper figures drawn in one pass into subfigures of a single parent figure.
+
+Each panel is a function that draws into the matplotlib SubFigure it is given, usually
+by passing `subfig.subplots()` as the `ax` of a panel's plot function, so composites are
+rendered once, in vector form, instead of re-reading and resampling the PNGs of their
+panels. Panels are laid out in rows, each row a subfigure split into one subfigure per
+panel.
+"""
+
+from typing import Callable
+
+from matplotlib.figure import Figure, SubFigure
+
+from betata import plt
+from betata.profiling import instrument
+
+LABEL_SIZE = 16
+
+
+@instrument
+def compose_figure(
+    rows: list[list[Callable[[SubFigure], object]]],
+    figsize: tuple[float, float],
+    labels: list[list[str]] = None,
+    width_ratios: list[tuple[float, ...]] = None,
+    height_ratios: tuple[float, ...] = None,
+    label_size: float = LABEL_SIZE,
+) -> Figure:
+    """
+    figure with a row of subfigures per row of panels, with labels[i][j] placed above
+    the upper left corner of the subfigure of panel j in row i
+    """
+    fig = plt.figure(figsize=figsize, layout="constrained")
+    row_subfigs = fig.subfigures(
+        len(rows), 1, height_ratios=height_ratios, squeeze=False
+    )
+
+    for idx, (row_subfig, panels) in enumerate(zip(row_subfigs[:, 0], rows)):
+        ratios = None if width_ratios is None else width_ratios[idx]
+        subfigs = row_subfig.subfigures(
+            1, len(panels), width_ratios=ratios, squeeze=False
+        )
+        for jdx, (subfig, panel) in enumerate(zip(subfigs[0], panels)):
+            panel(subfig)
+            # a suptitle, so that constrained layout makes room for the label
+            if labels is not None:
+                subfig.suptitle(labels[idx][jdx], x=0, ha="left", size=label_size)
+
+    return fig
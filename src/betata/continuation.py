@@ -0,0 +1,209 @@
+"""
+Continuation (warm-start) fitting across neighboring sweep points.
+
+Each trace is fitted starting from the converged parameters of its nearest already-fitted
+neighbor: the previous trace in time for qubit traces, which are ordered by id, and the
+previous temperature at the same power for resonator traces, which are ordered by
+`sort_traces_pt`. A warm fit that fails, or whose reduced chi-square is more than
+DIVERGENCE_RATIO times that of its neighbor, is refitted from the usual cold guess and the
+better of the two fits is kept. Warm starts only seed the values of the parameters a fit
+shares with its neighbor (`seed_params`), so T2R fits still detect their frequency
+components from each trace's own FFT.
+"""
+
+import copy
+from collections import defaultdict
+from dataclasses import dataclass
+
+import lmfit
+import numpy as np
+
+from betata.profiling import instrument
+from betata.resonator_studies.fit_s21_traces.fit_s21_traces import (
+    HangerFitResult,
+    empty_result,
+    fit_traces,
+    set_fitted_params,
+    set_result,
+)
+from betata.resonator_studies.trace import Trace
+
+DIVERGENCE_RATIO = 2.0
+
+
+@dataclass
+class ContinuationReport:
+    """ """
+
+    num_traces: int = 0
+    num_warm: int = 0  # fits seeded from a neighbor
+    # warm fits that diverged and were refitted from the cold guess
+    num_fallbacks: int = 0
+    nfev: int = 0  # model evaluations of all fits, including the fallbacks
+
+    def __str__(self):
+        """ """
+        return (
+            f"{self.num_warm}/{self.num_traces} fits warm-started, "
+            f"{self.num_fallbacks} fell back to the cold guess, {self.nfev} nfev"
+        )
+
+
+def seed_params(params: lmfit.Parameters, warm_start: lmfit.Parameters):
+    """
+    set the values of params to those of the parameters of warm_start with the same name,
+    clipped to the bounds of params. Other parameters keep their values.
+    """
+    for name, param in params.items():
+        if name in warm_start:
+            param.value = np.clip(warm_start[name].value, param.min, param.max)
+    return params
+
+
+def has_diverged(result: lmfit.model.ModelResult, neighbor_result: lmfit.model.ModelResult):
+    """ """
+    if not result.success or not np.isfinite(result.redchi):
+        return True
+    return result.redchi > DIVERGENCE_RATIO * neighbor_result.redchi
+
+
+def fit_warm(trace, fit_fn, neighbor_result: lmfit.model.ModelResult, fit_kwargs: dict):
+    """
+    fit the trace seeded from the neighbor's fit, falling back to the cold guess if the fit
+    diverges. Returns the kept result, the model evaluations of all fits run, and whether
+    the cold guess was tried.
+    """
+    warm_result = fit_fn(trace, warm_start=neighbor_result.params, **fit_kwargs)
+    if warm_result is None:  # fit_fn skipped the trace
+        return None, 0, False
+    if not has_diverged(warm_result, neighbor_result):
+        return warm_result, warm_result.nfev, False
+
+    warm_trace = copy.copy(trace)  # holds the values of the warm fit
+    cold_result = fit_fn(trace, **{**fit_kwargs, "plot": False})
+    nfev = warm_result.nfev + cold_result.nfev
+    if warm_result.chisqr <= cold_result.chisqr:
+        trace.__dict__.update(warm_trace.__dict__)
+        return warm_result, nfev, True
+
+    if fit_kwargs.get("plot", True):  # the fallback fit was not plotted
+        cold_result = fit_fn(trace, params=cold_result.params, **fit_kwargs)
+        nfev += cold_result.nfev
+    return cold_result, nfev, True
+
+
+@instrument
+def fit_qubit_traces_continued(
+    traces: list,
+    fit_fn,
+    **fit_kwargs,
+) -> tuple[list[lmfit.model.ModelResult], ContinuationReport]:
+    """
+    Fit time-ordered qubit traces with fit_fn, e.g. fit_t1_trace, each one seeded from the
+    fit of the previous trace. fit_kwargs are passed to fit_fn, which takes the neighbor's
+    params as warm_start.
+    """
+    report = ContinuationReport(num_traces=len(traces))
+    results = []
+    neighbor_result = None
+
+    for trace in traces:
+        if neighbor_result is None:
+            result = fit_fn(trace, **fit_kwargs)
+            nfev = 0 if result is None else result.nfev
+        else:
+            result, nfev, is_fallback = fit_warm(trace, fit_fn, neighbor_result, fit_kwargs)
+            report.num_warm += 1
+            report.num_fallbacks += is_fallback
+
+        report.nfev += nfev
+        results.append(result)
+        if result is not None:
+            neighbor_result = result
+
+    return results, report
+
+
+def get_temperature_rounds(traces: list[Trace]):
+    """
+    indices of the traces at each power sorted by temperature (key = power), and the
+    indices grouped in rounds, where round k holds the k-th lowest temperature of each power
+    """
+    idxs_by_power = defaultdict(list)
+    for idx, trace in enumerate(traces):
+        idxs_by_power[trace.power].append(idx)
+
+    for idxs in idxs_by_power.values():
+        idxs.sort(key=lambda idx: traces[idx].temperature)
+
+    num_rounds = max(len(idxs) for idxs in idxs_by_power.values())
+    rounds = []
+    for rank in range(num_rounds):
+        rounds.append([idxs[rank] for idxs in idxs_by_power.values() if len(idxs) > rank])
+    return idxs_by_power, rounds
+
+
+@instrument
+def fit_s21_continued(
+    traces: list[Trace],
+) -> tuple[HangerFitResult, ContinuationReport]:
+    """
+    Batched hanger fits in rounds of increasing temperature. The lowest temperature trace
+    at each power is fitted from the cold guess, and each later round fits the next
+    temperature at all powers at once, seeded from the previous temperature at the same
+    power. Fitted values are stored on the traces as done by `fit_s21_batch`.
+    """
+    num_traces = len(traces)
+    report = ContinuationReport(num_traces=num_traces)
+    result = empty_result(num_traces)
+    idxs_by_power, rounds = get_temperature_rounds(traces)
+
+    # key = trace index, value = index of the neighbor its fit is seeded from
+    neighbors = {}
+    for idxs in idxs_by_power.values():
+        neighbors.update(zip(idxs[1:], idxs[:-1]))
+
+    for idxs in rounds:
+        idxs = np.array(idxs)
+        round_traces = [traces[idx] for idx in idxs]
+        is_warm = np.array([idx in neighbors for idx in idxs])
+        if not is_warm.any():
+            set_result(result, idxs, fit_traces(round_traces))
+            continue
+
+        neighbor_idxs = np.array([neighbors.get(idx, idx) for idx in idxs])
+        # failed neighbors give no seed, those traces are fitted from the cold guess
+        is_seeded = is_warm & result.success[neighbor_idxs]
+        seeds = np.where(is_seeded[:, None], result.params[neighbor_idxs], np.nan)
+        round_result = fit_traces(round_traces, seeds)
+        report.num_warm += int(np.sum(is_seeded))
+
+        neighbor_redchi = result.redchi[neighbor_idxs]
+        has_diverged = is_seeded & (
+            ~round_result.success
+            | (round_result.redchi > DIVERGENCE_RATIO * neighbor_redchi)
+        )
+        if has_diverged.any():
+            diverged_idxs = np.flatnonzero(has_diverged)
+            cold_result = fit_traces([round_traces[idx] for idx in diverged_idxs])
+            report.num_fallbacks += len(diverged_idxs)
+
+            # both fits were run, keep the better one
+            nfevs = round_result.nfevs[diverged_idxs] + cold_result.nfevs
+            is_cold_better = cold_result.success & (
+                ~round_result.success[diverged_idxs]
+                | (cold_result.chisqr < round_result.chisqr[diverged_idxs])
+            )
+            set_result(
+                round_result,
+                diverged_idxs[is_cold_better],
+                cold_result,
+                is_cold_better,
+            )
+            round_result.nfevs[diverged_idxs] = nfevs
+
+        set_result(result, idxs, round_result)
+
+    report.nfev = result.nfev
+    set_fitted_params(traces, result)
+    return result, report
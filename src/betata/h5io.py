@@ -0,0 +1,43 @@
+"""
+Concurrency-safe writes of the HDF5 output files.
+
+Loaders open the output files read-only, so any number of notebooks, live monitors, figure
+scripts and pipeline workers can read the same file at once. Writers never modify a file
+in place. Instead, the file is copied next to itself, the copy is updated, and the copy
+is then atomically renamed over the original. Readers therefore see either the previous
+or the new complete file, never a partial write. Concurrent writers of the same file are
+not merged, the last one to finish wins.
+"""
+
+from contextlib import contextmanager
+import os
+from pathlib import Path
+import shutil
+import uuid
+
+import h5py
+
+TEMP_SUFFIX = ".tmp"  # not an HDF5 suffix, so loaders skip files still being written
+
+
+@contextmanager
+def atomic_write(filepath: Path):
+    """
+    yield an h5py file holding the current contents of filepath (empty if it does not
+    exist yet), which replaces filepath on exit unless an exception was raised
+    """
+    filepath = Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    temp_filepath = filepath.with_name(f".{filepath.name}.{uuid.uuid4().hex}{TEMP_SUFFIX}")
+
+    try:
+        if filepath.exists():
+            shutil.copy2(filepath, temp_filepath)
+            mode = "a"
+        else:
+            mode = "w"
+        with h5py.File(temp_filepath, mode) as file:
+            yield file
+        os.replace(temp_filepath, filepath)
+    finally:
+        temp_filepath.unlink(missing_ok=True)
@@ -0,0 +1,578 @@
+"""
+Incremental pipeline runner that replaces the per-device notebooks.
+
+Each device (resonator or qubit) is described by one TOML file in `devices/` holding its
+metadata, trace exclusions and fit bounds. The stages of a device form a DAG:
+
+    resonator: metadata, fit_s21 -> kinetic_inductance (+ metadata), qpt -> ffs
+    qubit:     metadata, t1, t2e, t2r -> tphi
+
+A stage is stale when its config section, its input data files or the fingerprint of an
+upstream stage have changed since it last ran, or when the device output file is missing.
+Only stale stages are run. Stages of one device run in order since they share the output
+file, and independent devices run in parallel across processes.
+
+    python -m betata.pipeline                      # rebuild everything that is stale
+    python -m betata.pipeline R12_F2_5p55 Q6_4p69  # selected devices only
+    python -m betata.pipeline --stages qpt ffs --force
+    python -m betata.pipeline --dry-run            # list stale stages without running them
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field, replace
+import hashlib
+import json
+import os
+from pathlib import Path
+import tomllib
+import traceback
+from typing import Callable
+
+from lmfit import Parameters
+import numpy as np
+import pandas as pd
+from rrfit.ffs import fitIterated_FFS_gammaFixed
+from rrfit.hangerfit import fit_s21_v2
+from rrfit.waterfall import Fit_QIntVsTemp, fitIterated
+
+from betata import plt
+from betata.bootstrap import NUM_REPLICATES
+from betata.continuation import fit_qubit_traces_continued, fit_s21_continued
+from betata.profiling import instrument
+from betata.qubit_measurements import qubit as qubit_module
+from betata.qubit_measurements.dephasing import TOLERANCE, add_tphi
+from betata.qubit_measurements.fit_t1_traces.fit_t1_traces import (
+    bootstrap_t1_traces,
+    fit_t1_trace,
+)
+from betata.qubit_measurements.fit_t2e_traces.fit_t2e_traces import fit_t2e_trace
+from betata.qubit_measurements.fit_t2r_traces.fit_t2r_traces import fit_t2r_trace
+from betata.qubit_measurements.qubit import Qubit, load_qubit, save_qubit
+from betata.qubit_measurements.traces import (
+    load_t1_traces,
+    load_t2e_traces,
+    load_t2r_traces,
+    save_t1_results,
+    save_t2e_results,
+    save_t2r_results,
+)
+from betata.resonator_studies import resonator as resonator_module
+from betata.resonator_studies.ffs import PARAM_NAMES, fit_ffs
+from betata.resonator_studies.fit_s21_traces.fit_s21_traces import fit_s21_batch
+from betata.resonator_studies.kinetic_inductance.alpha_bare_fr_lkin import (
+    find_kinetic_inductance,
+)
+from betata.resonator_studies.resonator import (
+    SPR_SIM_FILEPATH,
+    Resonator,
+    add_ffs_fit_params,
+    add_metadata,
+    add_qpt_fit_params,
+    load_resonator,
+    save_resonator,
+)
+from betata.resonator_studies.trace import (
+    Trace,
+    load_fitted_traces,
+    load_traces,
+    save_traces,
+)
+
+CONFIG_FOLDER = Path(__file__).parent / "devices"
+STATE_FOLDER = Path(__file__).parents[2] / "out/pipeline"
+
+
+@dataclass
+class DeviceConfig:
+    """ """
+
+    name: str
+    kind: str  # "resonator" or "qubit"
+    filepath: Path
+    sections: dict = field(default_factory=dict)  # key = stage name
+
+    def section(self, stage_name: str) -> dict:
+        """ """
+        return self.sections.get(stage_name, {})
+
+    @property
+    def data_folder(self) -> Path:
+        """ """
+        if self.kind == "resonator":
+            return resonator_module.DATA_FOLDER / self.name
+        return qubit_module.DATA_FOLDER / self.name
+
+    @property
+    def output_file(self) -> Path:
+        """ """
+        if self.kind == "resonator":
+            return resonator_module.OUTPUT_FOLDER / f"{self.name}.h5"
+        return qubit_module.OUTPUT_FOLDER / f"{self.name}.h5"
+
+
+@dataclass
+class Stage:
+    """ """
+
+    name: str
+    run: Callable[[DeviceConfig], None]
+    depends_on: tuple[str, ...] = ()
+    # data files read by the stage, besides the device output file
+    inputs: Callable[[DeviceConfig], list[Path]] = lambda config: []
+
+
+def load_config(filepath: Path) -> DeviceConfig:
+    """ """
+    with open(filepath, "rb") as file:
+        sections = tomllib.load(file)
+    device = sections.pop("device")
+    return DeviceConfig(device["name"], device["kind"], Path(filepath), sections)
+
+
+def load_configs(folder: Path = CONFIG_FOLDER) -> list[DeviceConfig]:
+    """ """
+    return [load_config(filepath) for filepath in sorted(folder.glob("*.toml"))]
+
+
+def list_files(folder: Path) -> list[Path]:
+    """all files under the folder, missing folders have no files"""
+    if not folder.exists():
+        return []
+    return sorted(path for path in folder.rglob("*") if path.is_file())
+
+
+def get_fingerprint(stage: Stage, config: DeviceConfig, upstream: list[str]) -> str:
+    """hash of the stage config section, input file stats and upstream fingerprints"""
+    input_stats = []
+    for path in stage.inputs(config):
+        stat = path.stat()
+        input_stats.append((str(path), stat.st_size, stat.st_mtime_ns))
+    content = {
+        "config": config.section(stage.name),
+        "inputs": input_stats,
+        "upstream": upstream,
+    }
+    content_str = json.dumps(content, sort_keys=True, default=str)
+    return hashlib.sha256(content_str.encode()).hexdigest()
+
+
+def load_state(device_name: str) -> dict[str, str]:
+    """key = stage name, value = fingerprint of the last successful run"""
+    state_file = STATE_FOLDER / f"{device_name}.json"
+    if not state_file.exists():
+        return {}
+    with open(state_file) as file:
+        return json.load(file)
+
+
+def save_state(device_name: str, state: dict[str, str]):
+    """ """
+    STATE_FOLDER.mkdir(parents=True, exist_ok=True)
+    with open(STATE_FOLDER / f"{device_name}.json", "w") as file:
+        json.dump(state, file, indent=4)
+
+
+def apply_trace_exclusions(traces: list[Trace], section: dict):
+    """exclusions are added to those already stored, "include" overrides all of them"""
+    exclude = set(section.get("exclude", []))
+    include = set(section.get("include", []))
+    exclude_before = section.get("exclude_before")  # ISO date, e.g. "2025-08-10"
+    exclude_nan_temperature = section.get("exclude_nan_temperature", False)
+
+    for trace in traces:
+        if trace.id in exclude:
+            trace.is_excluded = True
+        # filenames start with the measurement date
+        if exclude_before is not None and trace.filename.split("_")[0] < exclude_before:
+            trace.is_excluded = True
+        if exclude_nan_temperature and np.isnan(trace.temperature):
+            trace.is_excluded = True
+        if trace.id in include:
+            trace.is_excluded = False
+
+
+def resolve_value(value, resonator: Resonator) -> float:
+    """
+    numbers are returned as is, strings refer to resonator attributes:
+    "alpha_bare", "fr_ref" (fr of the first trace), "qpt.<param>" and "qpt.<param>.stderr"
+    """
+    if not isinstance(value, str):
+        return value
+    if value == "fr_ref":
+        return resonator.traces[0].fr
+    if value.startswith("qpt."):
+        _, param_name, *key = value.split(".")
+        return resonator.qpt_fit_params[param_name][key[0] if key else "value"]
+    return getattr(resonator, value)
+
+
+def make_params(init_params: dict, resonator: Resonator) -> Parameters:
+    """ """
+    params = Parameters()
+    for name, spec in init_params.items():
+        spec = {key: resolve_value(value, resonator) for key, value in spec.items()}
+        params.add(name, **spec)
+    return params
+
+
+def make_bounds(bounds: dict, resonator: Resonator) -> dict[str, tuple[float, float]]:
+    """
+    each bound is either [min, max] or {around = "qpt.<param>", stderrs = n}, which spans
+    the previous fit value of the parameter +/- n standard errors
+    """
+    bounds_dict = {}
+    for name, spec in bounds.items():
+        if isinstance(spec, dict):
+            center = resolve_value(spec["around"], resonator)
+            width = spec["stderrs"] * resolve_value(f"{spec['around']}.stderr", resonator)
+            bounds_dict[name] = (center - width, center + width)
+        else:
+            bounds_dict[name] = tuple(resolve_value(v, resonator) for v in spec)
+    return bounds_dict
+
+
+@instrument
+def run_resonator_metadata(config: DeviceConfig):
+    """existing fit results are kept, only the metadata attributes are replaced"""
+    metadata = config.section("metadata")
+    if config.output_file.exists():
+        resonator = replace(load_resonator(config.output_file), **metadata)
+    else:
+        resonator = Resonator(name=config.name, **metadata)
+    (resonator,) = add_metadata([resonator])
+    save_resonator(resonator, config.output_file)
+
+
+@instrument
+def run_fit_s21(config: DeviceConfig):
+    """
+    method "rrfit" (default) fits the traces one at a time with rrfit's fit_s21_v2 as done
+    in the *_traces notebooks, "batch" fits all of them at once with betata's hanger fitter
+    """
+    section = config.section("fit_s21")
+    exclude = set(section.get("exclude", []))
+    traces = load_traces(config.data_folder)
+
+    if section.get("method", "rrfit") == "batch":
+        if section.get("continuation", False):
+            result, report = fit_s21_continued(traces)
+            print(f"{config.name} fit_s21: {report}")
+        else:
+            result = fit_s21_batch(traces)
+        for trace, success in zip(traces, result.success):
+            trace.is_excluded = trace.id in exclude or not success
+        save_traces(traces, config.output_file)
+        return
+
+    for trace in traces:
+        plot_title = (
+            f"Device {trace.resonator_name}, Trace #{trace.id}, Power {trace.power} dBm, "
+            f"Temp {trace.temperature * 1e3:.1f}mK"
+        )
+        try:
+            fit_s21_v2(trace, plot_title=plot_title)
+            trace.is_excluded = trace.id in exclude
+        except ValueError as err:
+            print(f"Fit failed: {plot_title} due to {err}")
+            trace.is_excluded = True
+        plt.close("all")
+
+    save_traces(traces, config.output_file)
+
+
+@instrument
+def run_kinetic_inductance(config: DeviceConfig):
+    """ """
+    resonator = load_resonator(config.output_file)
+    traces = load_fitted_traces(config.output_file)
+    trace_table = pd.DataFrame(
+        {
+            "resonator_name": resonator.name,
+            "power": [trace.power for trace in traces],
+            "temperature": [trace.temperature for trace in traces],
+            "fr": [trace.fr for trace in traces],
+            "is_excluded": [bool(trace.is_excluded) for trace in traces],
+        }
+    )
+    (resonator,) = find_kinetic_inductance([resonator], trace_table)
+    save_resonator(resonator, config.output_file)
+
+
+@instrument
+def run_qpt(config: DeviceConfig):
+    """ """
+    section = config.section("qpt")
+    resonator = load_resonator(config.output_file)
+    resonator.traces = load_fitted_traces(config.output_file)
+    apply_trace_exclusions(resonator.traces, section)
+
+    fitIterated(
+        resonator,
+        make_bounds(section["bounds"], resonator),
+        numIter=section.get("num_iter", 100),
+        retries=section.get("retries", 25),
+        init_params=make_params(section["init_params"], resonator),
+    )
+    fit_params, _, _ = Fit_QIntVsTemp(resonator, resonator.best_params, consistent=True)
+    plt.close("all")
+
+    add_qpt_fit_params(resonator, fit_params)
+    resonator.qpt_fit_trace_ids = [tr.id for tr in resonator.traces if not tr.is_excluded]
+    save_resonator(resonator, config.output_file)
+
+
+@instrument
+def run_ffs(config: DeviceConfig):
+    """
+    method "rrfit" fits with rrfit's fitIterated_FFS_gammaFixed as done in the
+    *_ffs_temp_sweep notebooks, "model" with betata's vectorized FFS model
+    """
+    section = config.section("ffs")
+    is_model = section.get("method", "rrfit") == "model"
+    missing = [name for name in PARAM_NAMES if name not in section.get("init_params", {})]
+    if is_model and missing:
+        raise ValueError(
+            f"{config.name} [ffs.init_params] is missing {', '.join(missing)}, "
+            f"the FFS model needs all of {', '.join(PARAM_NAMES)}."
+        )
+
+    resonator = load_resonator(config.output_file)
+    resonator.traces = load_fitted_traces(config.output_file)
+    apply_trace_exclusions(resonator.traces, section)
+    bounds = make_bounds(section["bounds"], resonator)
+    init_params = make_params(section["init_params"], resonator)
+
+    if is_model:
+        flags = {"Q_TLS0": "fit_QTLS0", "alpha": "fit_QP", "tc": "fit_QP", "f0": "fit_f0"}
+        for name, flag in flags.items():
+            init_params[name].vary = section.get(flag, True)
+        result = fit_ffs(resonator, init_params, bounds, num_iter=section.get("num_iter", 100))
+        add_ffs_fit_params(resonator, result.params)
+    else:
+        fitIterated_FFS_gammaFixed(
+            device=resonator,
+            boundsDict=bounds,
+            init_params=init_params,
+            numIter=section.get("num_iter", 100),
+            makePlot=False,
+            powers=None,
+            fit_QTLS0=section.get("fit_QTLS0", True),
+            fit_QP=section.get("fit_QP", True),
+            fit_f0=section.get("fit_f0", True),
+        )
+        plt.close("all")
+
+    resonator.ffs_fit_trace_ids = [tr.id for tr in resonator.traces if not tr.is_excluded]
+    save_resonator(resonator, config.output_file)
+
+
+@instrument
+def run_qubit_metadata(config: DeviceConfig):
+    """existing T1/T2 results are kept, only the metadata attributes are replaced"""
+    metadata = config.section("metadata")
+    if config.output_file.exists():
+        qubit = replace(load_qubit(config.output_file), **metadata)
+    else:
+        qubit = Qubit(name=config.name, **metadata)
+    config.output_file.parent.mkdir(parents=True, exist_ok=True)
+    save_qubit(qubit, config.output_file)
+
+
+def make_qubit_stage(name: str, load_fn, fit_fn, save_fn, bootstrap_fn=None) -> Stage:
+    """
+    stage that fits all traces of one measurement type, excludes listed traces, traces the
+    fit skipped and those with a population contrast below "min_contrast", and saves the
+    results to the qubit.
+    If bootstrap_fn is given, the included traces are bootstrapped with "num_replicates"
+    replicates (none if 0) before saving.
+    """
+    prefix = name.upper()
+
+    def get_input_folder(config: DeviceConfig) -> Path:
+        """ """
+        return config.data_folder / f"{prefix}_{config.name}"
+
+    def run(config: DeviceConfig):
+        """ """
+        section = config.section(name)
+        exclude = set(section.get("exclude", []))
+        min_contrast = section.get("min_contrast")
+
+        qubit = load_qubit(config.output_file)
+        traces = load_fn(get_input_folder(config))
+
+        save_folder = None
+        if section.get("save_plots", False):
+            save_folder = qubit_module.OUTPUT_FOLDER / config.name / f"{prefix}_{config.name}"
+            save_folder.mkdir(parents=True, exist_ok=True)
+
+        fit_kwargs = {"plot": save_folder is not None, "save_folder": save_folder}
+        if section.get("continuation", False):
+            results, report = fit_qubit_traces_continued(traces, fit_fn, **fit_kwargs)
+            print(f"{config.name} {prefix}: {report}")
+        else:
+            results = [fit_fn(trace, **fit_kwargs) for trace in traces]
+        plt.close("all")
+
+        for trace, result in zip(traces, results):
+            # fit_fn returns None for traces it skipped, e.g. T2R traces without FFT peaks
+            is_skipped = result is None
+            is_low_contrast = (
+                not is_skipped and min_contrast is not None and trace.contrast < min_contrast
+            )
+            trace.is_excluded = is_skipped or trace.id in exclude or is_low_contrast
+
+        included_traces = [tr for tr in traces if not tr.is_excluded]
+        print(f"{config.name} {prefix}: {len(included_traces)}/{len(traces)} traces included")
+        num_replicates = section.get("num_replicates", NUM_REPLICATES)
+        if bootstrap_fn is not None and num_replicates > 0:
+            bootstrap_fn(included_traces, num_replicates=num_replicates, seed=0)
+        save_fn(included_traces, qubit)
+
+    run.__qualname__ = f"run_{name}"  # stage name in profiling reports
+    return Stage(
+        name,
+        instrument(run),
+        inputs=lambda config: list_files(get_input_folder(config)),
+    )
+
+
+@instrument
+def run_tphi(config: DeviceConfig):
+    """pair T2E and T2R samples with the nearest T1 sample within "tolerance" seconds"""
+    qubit = load_qubit(config.output_file)
+    add_tphi(qubit, tolerance=config.section("tphi").get("tolerance", TOLERANCE))
+    save_qubit(qubit, config.output_file)
+
+
+def get_sim_files(config: DeviceConfig) -> list[Path]:
+    """simulation tables read by add_metadata"""
+    design_name = config.section("metadata").get("design_name")
+    lk_sim_filepath = resonator_module.DATA_FOLDER / f"{design_name}_lk_sim.csv"
+    return [path for path in (SPR_SIM_FILEPATH, lk_sim_filepath) if path.exists()]
+
+
+# stages of each device kind, listed in an order consistent with their dependencies
+STAGES: dict[str, list[Stage]] = {
+    "resonator": [
+        Stage("metadata", run_resonator_metadata, inputs=get_sim_files),
+        Stage("fit_s21", run_fit_s21, inputs=lambda config: list_files(config.data_folder)),
+        Stage("kinetic_inductance", run_kinetic_inductance, ("metadata", "fit_s21")),
+        Stage("qpt", run_qpt, ("fit_s21",)),
+        Stage("ffs", run_ffs, ("kinetic_inductance", "qpt")),
+    ],
+    "qubit": [
+        Stage("metadata", run_qubit_metadata),
+        make_qubit_stage(
+            "t1", load_t1_traces, fit_t1_trace, save_t1_results, bootstrap_t1_traces
+        ),
+        make_qubit_stage("t2e", load_t2e_traces, fit_t2e_trace, save_t2e_results),
+        make_qubit_stage("t2r", load_t2r_traces, fit_t2r_trace, save_t2r_results),
+        Stage("tphi", run_tphi, ("t1", "t2e", "t2r")),
+    ],
+}
+
+
+def run_device(
+    config: DeviceConfig,
+    stage_names: list[str] = None,
+    force: bool = False,
+    dry_run: bool = False,
+) -> dict[str, str]:
+    """
+    run the stale stages of one device, in order. A failed stage skips the stages
+    downstream of it in the DAG, the others still run. Returns key = stage name, value =
+    "ran", "stale" (dry run), "failed" or "skipped" (stale, but an upstream stage failed).
+    stage_names restricts the stages considered, force reruns them even if up to date.
+    """
+    plt.switch_backend("Agg")
+    state = load_state(config.name)
+    output_exists = config.output_file.exists()
+
+    fingerprints = {}
+    statuses = {}
+    blocked = set()  # stages that failed or were skipped
+    for stage in STAGES[config.kind]:
+        upstream = [fingerprints[name] for name in stage.depends_on]
+        fingerprint = get_fingerprint(stage, config, upstream)
+        fingerprints[stage.name] = fingerprint
+
+        if stage_names is not None and stage.name not in stage_names:
+            continue
+        is_stale = force or not output_exists or state.get(stage.name) != fingerprint
+        if not is_stale:
+            continue
+        if dry_run:
+            statuses[stage.name] = "stale"
+            continue
+        if blocked.intersection(stage.depends_on):
+            statuses[stage.name] = "skipped"
+            blocked.add(stage.name)
+            continue
+
+        try:
+            stage.run(config)
+        except Exception:
+            print(f"{config.name}: stage {stage.name} failed\n{traceback.format_exc()}")
+            statuses[stage.name] = "failed"
+            blocked.add(stage.name)
+            continue
+
+        output_exists = True
+        state[stage.name] = fingerprint
+        save_state(config.name, state)  # saved per stage so interrupted runs resume
+        statuses[stage.name] = "ran"
+
+    return statuses
+
+
+def run(
+    configs: list[DeviceConfig],
+    stage_names: list[str] = None,
+    force: bool = False,
+    dry_run: bool = False,
+    jobs: int = None,
+) -> dict[str, dict[str, str]]:
+    """run all devices, in parallel over `jobs` processes (default = number of cores)"""
+    jobs = jobs or os.cpu_count()
+    args = (stage_names, force, dry_run)
+
+    if jobs == 1 or len(configs) <= 1:
+        return {config.name: run_device(config, *args) for config in configs}
+
+    statuses = {}
+    with ProcessPoolExecutor(max_workers=min(jobs, len(configs))) as executor:
+        futures = {executor.submit(run_device, config, *args): config for config in configs}
+        for future in as_completed(futures):
+            statuses[futures[future].name] = future.result()
+    return statuses
+
+
+def main():
+    """ """
+    parser = argparse.ArgumentParser(description="Run the stale stages of each device.")
+    parser.add_argument("devices", nargs="*", help="device names (default: all devices)")
+    parser.add_argument("--stages", nargs="+", help="only consider these stages")
+    parser.add_argument("--force", action="store_true", help="rerun up to date stages")
+    parser.add_argument("--dry-run", action="store_true", help="list the stale stages")
+    parser.add_argument("-j", "--jobs", type=int, help="number of parallel processes")
+    parser.add_argument("--config-folder", type=Path, default=CONFIG_FOLDER)
+    args = parser.parse_args()
+
+    configs = load_configs(args.config_folder)
+    if args.devices:
+        configs = [config for config in configs if config.name in args.devices]
+        missing_devices = set(args.devices) - {config.name for config in configs}
+        if missing_devices:
+            parser.error(f"No config found for {sorted(missing_devices)}")
+
+    statuses = run(configs, args.stages, args.force, args.dry_run, args.jobs)
+    for device_name in sorted(statuses):
+        stage_statuses = statuses[device_name] or {"all stages": "up to date"}
+        for stage_name, status in stage_statuses.items():
+            print(f"{device_name:<20} {stage_name:<20} {status}")
+
+
+if __name__ == "__main__":
+    main()
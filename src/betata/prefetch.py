@@ -0,0 +1,75 @@
+"""
+Prefetching iteration over data files, overlapping file reads with the consumer's fits.
+
+h5py holds the GIL while it reads, so a background thread that only called a loader would
+block the fitting thread instead of overlapping with it. Each prefetch job therefore
+first reads the raw file with plain Python I/O, which releases the GIL while waiting on
+the disk or network, and only then parses the now cached file with the loader. At most
+`prefetch` files are read ahead of the consumer, so memory is bounded by the prefetch
+depth rather than the folder size.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+import h5py
+
+READ_CHUNK_SIZE = 1 << 20  # bytes
+
+
+def list_data_files(folder: Path) -> list[Path]:
+    """ """
+    return [path for path in Path(folder).iterdir() if path.suffix in [".h5", ".hdf5"]]
+
+
+def read_ahead(filepath: Path):
+    """read the whole file once so that the loader then parses it from the OS cache"""
+    with open(filepath, "rb") as file:
+        while file.read(READ_CHUNK_SIZE):
+            pass
+
+
+def read_attr(filepath: Path, name: str):
+    """ """
+    with h5py.File(filepath, "r") as file:
+        return file.attrs[name]
+
+
+def sort_files(filepaths: list[Path], key_fn: Callable, num_workers: int = 4) -> list[Path]:
+    """filepaths sorted by key_fn(filepath), which should read only small metadata"""
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        keys = list(executor.map(key_fn, filepaths))
+    return [path for _, path in sorted(zip(keys, filepaths), key=lambda item: item[0])]
+
+
+def iter_prefetched(
+    filepaths: Iterable[Path],
+    load_fn: Callable,
+    prefetch: int = 4,
+) -> Iterator:
+    """yield load_fn(filepath) in the order of filepaths, loading up to prefetch files ahead"""
+
+    def load(filepath):
+        """ """
+        read_ahead(filepath)
+        return load_fn(filepath)
+
+    filepaths = iter(filepaths)
+    executor = ThreadPoolExecutor(max_workers=max(prefetch, 1))
+    try:
+        futures = deque()
+        for filepath in filepaths:
+            futures.append(executor.submit(load, filepath))
+            if len(futures) >= prefetch:
+                break
+
+        while futures:
+            result = futures.popleft().result()
+            filepath = next(filepaths, None)
+            if filepath is not None:
+                futures.append(executor.submit(load, filepath))
+            yield result
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,213 @@
+"""
+Opt-in instrumentation of the pipeline stages (loaders, fits, saves and figures).
+
+Stages are functions decorated with `instrument`. For each stage, the profiler records
+call counts, wall time (total and self), solver function evaluations (for stages that
+return an lmfit result) and peak traced memory.
+
+Profile a block of code with the `profile` context manager, or a whole run by setting the
+BETATA_PROFILE environment variable to a report path, e.g.
+
+    BETATA_PROFILE=out/profile.json python src/betata/qubit_measurements/t1_vs_t2e.py
+
+The report is saved as JSON, along with a `.folded` file of collapsed stacks that can be
+rendered with flamegraph.pl or speedscope. Instrumentation costs one global lookup per
+call when profiling is off. Only stages called from the thread that started profiling are
+recorded, stages run in background threads (e.g. prefetching loaders) are not.
+"""
+
+import atexit
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+import functools
+import json
+import os
+from pathlib import Path
+import threading
+import time
+import tracemalloc
+
+PROFILE_ENV_VAR = "BETATA_PROFILE"
+
+
+@dataclass
+class StageStats:
+    """ """
+
+    calls: int = 0
+    wall_time: float = 0.0  # seconds, including nested stages
+    self_time: float = 0.0  # seconds, excluding nested stages
+    nfev: int = 0  # solver function evaluations
+    peak_memory: int = 0  # bytes above the memory in use when the stage was entered
+
+
+@dataclass
+class StageFrame:
+    """a stage currently being executed"""
+
+    name: str
+    start_time: float
+    start_memory: int
+    peak_memory: int
+    child_time: float = 0.0
+
+
+@dataclass
+class Profiler:
+    """ """
+
+    stats: dict[str, StageStats] = field(default_factory=dict)
+    # key = ";"-joined stage stack, value = self time in seconds
+    stacks: dict[str, float] = field(default_factory=dict)
+    frames: list[StageFrame] = field(default_factory=list)
+    trace_memory: bool = True
+    thread: threading.Thread = field(default_factory=threading.current_thread)
+
+    def start(self):
+        """ """
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stop(self):
+        """ """
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def enter(self, name: str):
+        """ """
+        current, peak = self.get_memory()
+        if self.frames:  # keep the parent's peak before resetting it
+            parent = self.frames[-1]
+            parent.peak_memory = max(parent.peak_memory, peak)
+        self.reset_peak_memory()
+        self.frames.append(StageFrame(name, time.perf_counter(), current, current))
+
+    def exit(self, result=None):
+        """ """
+        frame = self.frames.pop()
+        wall_time = time.perf_counter() - frame.start_time
+        _, peak = self.get_memory()
+        frame.peak_memory = max(frame.peak_memory, peak)
+
+        stats = self.stats.setdefault(frame.name, StageStats())
+        stats.calls += 1
+        stats.wall_time += wall_time
+        stats.self_time += wall_time - frame.child_time
+        stats.nfev += getattr(result, "nfev", 0) or 0
+        stage_peak = frame.peak_memory - frame.start_memory
+        stats.peak_memory = max(stats.peak_memory, stage_peak)
+
+        stack = ";".join([f.name for f in self.frames] + [frame.name])
+        self.stacks[stack] = self.stacks.get(stack, 0.0) + wall_time - frame.child_time
+
+        if self.frames:
+            parent = self.frames[-1]
+            parent.child_time += wall_time
+            parent.peak_memory = max(parent.peak_memory, frame.peak_memory)
+        self.reset_peak_memory()
+
+    def get_memory(self) -> tuple[int, int]:
+        """current and peak traced memory in bytes"""
+        if tracemalloc.is_tracing():
+            return tracemalloc.get_traced_memory()
+        return 0, 0
+
+    def reset_peak_memory(self):
+        """ """
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+
+    def report(self) -> dict[str, dict]:
+        """stage stats sorted by decreasing total wall time"""
+        items = sorted(self.stats.items(), key=lambda item: -item[1].wall_time)
+        return {name: asdict(stats) for name, stats in items}
+
+    def save(self, filepath: Path):
+        """save the JSON report and the collapsed stacks (in microseconds) for flamegraphs"""
+        filepath = Path(filepath)
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        with open(filepath, "w") as file:
+            json.dump(self.report(), file, indent=4)
+        with open(filepath.with_suffix(".folded"), "w") as file:
+            for stack, self_time in self.stacks.items():
+                file.write(f"{stack} {round(self_time * 1e6)}\n")
+
+    def print_report(self):
+        """ """
+        print(
+            f"{'stage':<45} {'calls':>7} {'wall (s)':>10} {'self (s)':>10} "
+            f"{'nfev':>8} {'peak (MB)':>10}"
+        )
+        for name, stats in self.report().items():
+            print(
+                f"{name:<45} {stats['calls']:>7} {stats['wall_time']:>10.3f} "
+                f"{stats['self_time']:>10.3f} {stats['nfev']:>8} "
+                f"{stats['peak_memory'] / 1e6:>10.2f}"
+            )
+
+
+# the active profiler, None when profiling is off
+PROFILER: Profiler | None = None
+
+
+def instrument(fn):
+    """decorator that records the function as a stage named <module>.<function>"""
+    module_name = fn.__module__.rsplit(".", 1)[-1]
+    name = f"{module_name}.{fn.__qualname__}"
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        """ """
+        profiler = PROFILER
+        if profiler is None or threading.current_thread() is not profiler.thread:
+            return fn(*args, **kwargs)
+
+        profiler.enter(name)
+        result = None
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            profiler.exit(result)
+        return result
+
+    return wrapper
+
+
+@contextmanager
+def profile(report_path: Path = None, trace_memory: bool = True, verbose: bool = True):
+    """profile the stages called within the block, and save the report if a path is given"""
+    global PROFILER
+    previous_profiler = PROFILER
+    profiler = Profiler(trace_memory=trace_memory)
+    PROFILER = profiler
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        PROFILER = previous_profiler
+        if report_path is not None:
+            profiler.save(report_path)
+        if verbose:
+            profiler.print_report()
+
+
+def profile_from_env():
+    """profile the whole run if the environment variable is set, saving the report at exit"""
+    global PROFILER
+    report_path = os.environ.get(PROFILE_ENV_VAR)
+    if not report_path or PROFILER is not None:
+        return
+
+    PROFILER = Profiler()
+    PROFILER.start()
+
+    def save_at_exit():
+        """ """
+        PROFILER.stop()
+        PROFILER.save(report_path)
+
+    atexit.register(save_at_exit)
+
+
+profile_from_env()
@@ -0,0 +1,216 @@
+"""
+Correlations of T1 (or T2) fluctuations across qubits.
+
+Every qubit's series is binned onto a common time base of absolute epochs and
+standardized over its valid bins. Lagged cross-correlations of all pairs are computed at
+once from the FFTs of the zero-filled series, normalized by the number of bins in which
+both series have data at each lag (also from FFTs of the validity masks), so gaps and
+non-overlapping cooldowns do not bias the result. Dips are bins more than dip_threshold
+standard deviations below a qubit's mean, and their coincidences across qubits are
+compared to the count expected for independent qubits.
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+from scipy import fft, stats
+from scipy.ndimage import maximum_filter1d
+
+from betata import plt
+from betata.h5io import atomic_write
+from betata.profiling import instrument
+from betata.qubit_measurements.dephasing import get_epoch
+from betata.qubit_measurements.qubit import OUTPUT_FOLDER, Qubit
+
+BIN_WIDTH = 10 * 60  # seconds
+MAX_LAG = 6 * 3600  # seconds
+DIP_THRESHOLD = 2.0  # standard deviations below the mean
+MIN_OVERLAP = 10  # bins with data in both series for a correlation to be reported
+
+# kept apart from the qubit files, which load_qubits reads from every file in OUTPUT_FOLDER
+CORRELATIONS_FOLDER = OUTPUT_FOLDER / "correlations"
+
+
+@dataclass
+class CorrelationResult:
+    """ """
+
+    kind: str
+    names: list[str]
+    bin_width: float  # seconds
+    lags: np.ndarray  # seconds, (num_lags,)
+    # (num_qubits, num_qubits, num_lags), NaN if too little data
+    correlation: np.ndarray
+    overlap: np.ndarray  # bins with data in both series, (num_qubits, ...)
+    # dips of row qubit with a dip of column qubit in the window
+    coincidences: np.ndarray
+    expected_coincidences: np.ndarray  # the same for independent qubits
+    p_value: np.ndarray  # of observing at least as many coincidences by chance
+
+    def get_peak_correlation(self) -> tuple[np.ndarray, np.ndarray]:
+        """largest |correlation| of each pair over all lags and the lag it occurs at"""
+        abs_corr = np.nan_to_num(np.abs(self.correlation), nan=-1)
+        idx = np.argmax(abs_corr, axis=-1)
+        peak = np.take_along_axis(self.correlation, idx[..., None], axis=-1)[..., 0]
+        return peak, self.lags[idx]
+
+
+def bin_series(
+    epoch: np.ndarray, values: np.ndarray, start: float, num_bins: int, bin_width: float
+) -> np.ndarray:
+    """mean of values in each time bin, NaN for bins without samples"""
+    idx = ((epoch - start) // bin_width).astype(int)
+    is_valid = np.isfinite(values) & (idx >= 0) & (idx < num_bins)
+    idx, values = idx[is_valid], values[is_valid]
+    sums = np.bincount(idx, weights=values, minlength=num_bins)
+    counts = np.bincount(idx, minlength=num_bins)
+    with np.errstate(invalid="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def resample_qubits(
+    qubits: list[Qubit], kind: str = "t1", bin_width: float = BIN_WIDTH
+) -> tuple[np.ndarray, np.ndarray]:
+    """bin start epochs and the binned series of all qubits, (num_qubits, num_bins)"""
+    epochs = [get_epoch(qubit, kind) for qubit in qubits]
+    start = min(np.min(epoch) for epoch in epochs)
+    stop = max(np.max(epoch) for epoch in epochs)
+    num_bins = int((stop - start) // bin_width) + 1
+    series = np.stack(
+        [
+            bin_series(epoch, getattr(qubit, kind), start, num_bins, bin_width)
+            for qubit, epoch in zip(qubits, epochs)
+        ]
+    )
+    return start + bin_width * np.arange(num_bins), series
+
+
+def standardize(series: np.ndarray) -> np.ndarray:
+    """z-score of each row over its valid bins"""
+    mean = np.nanmean(series, axis=-1, keepdims=True)
+    std = np.nanstd(series, axis=-1, keepdims=True)
+    return (series - mean) / np.where(std > 0, std, 1)
+
+
+def cross_correlate(x: np.ndarray, max_lag: int) -> np.ndarray:
+    """
+    sum over t of x[i, t] * x[j, t + lag] for all pairs (i, j) and lags in
+    [-max_lag, max_lag], of shape (num_rows, num_rows, 2 * max_lag + 1). It peaks at a
+    positive lag if row j follows row i.
+    """
+    num_bins = x.shape[-1]
+    n = fft.next_fast_len(2 * num_bins - 1, real=True)
+    spectrum = fft.rfft(x, n=n, axis=-1, workers=-1)
+    lags = np.arange(-max_lag, max_lag + 1) % n
+    # one row at a time, so that memory scales with the number of rows and not pairs
+    return np.stack(
+        [
+            fft.irfft(np.conj(row) * spectrum, n=n, axis=-1, workers=-1)[:, lags]
+            for row in spectrum
+        ]
+    )
+
+
+@instrument
+def get_correlations(
+    qubits: list[Qubit],
+    kind: str = "t1",
+    bin_width: float = BIN_WIDTH,
+    max_lag: float = MAX_LAG,
+    dip_threshold: float = DIP_THRESHOLD,
+    coincidence_window: float = 0,
+) -> CorrelationResult:
+    """
+    lagged cross-correlations and dip coincidences of the kind ("t1", "t2e" or "t2r")
+    series of qubits. A dip of one qubit coincides with a dip of another if they are at
+    most coincidence_window seconds apart.
+    """
+    _, series = resample_qubits(qubits, kind, bin_width)
+    is_valid = np.isfinite(series)
+    z = np.where(is_valid, standardize(series), 0)
+
+    max_lag_bins = min(int(max_lag // bin_width), series.shape[-1] - 1)
+    overlap = np.rint(cross_correlate(is_valid.astype(float), max_lag_bins))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        correlation = cross_correlate(z, max_lag_bins) / overlap
+    correlation[overlap < MIN_OVERLAP] = np.nan
+
+    # dips, with those of the column qubit widened by the coincidence window
+    is_dip = (z < -dip_threshold) & is_valid
+    window_bins = int(coincidence_window // bin_width)
+    is_near_dip = maximum_filter1d(is_dip, size=2 * window_bins + 1, axis=-1)
+    valid, dip, near_dip = (a.astype(float) for a in (is_valid, is_dip, is_near_dip))
+    coincidences = dip @ near_dip.T
+    # fraction of each qubit's valid bins within the window of a dip
+    num_valid = np.sum(valid, axis=-1)
+    near_dip_rate = np.sum(near_dip * valid, axis=-1) / np.maximum(num_valid, 1)
+    # dips of the row qubit in bins where the column qubit has data
+    row_dips = dip @ valid.T
+    expected = row_dips * near_dip_rate[None, :]
+    p_value = stats.poisson.sf(coincidences - 1, expected)
+
+    return CorrelationResult(
+        kind=kind,
+        names=[qubit.name for qubit in qubits],
+        bin_width=bin_width,
+        lags=bin_width * np.arange(-max_lag_bins, max_lag_bins + 1),
+        correlation=correlation,
+        overlap=overlap,
+        coincidences=coincidences,
+        expected_coincidences=expected,
+        p_value=p_value,
+    )
+
+
+@instrument
+def plot_correlation_heatmap(result: CorrelationResult, lag: float = None, ax=None):
+    """correlation matrix at the given lag (seconds), or the peak over lags if None"""
+    if lag is None:
+        matrix, _ = result.get_peak_correlation()
+        title = f"peak {result.kind.upper()} correlation"
+    else:
+        lag_idx = np.argmin(np.abs(result.lags - lag))
+        matrix = result.correlation[..., lag_idx]
+        title = (
+            f"{result.kind.upper()} correlation at {result.lags[lag_idx] / 60:.0f} min"
+        )
+
+    if ax is None:
+        fig, ax = plt.subplots(figsize=(10, 9))
+    else:
+        fig = ax.figure
+
+    image = ax.imshow(matrix, cmap="RdBu_r", vmin=-1, vmax=1)
+    fig.colorbar(image, ax=ax)
+    ticks = np.arange(len(result.names))
+    ax.set_xticks(ticks, result.names, rotation=90)
+    ax.set_yticks(ticks, result.names)
+    ax.set_title(title)
+    fig.tight_layout()
+
+    return fig, ax
+
+
+@instrument
+def save_correlations(result: CorrelationResult, filepath: Path = None) -> Path:
+    """ """
+    if filepath is None:
+        filepath = CORRELATIONS_FOLDER / f"{result.kind}_correlations.h5"
+
+    with atomic_write(filepath) as file:
+        file.attrs["kind"] = result.kind
+        file.attrs["names"] = result.names
+        file.attrs["bin_width"] = result.bin_width
+        for key in (
+            "lags",
+            "correlation",
+            "overlap",
+            "coincidences",
+            "expected_coincidences",
+            "p_value",
+        ):
+            if key in file:
+                del file[key]
+            file.create_dataset(key, data=getattr(result, key))
+    return filepath
@@ -0,0 +1,77 @@
+"""
+Pure dephasing times from T1 and T2 samples measured close together in time.
+
+Each T2E or T2R sample is paired with the T1 sample nearest to it in absolute time, if
+one lies within the tolerance, like a pandas merge_asof with direction="nearest". The
+join sorts the T1 epochs once and looks every T2 epoch up by binary search, so it runs
+in O(n log n) on whole series without any per-sample Python loop.
+"""
+
+import numpy as np
+
+from betata import propagation
+from betata.profiling import instrument
+from betata.qubit_measurements.qubit import Qubit
+
+TOLERANCE = 30 * 60  # seconds
+
+
+def align_nearest(
+    epoch: np.ndarray, ref_epoch: np.ndarray, tolerance: float = TOLERANCE
+) -> np.ndarray:
+    """
+    index into ref_epoch of the sample nearest to each epoch, -1 if none lies within
+    tolerance. Ties go to the earlier reference sample.
+    """
+    epoch, ref_epoch = np.asarray(epoch, dtype=float), np.asarray(
+        ref_epoch, dtype=float
+    )
+    if len(ref_epoch) == 0:
+        return np.full(len(epoch), -1)
+
+    order = np.argsort(ref_epoch, kind="stable")
+    sorted_epoch = ref_epoch[order]
+
+    # candidates are the reference samples just before and just after each epoch
+    after = np.searchsorted(sorted_epoch, epoch, side="left")
+    before = np.clip(after - 1, 0, len(sorted_epoch) - 1)
+    after = np.clip(after, 0, len(sorted_epoch) - 1)
+    dist_before = np.abs(epoch - sorted_epoch[before])
+    dist_after = np.abs(sorted_epoch[after] - epoch)
+    nearest = np.where(dist_after < dist_before, after, before)
+    dist = np.minimum(dist_before, dist_after)
+
+    return np.where(dist <= tolerance, order[nearest], -1)
+
+
+def get_epoch(qubit: Qubit, kind: str) -> np.ndarray:
+    """ """
+    epoch, values = getattr(qubit, f"{kind}_epoch"), getattr(qubit, kind)
+    if epoch is None or values is None or len(epoch) != len(values):
+        raise ValueError(
+            f"Qubit {qubit.name} has no absolute {kind.upper()} timestamps, "
+            f"save its {kind.upper()} results again to add them."
+        )
+    return epoch
+
+
+@instrument
+def add_tphi(qubit: Qubit, tolerance: float = TOLERANCE, kinds=("t2e", "t2r")) -> Qubit:
+    """
+    pair each T2 sample of the given kinds with the nearest T1 sample within tolerance
+    (seconds) and store the pure dephasing time of each pair on the qubit
+    """
+    t1_epoch = get_epoch(qubit, "t1")
+    for kind in kinds:
+        t1_idx = align_nearest(get_epoch(qubit, kind), t1_epoch, tolerance)
+        is_matched = t1_idx >= 0
+        matched_idx = np.where(is_matched, t1_idx, 0)
+
+        t1, t1_err = qubit.t1[matched_idx], qubit.t1_err[matched_idx]
+        t2, t2_err = getattr(qubit, kind), getattr(qubit, f"{kind}_err")
+        tphi, tphi_err = propagation.pure_dephasing(t1, t1_err, t2, t2_err)
+
+        setattr(qubit, f"{kind}_tphi", np.where(is_matched, tphi, np.nan))
+        setattr(qubit, f"{kind}_tphi_err", np.where(is_matched, tphi_err, np.nan))
+        setattr(qubit, f"{kind}_t1_idx", t1_idx)
+    return qubit
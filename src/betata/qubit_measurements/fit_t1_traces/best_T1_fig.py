@@ -44,8 +44,10 @@ if __name__ == "__main__":
             continue
         with h5py.File(filepath) as file:
             qubit_name = file.attrs["name"]
-            all_t1s = file["t1"]["t1"][:]
-            all_t1_trace_ids = file["t1"]["t1_trace_id"][:]
+            all_t1s = file["t1"]["t1"][()]
+            all_t1_trace_ids = file["t1"]["t1_trace_id"][()]
+            if isinstance(all_t1s, h5py.Empty):  # no T1 results saved yet
+                continue
             qubit_traceid_dict[qubit_name] = all_t1_trace_ids[np.argmax(all_t1s)]
 
     # retrieve best T1 trace data and generate best T1 figure for each qubit
@@ -6,6 +6,9 @@ import numpy as np
 import lmfit
 
 from betata import plt
+from betata.bootstrap import LEVEL, NUM_REPLICATES, BootstrapResult, bootstrap_batch
+from betata.continuation import seed_params
+from betata.profiling import instrument
 from betata.qubit_measurements.traces import T1Trace
 
 
@@ -53,6 +56,7 @@ class T1Model(lmfit.Model):
         return self.make_params(guesses=guesses)
 
 
+@instrument
 def fit_t1_trace(
     trace: T1Trace,
     plot=True,
@@ -60,12 +64,25 @@ def fit_t1_trace(
     save_folder=None,
     close_fig=False,
     method="leastsq",
+    params=None,
+    warm_start: lmfit.Parameters = None,
 ) -> lmfit.model.ModelResult:
-    """ """
+    """
+    params replace the guessed parameters, warm_start (e.g. the fit of a neighboring
+    trace) only seeds their values
+    """
     tau = trace.tau  # seconds
     population = trace.population
-
-    fit_result = T1Model().fit(population, tau, verbose=verbose, method=method)
+    if params is None and warm_start is not None:
+        params = seed_params(T1Model().guess(population, tau), warm_start)
+
+    fit_result = T1Model().fit(
+        population,
+        tau,
+        verbose=verbose,
+        method=method,
+        params=params,
+    )
 
     trace.T1 = fit_result.params["T1"].value
     trace.T1_err = fit_result.params["T1"].stderr
@@ -89,6 +106,56 @@ def fit_t1_trace(
     return fit_result
 
 
+@instrument
+def bootstrap_t1_traces(
+    traces: list[T1Trace],
+    method: str = "residuals",
+    num_replicates: int = NUM_REPLICATES,
+    level: float = LEVEL,
+    chunk_size: int = 64,
+    seed: int = None,
+) -> list[BootstrapResult]:
+    """
+    bootstrap of the fits of all fitted traces, refitted together in chunks of
+    chunk_size traces of equal length. Sets T1_low and T1_high of each trace.
+    """
+    results = [None] * len(traces)
+    rng = np.random.default_rng(seed)
+    names = ["A", "T1", "B"]
+
+    idxs_by_length = {}
+    for idx, trace in enumerate(traces):
+        if None not in [trace.A, trace.T1, trace.B]:
+            idxs_by_length.setdefault(len(trace.tau), []).append(idx)
+
+    for idxs in idxs_by_length.values():
+        for start in range(0, len(idxs), chunk_size):
+            chunk = [traces[idx] for idx in idxs[start : start + chunk_size]]
+            # replicates are refitted within the same bounds as the point fits
+            params = T1Model().guess(chunk[0].population, chunk[0].tau)
+            bootstrap = bootstrap_batch(
+                t1_fit_fn,
+                np.stack([trace.tau for trace in chunk]),
+                np.stack([trace.population for trace in chunk]),
+                np.array([[trace.A, trace.T1, trace.B] for trace in chunk]),
+                names=names,
+                method=method,
+                num_replicates=num_replicates,
+                level=level,
+                lower=[params[name].min for name in names],
+                upper=[params[name].max for name in names],
+                seed=rng,
+            )
+            T1_low, T1_high = bootstrap.get_interval("T1")
+            for chunk_idx, trace in enumerate(chunk):
+                trace.T1_low = float(T1_low[chunk_idx])
+                trace.T1_high = float(T1_high[chunk_idx])
+                results[idxs[start + chunk_idx]] = bootstrap[chunk_idx]
+
+    return results
+
+
+@instrument
 def plot_t1_trace(trace: T1Trace, show_fit=True, figsize=(5, 5)):
     """ """
     tau_us = trace.tau * 1e6
@@ -120,6 +187,7 @@ def plot_t1_trace(trace: T1Trace, show_fit=True, figsize=(5, 5)):
     return fig, ax
 
 
+@instrument
 def plot_t1_vs_time(traces: list[T1Trace], qubit_name: str):
     """ """
 
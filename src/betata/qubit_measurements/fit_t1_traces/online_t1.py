@@ -0,0 +1,176 @@
+"""
+Online Bayesian estimate of T1, updated point by point as (tau, population) arrive.
+
+The posterior is evaluated on a log-spaced grid of T1 with a log-uniform prior. For a
+fixed T1 the model A * exp(-tau / T1) + B is linear in A and B, so with a conjugate normal
+prior on A and B (and a 1 / sigma prior on the noise if sigma is not given) they are
+integrated out analytically. Each grid point then only needs the running sums of x, x**2,
+x * y, y and y**2 with x = exp(-tau / T1), so an update costs one vectorized pass over the
+grid whatever the number of points seen so far. The prior on A and B is weak, worth
+PRIOR_WEIGHT points, and only keeps the posterior proper while T1 is unconstrained.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from betata.qubit_measurements.traces import T1Trace
+
+T1_MIN, T1_MAX = 1e-6, 1e-2  # seconds
+NUM_GRID = 2048
+CREDIBLE_LEVEL = 0.68
+MIN_POINTS = 10
+# posterior mass allowed in the outermost grid points at convergence
+MAX_EDGE_MASS = 0.01
+PRIOR_A, PRIOR_B = 0.5, 0.5
+PRIOR_WEIGHT = 1e-3  # prior standard deviation of A and B is sigma / sqrt(PRIOR_WEIGHT)
+
+
+@dataclass
+class T1Estimate:
+    """ """
+
+    num_points: int
+    T1: float = None  # posterior mean, seconds
+    T1_err: float = None  # posterior standard deviation, seconds
+    T1_low: float = None  # credible interval, seconds
+    T1_high: float = None
+    A: float = None
+    B: float = None
+    is_converged: bool = False
+
+
+class OnlineT1Estimator:
+    """ """
+
+    def __init__(
+        self,
+        T1_min: float = T1_MIN,
+        T1_max: float = T1_MAX,
+        num_grid: int = NUM_GRID,
+        sigma: float = None,
+        target_rel_err: float = None,
+        credible_level: float = CREDIBLE_LEVEL,
+        min_points: int = MIN_POINTS,
+    ):
+        """
+        sigma is the population noise per point, marginalized over if None.
+        target_rel_err is the credible interval half width relative to T1 at which the
+        estimate is converged.
+        """
+        self.T1_grid = np.geomspace(T1_min, T1_max, num_grid)
+        self.sigma = sigma
+        self.target_rel_err = target_rel_err
+        self.credible_level = credible_level
+        self.min_points = min_points
+
+        self.num_points = 0
+        self.sum_y = 0.0
+        self.sum_yy = 0.0
+        self.sum_x = np.zeros(num_grid)
+        self.sum_xx = np.zeros(num_grid)
+        self.sum_xy = np.zeros(num_grid)
+
+    def update(self, tau, population):
+        """add one or many (tau, population) samples to the posterior"""
+        tau, population = np.atleast_1d(tau), np.atleast_1d(population)
+        x = np.exp(-tau[:, None] / self.T1_grid)  # (num_samples, num_grid)
+        self.num_points += len(tau)
+        self.sum_y += np.sum(population)
+        self.sum_yy += np.sum(population**2)
+        self.sum_x += np.sum(x, axis=0)
+        self.sum_xx += np.sum(x**2, axis=0)
+        self.sum_xy += population @ x
+        return self
+
+    def get_linear_posterior(self) -> tuple[np.ndarray, ...]:
+        """
+        posterior mean of A and B, the residual sum of squares including the prior, and
+        the determinant of the posterior precision matrix (in units of 1 / sigma**2) at
+        each T1
+        """
+        # normal equations of the linear fit, with the prior as PRIOR_WEIGHT extra points
+        m_AA = self.sum_xx + PRIOR_WEIGHT
+        m_AB = self.sum_x
+        m_BB = self.num_points + PRIOR_WEIGHT
+        r_A = self.sum_xy + PRIOR_WEIGHT * PRIOR_A
+        r_B = self.sum_y + PRIOR_WEIGHT * PRIOR_B
+
+        det = m_AA * m_BB - m_AB**2
+        A = (m_BB * r_A - m_AB * r_B) / det
+        B = (m_AA * r_B - m_AB * r_A) / det
+        rss = self.sum_yy + PRIOR_WEIGHT * (PRIOR_A**2 + PRIOR_B**2) - A * r_A - B * r_B
+        return A, B, np.maximum(rss, np.finfo(float).tiny), det
+
+    def get_posterior(self) -> np.ndarray:
+        """normalized posterior weights of T1_grid, None before any data"""
+        if self.num_points == 0:
+            return None
+        _, _, rss, det = self.get_linear_posterior()
+        log_p = -0.5 * np.log(det)
+        if self.sigma is None:
+            log_p -= 0.5 * self.num_points * np.log(rss)
+        else:
+            log_p -= 0.5 * rss / self.sigma**2
+        p = np.exp(log_p - np.max(log_p))
+        return p / np.sum(p)
+
+    def get_estimate(self) -> T1Estimate:
+        """ """
+        posterior = self.get_posterior()
+        if posterior is None:
+            return T1Estimate(self.num_points)
+
+        A, B, _, _ = self.get_linear_posterior()
+        T1 = posterior @ self.T1_grid
+        T1_err = np.sqrt(posterior @ (self.T1_grid - T1) ** 2)
+
+        # equal tailed interval, interpolated in log T1
+        cdf = np.cumsum(posterior) - posterior / 2
+        tail = (1 - self.credible_level) / 2
+        log_low, log_high = np.interp([tail, 1 - tail], cdf, np.log(self.T1_grid))
+        T1_low, T1_high = np.exp(log_low), np.exp(log_high)
+
+        is_converged = False
+        if self.target_rel_err is not None and self.num_points >= self.min_points:
+            rel_err = (T1_high - T1_low) / (2 * T1)
+            edge_mass = posterior[0] + posterior[-1]
+            is_converged = rel_err <= self.target_rel_err and edge_mass <= MAX_EDGE_MASS
+
+        return T1Estimate(
+            num_points=self.num_points,
+            T1=float(T1),
+            T1_err=float(T1_err),
+            T1_low=float(T1_low),
+            T1_high=float(T1_high),
+            A=float(posterior @ A),
+            B=float(posterior @ B),
+            is_converged=bool(is_converged),
+        )
+
+
+def estimate_t1_trace(
+    trace: T1Trace,
+    target_rel_err: float = None,
+    order: np.ndarray = None,
+    **kwargs,
+) -> T1Estimate:
+    """
+    stream the points of trace in the given order (acquisition order if None) through an
+    OnlineT1Estimator, stopping early once target_rel_err is reached
+    """
+    estimator = OnlineT1Estimator(target_rel_err=target_rel_err, **kwargs)
+    if order is None:
+        order = np.arange(len(trace.tau))
+
+    if target_rel_err is None:
+        estimator.update(trace.tau[order], trace.population[order])
+        return estimator.get_estimate()
+
+    estimate = estimator.get_estimate()  # returned as is if order is empty
+    for idx in order:
+        estimator.update(trace.tau[idx], trace.population[idx])
+        estimate = estimator.get_estimate()
+        if estimate.is_converged:
+            break
+    return estimate
@@ -44,8 +44,10 @@ if __name__ == "__main__":
             continue
         with h5py.File(filepath) as file:
             qubit_name = file.attrs["name"]
-            all_t2es = file["t2e"]["t2e"][:]
-            all_t2e_trace_ids = file["t2e"]["t2e_trace_id"][:]
+            all_t2es = file["t2e"]["t2e"][()]
+            all_t2e_trace_ids = file["t2e"]["t2e_trace_id"][()]
+            if isinstance(all_t2es, h5py.Empty):  # no T2E results saved yet
+                continue
             qubit_traceid_dict[qubit_name] = all_t2e_trace_ids[np.argmax(all_t2es)]
 
     # retrieve best T2E trace data and generate best T2E figure for each qubit
@@ -6,6 +6,8 @@ import numpy as np
 import lmfit
 
 from betata import plt
+from betata.continuation import seed_params
+from betata.profiling import instrument
 from betata.qubit_measurements.traces import T2ETrace
 
 
@@ -53,6 +55,7 @@ class T2EModel(lmfit.Model):
         return self.make_params(guesses=guesses)
 
 
+@instrument
 def fit_t2e_trace(
     trace: T2ETrace,
     plot=True,
@@ -60,10 +63,16 @@ def fit_t2e_trace(
     save_folder=None,
     method="leastsq",
     params=None,
+    warm_start: lmfit.Parameters = None,
 ) -> lmfit.model.ModelResult:
-    """ """
+    """
+    params replace the guessed parameters, warm_start (e.g. the fit of a neighboring
+    trace) only seeds their values
+    """
     tau = trace.tau  # seconds
     population = trace.population
+    if params is None and warm_start is not None:
+        params = seed_params(T2EModel().guess(population, tau), warm_start)
 
     fit_result = T2EModel().fit(
         population,
@@ -95,6 +104,7 @@ def fit_t2e_trace(
     return fit_result
 
 
+@instrument
 def plot_t2e_trace(trace: T2ETrace, show_fit=True, figsize=(5, 5)):
     """ """
     tau_us = trace.tau * 1e6
@@ -125,6 +135,7 @@ def plot_t2e_trace(trace: T2ETrace, show_fit=True, figsize=(5, 5)):
     return fig, ax
 
 
+@instrument
 def plot_t2e_vs_time(traces: list[T2ETrace], qubit_name: str):
     """ """
 
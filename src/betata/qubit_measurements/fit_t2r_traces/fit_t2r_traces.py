@@ -7,6 +7,8 @@ import lmfit
 from scipy.signal import find_peaks
 
 from betata import plt
+from betata.continuation import seed_params
+from betata.profiling import instrument
 from betata.qubit_measurements.traces import T2RTrace
 
 
@@ -36,6 +38,7 @@ class T2RModel(lmfit.Model):
         return result
 
 
+@instrument
 def fit_t2r_trace(
     trace: T2RTrace,
     max_n_freqs: int = 4,
@@ -45,8 +48,12 @@ def fit_t2r_trace(
     save_folder=None,
     method="leastsq",
     params=None,
+    warm_start: lmfit.Parameters = None,
 ) -> lmfit.model.ModelResult:
-    """ """
+    """
+    params replace the parameters guessed from the FFT, warm_start (e.g. the fit of a
+    neighboring trace) only seeds their values
+    """
     tau = trace.tau  # seconds
     population = trace.population
 
@@ -82,6 +89,10 @@ def fit_t2r_trace(
         for i in range(n_freqs):
             params.add(f"A{i}", value=amps_norm[i], min=-1, max=1)
             params.add(f"f{i}", value=freqs_init[i], min=0, max=1e6)
+        # the components are detected from this trace's FFT, a neighbor's fit only
+        # seeds the values of those the two have in common
+        if warm_start is not None:
+            seed_params(params, warm_start)
 
     fit_result = T2RModel().fit(
         population,
@@ -118,6 +129,7 @@ def fit_t2r_trace(
     return fit_result
 
 
+@instrument
 def plot_t2r_trace(trace: T2RTrace, fit_params=None, fft_params=None, figsize=(10, 7)):
     """ """
     tau_us = trace.tau * 1e6
@@ -157,6 +169,7 @@ def plot_t2r_trace(trace: T2RTrace, fit_params=None, fft_params=None, figsize=(1
     return fig, ax1, ax2
 
 
+@instrument
 def plot_t2r_vs_time(traces: list[T2RTrace], qubit_name: str):
     """ """
 
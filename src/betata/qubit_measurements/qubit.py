@@ -6,9 +6,37 @@ from pathlib import Path
 import h5py
 import numpy as np
 
+from betata.h5io import atomic_write
+from betata.profiling import instrument
+
 DATA_FOLDER = Path(__file__).parents[3] / "data/qubit_measurements"
 OUTPUT_FOLDER = Path(__file__).parents[3] / "out/qubit_measurements"
 
+# per-trace frequency components of T2R fits, stored as ragged arrays
+T2R_COMPONENTS = ("t2r_As", "t2r_A_errs", "t2r_freqs", "t2r_freq_errs")
+
+
+def make_ragged(rows: list) -> tuple[np.ndarray, np.ndarray]:
+    """
+    values and offsets of a ragged array (CSR-style), where row i is
+    values[offsets[i]:offsets[i + 1]]
+    """
+    lengths = np.array([len(row) for row in rows], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    if not rows:
+        return np.zeros(0), offsets
+    return np.concatenate(rows).astype(float), offsets
+
+
+def get_ragged_row(values: np.ndarray, offsets: np.ndarray, idx: int) -> np.ndarray:
+    """row idx of a ragged array, as a view"""
+    return values[offsets[idx] : offsets[idx + 1]]
+
+
+def split_ragged(values: np.ndarray, offsets: np.ndarray) -> list[np.ndarray]:
+    """all rows of a ragged array, as views"""
+    return np.split(values, offsets[1:-1])
+
 
 @dataclass
 class Qubit:
@@ -26,7 +54,10 @@ class Qubit:
 
     t1: np.ndarray = None
     t1_err: np.ndarray = None
+    t1_low: np.ndarray = None  # bootstrap confidence interval
+    t1_high: np.ndarray = None
     t1_timestamp: np.ndarray = None
+    t1_epoch: np.ndarray = None  # seconds since the unix epoch
     t1_trace_id: np.ndarray = None
     t1_A: np.ndarray = None
     t1_A_err: np.ndarray = None
@@ -39,26 +70,38 @@ class Qubit:
     t2r: np.ndarray = None
     t2r_err: np.ndarray = None
     t2r_timestamp: np.ndarray = None
+    t2r_epoch: np.ndarray = None
     t2r_trace_id: np.ndarray = None
     t2r_As: np.ndarray = None
     t2r_A_errs: np.ndarray = None
     t2r_freqs: np.ndarray = None
     t2r_freq_errs: np.ndarray = None
+    t2r_offsets: np.ndarray = None  # T2R components of trace i are [offsets[i]:offsets[i + 1]]
     t2r_B: np.ndarray = None
     t2r_B_err: np.ndarray = None
 
+    # pure dephasing time of each T2R sample with the nearest T1 sample, NaN if unmatched
+    t2r_tphi: np.ndarray = None
+    t2r_tphi_err: np.ndarray = None
+    t2r_t1_idx: np.ndarray = None  # index of the matched T1 sample, -1 if unmatched
+
     t2r_avg: float = None
     t2r_avg_err: float = None
 
     t2e: np.ndarray = None
     t2e_err: np.ndarray = None
     t2e_timestamp: np.ndarray = None
+    t2e_epoch: np.ndarray = None
     t2e_trace_id: np.ndarray = None
     t2e_A: np.ndarray = None
     t2e_A_err: np.ndarray = None
     t2e_B: np.ndarray = None
     t2e_B_err: np.ndarray = None
 
+    t2e_tphi: np.ndarray = None
+    t2e_tphi_err: np.ndarray = None
+    t2e_t1_idx: np.ndarray = None
+
     t2e_avg: float = None
     t2e_avg_err: float = None
 
@@ -82,10 +125,38 @@ class Qubit:
             return None
         return 2 * np.pi * self.f_q * self.t1_avg_err
 
+    @property
+    def t2r_num_freqs(self) -> np.ndarray:
+        """number of frequency components of each T2R fit"""
+        return np.diff(self.t2r_offsets)
+
+    def get_t2r_components(self, idx: int) -> dict[str, np.ndarray]:
+        """frequency components of the idx-th T2R fit, as views into the ragged arrays"""
+        return {
+            name: get_ragged_row(getattr(self, name), self.t2r_offsets, idx)
+            for name in T2R_COMPONENTS
+        }
+
+
+def clear_tphi(qubit: Qubit, kinds=("t2e", "t2r")):
+    """
+    drop the T1 pairing and pure dephasing times of the given T2 kinds, which are stale
+    once the T1 or T2 samples they were computed from are saved again
+    """
+    for kind in kinds:
+        for suffix in ("tphi", "tphi_err", "t1_idx"):
+            setattr(qubit, f"{kind}_{suffix}", None)
 
+
+def read_optional(group: h5py.Group, name: str) -> np.ndarray:
+    """dataset name of group, None if it was not saved (files saved by older versions)"""
+    return group[name][()] if name in group else None
+
+
+@instrument
 def load_qubit(filepath: Path) -> Qubit:
     """ """
-    with h5py.File(filepath, "a") as file:
+    with h5py.File(filepath, "r") as file:
         qubit = Qubit(
             name=file.attrs["name"],
             design_name=file.attrs["design_name"],
@@ -95,36 +166,48 @@ def load_qubit(filepath: Path) -> Qubit:
             kappa=file.attrs["kappa"],
             Ej=file.attrs["Ej"],
             Ec=file.attrs["Ec"],
-            t1=file["t1"]["t1"][:],
-            t1_err=file["t1"]["t1_err"][:],
-            t1_timestamp=file["t1"]["t1_timestamp"][:],
-            t1_trace_id=file["t1"]["t1_trace_id"][:],
-            t1_A=file["t1"]["t1_A"][:],
-            t1_A_err=file["t1"]["t1_A_err"][:],
-            t1_B=file["t1"]["t1_B"][:],
-            t1_B_err=file["t1"]["t1_B_err"][:],
+            t1=file["t1"]["t1"][()],
+            t1_err=file["t1"]["t1_err"][()],
+            t1_low=read_optional(file["t1"], "t1_low"),
+            t1_high=read_optional(file["t1"], "t1_high"),
+            t1_timestamp=file["t1"]["t1_timestamp"][()],
+            t1_epoch=read_optional(file["t1"], "t1_epoch"),
+            t1_trace_id=file["t1"]["t1_trace_id"][()],
+            t1_A=file["t1"]["t1_A"][()],
+            t1_A_err=file["t1"]["t1_A_err"][()],
+            t1_B=file["t1"]["t1_B"][()],
+            t1_B_err=file["t1"]["t1_B_err"][()],
             t1_avg=file.attrs["t1_avg"],
             t1_avg_err=file.attrs["t1_avg_err"],
-            t2r=file["t2r"]["t2r"][:],
-            t2r_err=file["t2r"]["t2r"][:],
-            t2r_timestamp=file["t2r"]["t2r_timestamp"][:],
-            t2r_trace_id=file["t2r"]["t2r_trace_id"][:],
-            t2r_As=file["t2r"]["t2r_As"][:],
-            t2r_A_errs=file["t2r"]["t2r_A_errs"][:],
-            t2r_freqs=file["t2r"]["t2r_freqs"][:],
-            t2r_freq_errs=file["t2r"]["t2r_freq_errs"][:],
-            t2r_B=file["t2r"]["t2r_B"][:],
-            t2r_B_err=file["t2r"]["t2r_B_err"][:],
+            t2r=file["t2r"]["t2r"][()],
+            t2r_err=file["t2r"]["t2r_err"][()],
+            t2r_timestamp=file["t2r"]["t2r_timestamp"][()],
+            t2r_epoch=read_optional(file["t2r"], "t2r_epoch"),
+            t2r_trace_id=file["t2r"]["t2r_trace_id"][()],
+            t2r_As=file["t2r"]["t2r_As"][()],
+            t2r_A_errs=file["t2r"]["t2r_A_errs"][()],
+            t2r_freqs=file["t2r"]["t2r_freqs"][()],
+            t2r_freq_errs=file["t2r"]["t2r_freq_errs"][()],
+            t2r_offsets=read_optional(file["t2r"], "t2r_offsets"),
+            t2r_B=file["t2r"]["t2r_B"][()],
+            t2r_B_err=file["t2r"]["t2r_B_err"][()],
+            t2r_tphi=read_optional(file["t2r"], "t2r_tphi"),
+            t2r_tphi_err=read_optional(file["t2r"], "t2r_tphi_err"),
+            t2r_t1_idx=read_optional(file["t2r"], "t2r_t1_idx"),
             t2r_avg=file.attrs["t2r_avg"],
             t2r_avg_err=file.attrs["t2r_avg_err"],
-            t2e=file["t2e"]["t2e"][:],
-            t2e_err=file["t2e"]["t2e_err"][:],
-            t2e_timestamp=file["t2e"]["t2e_timestamp"][:],
-            t2e_trace_id=file["t2e"]["t2e_trace_id"][:],
-            t2e_A=file["t2e"]["t2e_A"][:],
-            t2e_A_err=file["t2e"]["t2e_A_err"][:],
-            t2e_B=file["t2e"]["t2e_B"][:],
-            t2e_B_err=file["t2e"]["t2e_B_err"][:],
+            t2e=file["t2e"]["t2e"][()],
+            t2e_err=file["t2e"]["t2e_err"][()],
+            t2e_timestamp=file["t2e"]["t2e_timestamp"][()],
+            t2e_epoch=read_optional(file["t2e"], "t2e_epoch"),
+            t2e_trace_id=file["t2e"]["t2e_trace_id"][()],
+            t2e_A=file["t2e"]["t2e_A"][()],
+            t2e_A_err=file["t2e"]["t2e_A_err"][()],
+            t2e_B=file["t2e"]["t2e_B"][()],
+            t2e_B_err=file["t2e"]["t2e_B_err"][()],
+            t2e_tphi=read_optional(file["t2e"], "t2e_tphi"),
+            t2e_tphi_err=read_optional(file["t2e"], "t2e_tphi_err"),
+            t2e_t1_idx=read_optional(file["t2e"], "t2e_t1_idx"),
             t2e_avg=file.attrs["t2e_avg"],
             t2e_avg_err=file.attrs["t2e_avg_err"],
         )
@@ -134,15 +217,23 @@ def load_qubit(filepath: Path) -> Qubit:
         if isinstance(v, h5py._hl.base.Empty):
             setattr(qubit, k, None)
 
+    # files saved before the ragged layout hold zero padded 2-D arrays, their rows are kept whole
+    if qubit.t2r_offsets is None and np.ndim(qubit.t2r_As) == 2:
+        num_traces, num_freqs = qubit.t2r_As.shape
+        qubit.t2r_offsets = np.arange(num_traces + 1) * num_freqs
+        for name in T2R_COMPONENTS:
+            setattr(qubit, name, getattr(qubit, name).ravel())
+
     return qubit
 
 
-def load_qubits() -> list[Qubit]:
+@instrument
+def load_qubits(folder: Path = OUTPUT_FOLDER) -> list[Qubit]:
     """ """
     qubits: list[Qubit] = []
 
     # each file in the output folder is an hdf5 file storing qubit metadata
-    for qubit_file in OUTPUT_FOLDER.iterdir():
+    for qubit_file in folder.iterdir():
         if qubit_file.suffix not in (".h5", ".hdf5"):
             continue
 
@@ -151,12 +242,16 @@ def load_qubits() -> list[Qubit]:
     return qubits
 
 
+@instrument
 def save_qubit(qubit: Qubit, filepath: Path = None):
     """ """
     t1_arrs = [
         "t1",
         "t1_err",
+        "t1_low",
+        "t1_high",
         "t1_timestamp",
+        "t1_epoch",
         "t1_trace_id",
         "t1_A",
         "t1_A_err",
@@ -168,24 +263,33 @@ def save_qubit(qubit: Qubit, filepath: Path = None):
         "t2r",
         "t2r_err",
         "t2r_timestamp",
+        "t2r_epoch",
         "t2r_trace_id",
         "t2r_As",
         "t2r_A_errs",
         "t2r_freqs",
         "t2r_freq_errs",
+        "t2r_offsets",
         "t2r_B",
         "t2r_B_err",
+        "t2r_tphi",
+        "t2r_tphi_err",
+        "t2r_t1_idx",
     ]
 
     t2e_arrs = [
         "t2e",
         "t2e_err",
         "t2e_timestamp",
+        "t2e_epoch",
         "t2e_trace_id",
         "t2e_A",
         "t2e_A_err",
         "t2e_B",
         "t2e_B_err",
+        "t2e_tphi",
+        "t2e_tphi_err",
+        "t2e_t1_idx",
     ]
 
     if filepath is None:
@@ -194,14 +298,14 @@ def save_qubit(qubit: Qubit, filepath: Path = None):
                 filepath = qubit_file
                 break
 
-    with h5py.File(filepath, "a") as file:
+    with atomic_write(filepath) as file:
         # save attributes
         for key, value in qubit.__dict__.items():
             if key in []:  # ignore these attributes
                 pass
             elif key in t1_arrs:  # save T1 arrays
-                if value is None:  # create dummy stand-in dataset
-                    value = np.zeros(1)
+                if value is None:  # read back as None by load_qubit
+                    value = h5py.Empty("f8")
 
                 t1_group = file.require_group("t1")
 
@@ -210,8 +314,8 @@ def save_qubit(qubit: Qubit, filepath: Path = None):
 
                 t1_group.create_dataset(key, data=value)
             elif key in t2r_arrs:  # save T2R arrays
-                if value is None:  # create dummy stand-in dataset
-                    value = np.zeros(1)
+                if value is None:  # read back as None by load_qubit
+                    value = h5py.Empty("f8")
 
                 t2r_group = file.require_group("t2r")
 
@@ -220,8 +324,8 @@ def save_qubit(qubit: Qubit, filepath: Path = None):
 
                 t2r_group.create_dataset(key, data=value)
             elif key in t2e_arrs:  # save T2E arrays
-                if value is None:  # create dummy stand-in dataset
-                    value = np.zeros(1)
+                if value is None:  # read back as None by load_qubit
+                    value = h5py.Empty("f8")
 
                 t2e_group = file.require_group("t2e")
 
@@ -4,10 +4,8 @@ from pathlib import Path
 
 from lmfit import Model
 import numpy as np
-from uncertainties import ufloat, umath
-from scipy.constants import physical_constants
 
-from betata import plt
+from betata import plt, propagation
 from betata.qubit_measurements.traces import RPMTrace, load_rpm_trace
 
 DATA_FOLDER = Path(__file__).parents[3] / "data/qubit_measurements"
@@ -70,19 +68,8 @@ def signal_norm(signal, reference):
 
 
 def calculate_qubit_temperature(a_g, a_g_err, a_e, a_e_err, freq_q):
-    """ """
-    u_a_g = ufloat(a_g, a_g_err)
-    u_a_e = ufloat(a_e, a_e_err)
-
-    p_g = u_a_g / (u_a_e + u_a_g)
-    p_e = u_a_e / (u_a_e + u_a_g)
-    popn_ratio = p_g / p_e
-
-    kb_Hz_K, _, _ = physical_constants["Boltzmann constant in Hz/K"]
-
-    qubit_temperature_K = freq_q / (kb_Hz_K * umath.log(popn_ratio))
-
-    return qubit_temperature_K
+    """returns qubit temperature and its error in K"""
+    return propagation.qubit_temperature(a_g, a_g_err, a_e, a_e_err, freq_q)
 
 
 if __name__ == "__main__":
@@ -107,9 +94,14 @@ if __name__ == "__main__":
     a_e = fit_result_e.params["A"].value
     a_e_err = fit_result_e.params["A"].stderr
     freq_q = rpm_trace.qubit_frequency
-    qubit_temperature = calculate_qubit_temperature(a_g, a_g_err, a_e, a_e_err, freq_q)
+    qubit_temperature, qubit_temperature_err = calculate_qubit_temperature(
+        a_g, a_g_err, a_e, a_e_err, freq_q
+    )
     qubit_temperature_mK = qubit_temperature * 1e3
-    print(f"Qubit temperature: {qubit_temperature_mK:.2f} mK")
+    qubit_temperature_err_mK = qubit_temperature_err * 1e3
+    print(
+        f"Qubit temperature: {qubit_temperature_mK:.2f} ± {qubit_temperature_err_mK:.2f} mK"
+    )
 
     mag_g_norm = signal_norm(mag_g, mag_g)
     mag_e_norm = signal_norm(mag_e, mag_g)
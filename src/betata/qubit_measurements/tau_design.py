@@ -0,0 +1,164 @@
+"""
+Experiment design of the tau grid of T1 and T2E measurements.
+
+Given the running estimate of (A, T, B) and of the per-point population noise from prior
+traces, the Fisher information of `t1_fit_fn` or `t2e_fit_fn` predicts the standard error
+of T that a fit on any tau grid would reach. Points are added greedily from a dense
+candidate grid, each time picking the tau that most reduces the predicted variance of T,
+until the target error is met. The design is made robust to the estimate of T being
+rough by requiring the target at T scaled by each of T_SCALES.
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from betata.h5io import atomic_write
+from betata.profiling import instrument
+from betata.qubit_measurements.fit_t1_traces.fit_t1_traces import t1_fit_fn
+from betata.qubit_measurements.fit_t2e_traces.fit_t2e_traces import t2e_fit_fn
+from betata.qubit_measurements.qubit import OUTPUT_FOLDER
+
+TAU_GRID_FOLDER = OUTPUT_FOLDER / "tau_grids"
+
+# key = measurement kind, value = (fit function, name of the decay time attribute)
+FIT_FNS = {"t1": (t1_fit_fn, "T1"), "t2e": (t2e_fit_fn, "T2E")}
+
+T_SCALES = (0.7, 1.0, 1.4)  # the design must reach the target for T within this range
+TAU_MAX_FACTOR = 6  # candidate taus span [0, TAU_MAX_FACTOR * T]
+NUM_CANDIDATES = 600
+MAX_POINTS = 500
+
+
+@dataclass
+class TauDesign:
+    """ """
+
+    kind: str  # "t1" or "t2e"
+    tau: np.ndarray  # seconds, sorted
+    A: float
+    T: float
+    B: float
+    sigma: float  # population noise per point
+    target_err: float  # seconds
+    predicted_err: float  # seconds, worst case over T_SCALES
+
+    @property
+    def num_points(self) -> int:
+        """ """
+        return len(self.tau)
+
+
+def get_jacobian(kind: str, tau: np.ndarray, A, T, B) -> np.ndarray:
+    """derivatives of the fit function wrt (A, T, B), of shape (..., len(tau), 3)"""
+    tau = np.asarray(tau)
+    A, T = np.asarray(A)[..., None], np.asarray(T)[..., None]
+    decay = np.exp(-tau / T)
+    d_T = A * tau / T**2 * decay
+    if kind == "t1":
+        d_A = decay
+    else:
+        d_A, d_T = 1 - decay, -d_T
+    return np.stack(np.broadcast_arrays(d_A, d_T, np.ones_like(d_T)), axis=-1)
+
+
+def get_predicted_err(kind: str, tau: np.ndarray, A, T, B, sigma) -> float:
+    """standard error of T from the Fisher information of a fit on the tau grid"""
+    jacobian = get_jacobian(kind, tau, A, T, B)
+    information = jacobian.T @ jacobian / sigma**2
+    return float(np.sqrt(np.linalg.pinv(information)[1, 1]))
+
+
+def get_running_estimate(traces: list, kind: str, num_recent: int = 10) -> dict[str, float]:
+    """
+    median A, T and B of the last num_recent fitted traces that are not excluded, and the
+    pooled standard deviation of their fit residuals as the population noise sigma
+    """
+    fit_fn, T_name = FIT_FNS[kind]
+    traces = [tr for tr in traces if not tr.is_excluded and getattr(tr, T_name) is not None]
+    traces = traces[-num_recent:]
+    if not traces:
+        raise ValueError(f"No fitted {kind.upper()} traces to estimate parameters from.")
+
+    estimate = {
+        "A": np.median([tr.A for tr in traces]),
+        "T": np.median([getattr(tr, T_name) for tr in traces]),
+        "B": np.median([tr.B for tr in traces]),
+    }
+    residuals = [
+        tr.population - fit_fn(tr.tau, tr.A, getattr(tr, T_name), tr.B) for tr in traces
+    ]
+    num_dof = sum(len(r) - 3 for r in residuals)
+    estimate["sigma"] = np.sqrt(sum(np.sum(r**2) for r in residuals) / num_dof)
+    return estimate
+
+
+@instrument
+def design_tau_grid(
+    kind: str,
+    A: float,
+    T: float,
+    B: float,
+    sigma: float,
+    target_err: float,
+    tau_max: float = None,
+    num_candidates: int = NUM_CANDIDATES,
+    max_points: int = MAX_POINTS,
+) -> TauDesign:
+    """
+    fewest distinct taus in [0, tau_max] whose predicted T error is at most target_err
+    (relative to T) for every T in T * T_SCALES. If the target can't be met with
+    max_points, the grid of max_points is returned with its predicted error.
+    """
+    if tau_max is None:
+        tau_max = TAU_MAX_FACTOR * T
+    candidates = np.linspace(0, tau_max, num_candidates)
+    Ts = T * np.array(T_SCALES)
+    target_vars = (target_err * Ts / T) ** 2
+    jacobian = get_jacobian(kind, candidates, A, Ts, B)  # (num_T, num_candidates, 3)
+
+    # the three point seed makes the information matrix invertible
+    selected = [0, int(np.argmin(np.abs(candidates - T))), num_candidates - 1]
+    seed = jacobian[:, selected]
+    covariance = np.linalg.inv(np.einsum("kci,kcj->kij", seed, seed) / sigma**2)
+    is_available = np.ones(num_candidates, dtype=bool)
+    is_available[selected] = False
+
+    def get_worst_var_ratio(var):
+        """ """
+        return np.max(var / target_vars[:, None], axis=0)
+
+    while len(selected) < max_points:
+        if get_worst_var_ratio(covariance[:, 1, 1, None])[0] <= 1:
+            break
+
+        # variance of T after adding each candidate, by the Sherman-Morrison formula
+        u = np.einsum("kij,kcj->kci", covariance, jacobian)
+        denominator = sigma**2 + np.einsum("kci,kci->kc", jacobian, u)
+        var = covariance[:, 1, 1, None] - u[..., 1] ** 2 / denominator
+        ratio = np.where(is_available, get_worst_var_ratio(var), np.inf)
+
+        idx = int(np.argmin(ratio))
+        update = np.einsum("ki,kj->kij", u[:, idx], u[:, idx])
+        covariance -= update / denominator[:, idx, None, None]
+        selected.append(idx)
+        is_available[idx] = False
+
+    tau = np.sort(candidates[selected])
+    predicted_err = np.sqrt(np.max(covariance[:, 1, 1] / target_vars)) * target_err
+    return TauDesign(kind, tau, A, T, B, sigma, target_err, float(predicted_err))
+
+
+@instrument
+def save_tau_design(design: TauDesign, qubit_name: str, folder: Path = TAU_GRID_FOLDER):
+    """save the tau grid and the estimate it was designed for, for the acquisition code"""
+    filepath = Path(folder) / f"{qubit_name}_{design.kind}_tau.h5"
+    with atomic_write(filepath) as file:
+        if "tau" in file:
+            del file["tau"]
+        file.create_dataset("tau", data=design.tau)
+        file.attrs["qubit_name"] = qubit_name
+        for key in ("kind", "A", "T", "B", "sigma", "target_err", "predicted_err"):
+            file.attrs[key] = getattr(design, key)
+    return filepath
@@ -3,11 +3,32 @@
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
+from typing import Iterator
 
 import h5py
 import numpy as np
 
-from betata.qubit_measurements.qubit import Qubit, save_qubit
+from betata.prefetch import iter_prefetched, list_data_files, read_attr, sort_files
+from betata.profiling import instrument
+from betata.qubit_measurements.qubit import Qubit, clear_tphi, make_ragged, save_qubit
+
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+@instrument
+def parse_timestamp(timestamp: str) -> datetime:
+    """ """
+    return datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+
+
+def get_epochs(timestamps: list[datetime]) -> np.ndarray:
+    """
+    seconds since the unix epoch, with the naive timestamps read as UTC so that the
+    result does not depend on the time zone of the machine running the analysis
+    """
+    microseconds = np.array(timestamps, dtype="datetime64[us]").astype(np.int64)
+    return microseconds * 1e-6
 
 
 @dataclass
@@ -24,9 +45,10 @@ class RPMTrace:
     Q_e: np.ndarray
 
 
+@instrument
 def load_rpm_trace(filepath: Path) -> RPMTrace:
     """ """
-    with h5py.File(filepath) as file:
+    with h5py.File(filepath, "r") as file:
         rpm_trace = RPMTrace(
             qubit_name=file.attrs["qubit_name"],
             qubit_frequency=file.attrs["qubit_frequency"],
@@ -40,6 +62,11 @@ def load_rpm_trace(filepath: Path) -> RPMTrace:
     return rpm_trace
 
 
+def read_trace_id(filepath: Path) -> int:
+    """ """
+    return read_attr(filepath, "id")
+
+
 @dataclass
 class T1Trace:
     """ """
@@ -60,6 +87,8 @@ class T1Trace:
 
     T1: float = None
     T1_err: float = None
+    T1_low: float = None  # bootstrap confidence interval
+    T1_high: float = None
     A: float = None
     A_err: float = None
     B: float = None
@@ -67,10 +96,16 @@ class T1Trace:
 
     is_excluded: bool = False
 
+    @property
+    def contrast(self) -> float:
+        """fitted amplitude of the decay, None before fitting"""
+        return self.A
+
 
+@instrument
 def load_t1_trace(filepath: Path) -> T1Trace:
     """ """
-    with h5py.File(filepath) as file:
+    with h5py.File(filepath, "r") as file:
         t1_trace = T1Trace(
             id=file.attrs["id"],
             qubit_name=file.attrs["qubit_name"],
@@ -81,13 +116,14 @@ def load_t1_trace(filepath: Path) -> T1Trace:
             pi_pulse_length=file.attrs["pi_pulse_length"],
             readout_pulse_amplitude=file.attrs["readout_pulse_amplitude"],
             readout_pulse_length=file.attrs["readout_pulse_length"],
-            timestamp=datetime.strptime(file.attrs["timestamp"], "%Y-%m-%d %H:%M:%S"),
+            timestamp=parse_timestamp(file.attrs["timestamp"]),
             tau=file["tau"][:],
             population=file["population"][:],
         )
     return t1_trace
 
 
+@instrument
 def load_t1_traces(folder: Path) -> list[T1Trace]:
     """ """
     traces: list[T1Trace] = []
@@ -99,15 +135,27 @@ def load_t1_traces(folder: Path) -> list[T1Trace]:
     return sorted_traces
 
 
+def iter_t1_traces(folder: Path, prefetch: int = 4) -> Iterator[T1Trace]:
+    """T1 traces in id order, loaded up to prefetch files ahead of the consumer"""
+    filepaths = sort_files(list_data_files(folder), read_trace_id)
+    return iter_prefetched(filepaths, load_t1_trace, prefetch)
+
+
+@instrument
 def save_t1_results(traces: list[T1Trace], qubit: Qubit):
     """ """
     timestamp_0 = traces[0].timestamp
     qubit.t1_timestamp = np.array(
         [np.abs((trace.timestamp - timestamp_0).total_seconds()) for trace in traces]
     )
+    qubit.t1_epoch = get_epochs([trace.timestamp for trace in traces])
 
     qubit.t1 = np.array([tr.T1 for tr in traces])
     qubit.t1_err = np.array([tr.T1_err for tr in traces])
+    # bootstrap intervals are saved only if every trace has one
+    has_intervals = all(None not in [tr.T1_low, tr.T1_high] for tr in traces)
+    qubit.t1_low = np.array([tr.T1_low for tr in traces]) if has_intervals else None
+    qubit.t1_high = np.array([tr.T1_high for tr in traces]) if has_intervals else None
     qubit.t1_A = np.array([tr.A for tr in traces])
     qubit.t1_A_err = np.array([tr.A_err for tr in traces])
     qubit.t1_B = np.array([tr.B for tr in traces])
@@ -118,6 +166,7 @@ def save_t1_results(traces: list[T1Trace], qubit: Qubit):
     qubit.t1_avg = np.mean(qubit.t1)
     qubit.t1_avg_err = np.std(qubit.t1)
 
+    clear_tphi(qubit)  # pairs index into the previous T1 arrays
     save_qubit(qubit)
 
 
@@ -148,10 +197,16 @@ class T2ETrace:
 
     is_excluded: bool = False
 
+    @property
+    def contrast(self) -> float:
+        """fitted amplitude of the decay, None before fitting"""
+        return self.A
+
 
+@instrument
 def load_t2e_trace(filepath: Path) -> T2ETrace:
     """ """
-    with h5py.File(filepath) as file:
+    with h5py.File(filepath, "r") as file:
         t2e_trace = T2ETrace(
             id=file.attrs["id"],
             qubit_name=file.attrs["qubit_name"],
@@ -162,13 +217,14 @@ def load_t2e_trace(filepath: Path) -> T2ETrace:
             pi2_pulse_length=file.attrs["pi2_pulse_length"],
             readout_pulse_amplitude=file.attrs["readout_pulse_amplitude"],
             readout_pulse_length=file.attrs["readout_pulse_length"],
-            timestamp=datetime.strptime(file.attrs["timestamp"], "%Y-%m-%d %H:%M:%S"),
+            timestamp=parse_timestamp(file.attrs["timestamp"]),
             tau=file["tau"][:],
             population=file["population"][:],
         )
     return t2e_trace
 
 
+@instrument
 def load_t2e_traces(folder: Path) -> list[T2ETrace]:
     """ """
     traces: list[T2ETrace] = []
@@ -180,12 +236,20 @@ def load_t2e_traces(folder: Path) -> list[T2ETrace]:
     return sorted_traces
 
 
+def iter_t2e_traces(folder: Path, prefetch: int = 4) -> Iterator[T2ETrace]:
+    """T2E traces in id order, loaded up to prefetch files ahead of the consumer"""
+    filepaths = sort_files(list_data_files(folder), read_trace_id)
+    return iter_prefetched(filepaths, load_t2e_trace, prefetch)
+
+
+@instrument
 def save_t2e_results(traces: list[T2ETrace], qubit: Qubit):
     """ """
     timestamp_0 = traces[0].timestamp
     qubit.t2e_timestamp = np.array(
         [np.abs((trace.timestamp - timestamp_0).total_seconds()) for trace in traces]
     )
+    qubit.t2e_epoch = get_epochs([trace.timestamp for trace in traces])
 
     qubit.t2e = np.array([tr.T2E for tr in traces])
     qubit.t2e_err = np.array([tr.T2E_err for tr in traces])
@@ -199,6 +263,7 @@ def save_t2e_results(traces: list[T2ETrace], qubit: Qubit):
     qubit.t2e_avg = np.mean(qubit.t2e)
     qubit.t2e_avg_err = np.std(qubit.t2e)
 
+    clear_tphi(qubit, kinds=("t2e",))
     save_qubit(qubit)
 
 
@@ -232,10 +297,16 @@ class T2RTrace:
 
     is_excluded: bool = False
 
+    @property
+    def contrast(self) -> float:
+        """summed amplitudes of all frequency components, None before fitting"""
+        return None if self.As is None else float(np.sum(np.abs(self.As)))
+
 
+@instrument
 def load_t2r_trace(filepath: Path) -> T2RTrace:
     """ """
-    with h5py.File(filepath) as file:
+    with h5py.File(filepath, "r") as file:
         t2r_trace = T2RTrace(
             id=file.attrs["id"],
             qubit_name=file.attrs["qubit_name"],
@@ -247,13 +318,14 @@ def load_t2r_trace(filepath: Path) -> T2RTrace:
             pi2_pulse_length=file.attrs["pi2_pulse_length"],
             readout_pulse_amplitude=file.attrs["readout_pulse_amplitude"],
             readout_pulse_length=file.attrs["readout_pulse_length"],
-            timestamp=datetime.strptime(file.attrs["timestamp"], "%Y-%m-%d %H:%M:%S"),
+            timestamp=parse_timestamp(file.attrs["timestamp"]),
             tau=file["tau"][:],
             population=file["population"][:],
         )
     return t2r_trace
 
 
+@instrument
 def load_t2r_traces(folder: Path) -> list[T2RTrace]:
     """ """
     traces: list[T2RTrace] = []
@@ -265,37 +337,27 @@ def load_t2r_traces(folder: Path) -> list[T2RTrace]:
     return sorted_traces
 
 
+def iter_t2r_traces(folder: Path, prefetch: int = 4) -> Iterator[T2RTrace]:
+    """T2R traces in id order, loaded up to prefetch files ahead of the consumer"""
+    filepaths = sort_files(list_data_files(folder), read_trace_id)
+    return iter_prefetched(filepaths, load_t2r_trace, prefetch)
+
+
+@instrument
 def save_t2r_results(traces: list[T2RTrace], qubit: Qubit):
     """ """
     timestamp_0 = traces[0].timestamp
     qubit.t2r_timestamp = np.array(
         [np.abs((trace.timestamp - timestamp_0).total_seconds()) for trace in traces]
     )
-
-    max_n_freqs = 0
-    for trace in traces:
-        n_freqs = len(trace.freqs)
-        if n_freqs > max_n_freqs:
-            max_n_freqs = n_freqs
-
-    for trace in traces:  # pad 0s upto max_n_freqs to regularize array shapes
-        num_pad = max_n_freqs - len(trace.As)
-        padded_As = np.pad(trace.As, (0, num_pad))
-        padded_A_errs = np.pad(trace.A_errs, (0, num_pad))
-        padded_freqs = np.pad(trace.freqs, (0, num_pad))
-        padded_freq_errs = np.pad(trace.freq_errs, (0, num_pad))
-
-        trace.As = padded_As
-        trace.A_errs = padded_A_errs
-        trace.freqs = padded_freqs
-        trace.freq_errs = padded_freq_errs
+    qubit.t2r_epoch = get_epochs([trace.timestamp for trace in traces])
 
     qubit.t2r = np.array([tr.T2R for tr in traces])
     qubit.t2r_err = np.array([tr.T2R_err for tr in traces])
-    qubit.t2r_As = np.array([tr.As for tr in traces])
-    qubit.t2r_A_errs = np.array([tr.A_errs for tr in traces])
-    qubit.t2r_freqs = np.array([tr.freqs for tr in traces])
-    qubit.t2r_freq_errs = np.array([tr.freq_errs for tr in traces])
+    qubit.t2r_As, qubit.t2r_offsets = make_ragged([tr.As for tr in traces])
+    qubit.t2r_A_errs, _ = make_ragged([tr.A_errs for tr in traces])
+    qubit.t2r_freqs, _ = make_ragged([tr.freqs for tr in traces])
+    qubit.t2r_freq_errs, _ = make_ragged([tr.freq_errs for tr in traces])
     qubit.t2r_B = np.array([tr.B for tr in traces])
     qubit.t2r_B_err = np.array([tr.B_err for tr in traces])
 
@@ -304,4 +366,5 @@ def save_t2r_results(traces: list[T2RTrace], qubit: Qubit):
     qubit.t2r_avg = np.mean(qubit.t2r)
     qubit.t2r_avg_err = np.std(qubit.t2r)
 
+    clear_tphi(qubit, kinds=("t2r",))
     save_qubit(qubit)
@@ -0,0 +1,195 @@
+"""
+Vectorized fractional frequency shift (FFS) model for resonator temperature sweeps.
+
+    fr(T) = f0 * (1 + tls_shift + (alpha / 2) * qp_shift)
+    tls_shift = (Re Psi(1/2 + hf0 / (2 pi i kT)) - log(hf0 / (2 pi kT))) / (pi Q_TLS0)
+
+where Psi is the digamma function and qp_shift is the Mattis-Bardeen kernel from
+`mattis_bardeen`. The TLS term depends on T and f0 only through y = hf0 / (2 pi kT), so
+Re Psi(1/2 + iy) - log(y) is tabulated once on a log y grid and interpolated. All model
+functions broadcast, e.g. temperatures of shape (num_temps,) against parameters of shape
+(num_walkers, 1), so that a whole MCMC ensemble is evaluated in one call.
+"""
+
+import functools
+
+import emcee
+import lmfit
+import numpy as np
+from scipy.constants import h, k
+from scipy.special import psi
+
+from betata.profiling import instrument
+from betata.resonator_studies.mattis_bardeen import qp_frequency_shift
+from betata.resonator_studies.resonator import Resonator
+
+PARAM_NAMES = ("Q_TLS0", "alpha", "tc", "f0")
+
+# log(y) grid of the digamma table, with y = hf / (2 pi kT)
+LOG_Y_MIN, LOG_Y_MAX, NUM_Y = -8.0, 6.0, 8192
+DIGAMMA_HALF = -np.euler_gamma - 2 * np.log(2)  # Psi(1/2)
+
+
+@functools.cache
+def get_digamma_table() -> tuple[np.ndarray, np.ndarray]:
+    """log(y) grid and Re Psi(1/2 + iy) - log(y) on it"""
+    log_y = np.linspace(LOG_Y_MIN, LOG_Y_MAX, NUM_Y)
+    return log_y, psi(0.5 + 1j * np.exp(log_y)).real - log_y
+
+
+def get_digamma_term(y) -> np.ndarray:
+    """Re Psi(1/2 + iy) - log(y), interpolated from the table and asymptotic outside it"""
+    log_y_grid, table = get_digamma_table()
+    log_y = np.log(y)
+    term = np.interp(log_y, log_y_grid, table)
+    term = np.where(log_y < LOG_Y_MIN, DIGAMMA_HALF - log_y, term)
+    return np.where(log_y > LOG_Y_MAX, 1 / (24 * np.exp(2 * log_y)), term)
+
+
+def tls_frequency_shift(temperature, frequency, Q_TLS0) -> np.ndarray:
+    """TLS fractional frequency shift at broadcast temperatures (K) and frequencies (Hz)"""
+    y = h * np.asarray(frequency) / (2 * np.pi * k * np.asarray(temperature))
+    return get_digamma_term(y) / (np.pi * np.asarray(Q_TLS0))
+
+
+def ffs_fit_fn(temperature, Q_TLS0, alpha, tc, f0):
+    """ """
+    qp_shift = (np.asarray(alpha) / 2) * qp_frequency_shift(temperature, f0, tc)
+    return f0 * (1 + tls_frequency_shift(temperature, f0, Q_TLS0) + qp_shift)
+
+
+class FFSModel(lmfit.Model):
+    """ """
+
+    def __init__(self, *args, **kwargs):
+        """ """
+        name = self.__class__.__name__
+        kwargs.setdefault("independent_vars", ["temperature"])
+        super().__init__(func=ffs_fit_fn, name=name, *args, **kwargs)
+
+
+def get_ffs_data(resonator: Resonator) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """temperature, fr and fr_err of the traces not excluded"""
+    traces = [trace for trace in resonator.traces if not trace.is_excluded]
+    temperature = np.array([trace.temperature for trace in traces], dtype=float)
+    fr = np.array([trace.fr for trace in traces], dtype=float)
+    fr_err = np.array([trace.fr_err for trace in traces], dtype=float)
+    return temperature, fr, fr_err
+
+
+def draw_params(
+    params: lmfit.Parameters,
+    bounds: dict[str, tuple[float, float]],
+    num_draws: int,
+    rng: np.random.Generator,
+) -> dict[str, np.ndarray]:
+    """num_draws values of each param, uniform within its bounds if it varies"""
+    draws = {}
+    for name in PARAM_NAMES:
+        param = params[name]
+        if param.vary and name in bounds:
+            draws[name] = rng.uniform(*bounds[name], size=num_draws)
+        else:
+            draws[name] = np.full(num_draws, param.value)
+    return draws
+
+
+@instrument
+def fit_ffs(
+    resonator: Resonator,
+    init_params: lmfit.Parameters,
+    bounds: dict[str, tuple[float, float]],
+    num_iter: int = 200,
+    num_fits: int = 10,
+    weighted: bool = False,
+    seed: int = None,
+) -> lmfit.model.ModelResult:
+    """
+    Fit fr(T) of the resonator's traces from num_iter initial params drawn within bounds
+    (key = param name, value = (min, max)). All draws are scored with one broadcast model
+    call and only the num_fits best are refined by least squares, keeping the fit with the
+    lowest chi-square.
+    """
+    temperature, fr, fr_err = get_ffs_data(resonator)
+    weights = 1 / fr_err if weighted else None
+    rng = np.random.default_rng(seed)
+
+    draws = draw_params(init_params, bounds, num_iter, rng)
+    model_fr = ffs_fit_fn(temperature, **{name: v[:, None] for name, v in draws.items()})
+    residuals = (model_fr - fr) if weights is None else (model_fr - fr) * weights
+    best_idxs = np.argsort(np.sum(residuals**2, axis=-1))[:num_fits]
+
+    model = FFSModel()
+    best_result = None
+    for idx in best_idxs:
+        params = init_params.copy()
+        for name in PARAM_NAMES:
+            param = params[name]
+            param.value = np.clip(draws[name][idx], param.min, param.max)
+        result = model.fit(fr, params=params, temperature=temperature, weights=weights)
+        if best_result is None or result.chisqr < best_result.chisqr:
+            best_result = result
+    return best_result
+
+
+def log_probability(
+    theta: np.ndarray,
+    var_names: list[str],
+    fixed_params: dict[str, float],
+    temperature: np.ndarray,
+    fr: np.ndarray,
+    fr_err: np.ndarray,
+    bounds: dict[str, tuple[float, float]],
+) -> np.ndarray:
+    """
+    log posterior of walker positions theta of shape (num_walkers, len(var_names)), with
+    the other params held at fixed_params and uniform priors within bounds. For emcee with
+    vectorize=True.
+    """
+    theta = np.atleast_2d(theta)
+    params = {name: theta[:, idx, None] for idx, name in enumerate(var_names)}
+    is_inside = np.ones(len(theta), dtype=bool)
+    for name, (lower, upper) in bounds.items():
+        if name in params:
+            is_inside &= (params[name][:, 0] >= lower) & (params[name][:, 0] <= upper)
+
+    chi = (ffs_fit_fn(temperature, **params, **fixed_params) - fr) / fr_err
+    return np.where(is_inside, -0.5 * np.sum(chi**2, axis=-1), -np.inf)
+
+
+@instrument
+def sample_ffs(
+    resonator: Resonator,
+    result: lmfit.model.ModelResult,
+    bounds: dict[str, tuple[float, float]],
+    num_walkers: int = 250,
+    num_steps: int = 10000,
+    burn: int = 500,
+    thin: int = 25,
+    seed: int = None,
+) -> np.ndarray:
+    """
+    MCMC samples of shape (num_samples, len(result.var_names)) of the params varied in the
+    fit result, ordered as result.var_names, around its values. The params it held fixed
+    stay fixed. The whole ensemble is evaluated in one log_probability call per step.
+    """
+    temperature, fr, fr_err = get_ffs_data(resonator)
+    rng = np.random.default_rng(seed)
+    var_names = list(result.var_names)
+    fixed_params = {
+        name: result.params[name].value for name in PARAM_NAMES if name not in var_names
+    }
+    center = np.array([result.params[name].value for name in var_names])
+    scale = np.array([result.params[name].stderr or 0 for name in var_names])
+    scale = np.where(scale > 0, scale, 1e-4 * np.abs(center))
+    start = center + 1e-2 * scale * rng.standard_normal((num_walkers, len(var_names)))
+
+    sampler = emcee.EnsembleSampler(
+        num_walkers,
+        len(var_names),
+        log_probability,
+        args=(var_names, fixed_params, temperature, fr, fr_err, bounds),
+        vectorize=True,
+    )
+    sampler.run_mcmc(start, num_steps)
+    return sampler.get_chain(discard=burn, thin=thin, flat=True)
@@ -0,0 +1,318 @@
+"""
+Batched hanger (notch-type) S21 fits of all traces of a power/temperature sweep.
+
+After removing the cable delay `tau` stored with each trace, all traces are fitted at once
+with a vectorized Levenberg-Marquardt solve over an (n_traces, n_freq) array, to
+
+    S21 = a * exp(i alpha) * (1 - (Ql / absQc) * exp(i phi) / (1 + 2i Ql (f / fr - 1)))
+
+Qi is then found with the diameter correction method, 1 / Qi = 1 / Ql - cos(phi) / absQc.
+"""
+
+from collections import defaultdict
+from dataclasses import dataclass
+
+import numpy as np
+from scipy.ndimage import uniform_filter1d
+
+from betata import propagation
+from betata.profiling import instrument
+from betata.resonator_studies.trace import Trace
+
+PARAM_NAMES = ("fr", "Ql", "absQc", "phi", "a", "alpha")
+NUM_PARAMS = len(PARAM_NAMES)
+
+MAX_ITER = 200
+FTOL = 1e-10  # relative decrease in chi-square below which a fit has converged
+MAX_DAMPING = 1e10  # a fit whose steps keep failing up to this damping has converged
+# fraction of points at each end of the sweep used to guess background
+EDGE_FRACTION = 0.05
+SMOOTHING_POINTS = 5  # moving average used to locate the resonance in noisy traces
+
+
+@dataclass
+class HangerFitResult:
+    """fit results of n traces, params and stderr are ordered as in PARAM_NAMES"""
+
+    params: np.ndarray  # (n, NUM_PARAMS)
+    stderr: np.ndarray  # (n, NUM_PARAMS)
+    chisqr: np.ndarray  # (n,)
+    redchi: np.ndarray  # (n,)
+    nfevs: np.ndarray  # (n,) model evaluations per trace
+    success: np.ndarray  # (n,) bool
+
+    @property
+    def nfev(self) -> int:
+        """ """
+        return int(np.sum(self.nfevs))
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        """best fit values of the named parameter for all traces"""
+        return self.params[:, PARAM_NAMES.index(name)]
+
+
+def s21_hanger_batch(frequency: np.ndarray, params: np.ndarray, with_jacobian=False):
+    """
+    model of shape (n, m) for frequency of shape (n, m) and params of shape (n, NUM_PARAMS),
+    and its jacobian w.r.t. params of shape (n, m, NUM_PARAMS) if requested
+    """
+    fr, Ql, absQc, phi, a, alpha = (params[:, [idx]] for idx in range(NUM_PARAMS))
+    detuning = frequency / fr - 1
+    denominator = 1 + 2j * Ql * detuning
+    background = a * np.exp(1j * alpha)
+    resonance = (Ql / absQc) * np.exp(1j * phi) / denominator
+    model = background * (1 - resonance)
+
+    if not with_jacobian:
+        return model
+
+    d_resonance = background * resonance
+    jacobian = np.stack(
+        [
+            -d_resonance * 2j * Ql * frequency / (fr**2 * denominator),  # fr
+            -d_resonance * (1 / Ql - 2j * detuning / denominator),  # Ql
+            d_resonance / absQc,  # absQc
+            -1j * d_resonance,  # phi
+            model / a,  # a
+            1j * model,  # alpha
+        ],
+        axis=-1,
+    )
+    return model, jacobian
+
+
+def remove_delay(frequency: np.ndarray, s21: np.ndarray, tau: np.ndarray) -> np.ndarray:
+    """ """
+    return s21 * np.exp(-1j * 2 * np.pi * frequency * tau[:, None])
+
+
+def guess_params(frequency: np.ndarray, s21: np.ndarray) -> np.ndarray:
+    """
+    background from the ends of the sweep, fr at the point furthest from the background,
+    diameter and phi from the resonance circle at fr, and Ql from the half-power width
+    """
+    num_traces, num_points = s21.shape
+    num_edge_points = max(1, int(EDGE_FRACTION * num_points))
+    background = (
+        s21[:, :num_edge_points].mean(axis=1) + s21[:, -num_edge_points:].mean(axis=1)
+    ) / 2
+
+    resonance = 1 - s21 / background[:, None]
+    resonance_amp = uniform_filter1d(np.abs(resonance), SMOOTHING_POINTS, axis=1)
+    rows, peak_idxs = np.arange(num_traces), np.argmax(resonance_amp, axis=1)
+
+    fr = frequency[rows, peak_idxs]
+    diameter = resonance_amp[rows, peak_idxs]
+    phi = np.angle(resonance[rows, peak_idxs])
+
+    # Lorentzian |resonance|^2 falls to half its peak one half-linewidth away from fr
+    is_within_linewidth = resonance_amp**2 >= diameter[:, None] ** 2 / 2
+    frequency_step = np.abs(np.gradient(frequency, axis=1))
+    linewidth = np.sum(frequency_step * is_within_linewidth, axis=1)
+    Ql = fr / linewidth
+
+    return np.column_stack(
+        [fr, Ql, Ql / diameter, phi, np.abs(background), np.angle(background)]
+    )
+
+
+def get_param_scales(params: np.ndarray) -> np.ndarray:
+    """typical size of the changes in each param, used to condition the LM solve"""
+    fr, Ql, absQc, _, a, _ = params.T
+    ones = np.ones_like(fr)
+    return np.abs(np.column_stack([fr / Ql, Ql, absQc, ones, a, ones]))
+
+
+def get_residuals(frequency: np.ndarray, s21: np.ndarray, params: np.ndarray):
+    """real and imaginary residuals stacked into a real array of shape (n, 2m)"""
+    residuals = s21_hanger_batch(frequency, params) - s21
+    return np.concatenate([residuals.real, residuals.imag], axis=1)
+
+
+def get_scaled_jacobian(frequency: np.ndarray, params: np.ndarray):
+    """real jacobian of shape (n, 2m, NUM_PARAMS) w.r.t. params / get_param_scales(params)"""
+    _, jacobian = s21_hanger_batch(frequency, params, with_jacobian=True)
+    jacobian = np.concatenate([jacobian.real, jacobian.imag], axis=1)
+    return jacobian * get_param_scales(params)[:, None, :]
+
+
+def is_physical(params: np.ndarray) -> np.ndarray:
+    """fr, Ql, absQc and a must be positive"""
+    fr, Ql, absQc, _, a, _ = params.T
+    return np.isfinite(params).all(axis=1) & (fr > 0) & (Ql > 0) & (absQc > 0) & (a > 0)
+
+
+@instrument
+def fit_hanger_batch(
+    frequency: np.ndarray,
+    s21: np.ndarray,
+    params: np.ndarray = None,
+    max_iter: int = MAX_ITER,
+    ftol: float = FTOL,
+) -> HangerFitResult:
+    """
+    Fit delay-free s21 of shape (n, m) at frequency of shape (n, m). Initial params of shape
+    (n, NUM_PARAMS) are guessed if not given, or for rows that are not finite. Each LM
+    iteration solves the damped normal equations of all traces still running in one call.
+    """
+    num_traces, num_points = s21.shape
+    guesses = guess_params(frequency, s21)
+    if params is None:
+        params = guesses
+    else:
+        is_given = np.isfinite(params).all(axis=1, keepdims=True)
+        params = np.where(is_given, params, guesses)
+
+    residuals = get_residuals(frequency, s21, params)
+    chisqr = np.sum(residuals**2, axis=1)
+    nfevs = np.ones(num_traces, dtype=int)
+    damping = np.full(num_traces, 1e-3)
+    is_running = is_physical(params)
+    is_converged = np.zeros(num_traces, dtype=bool)
+    diagonal = np.arange(NUM_PARAMS)
+
+    for _ in range(max_iter):
+        idxs = np.flatnonzero(is_running)
+        if not idxs.size:
+            break
+
+        jacobian = get_scaled_jacobian(frequency[idxs], params[idxs])
+        jtj = np.einsum("kmi,kmj->kij", jacobian, jacobian)
+        gradient = np.einsum("kmi,km->ki", jacobian, residuals[idxs])
+
+        # Marquardt damping, proportional to the diagonal of J^T J
+        jtj_diagonal = np.maximum(jtj[:, diagonal, diagonal], np.finfo(float).tiny)
+        lhs = jtj.copy()
+        lhs[:, diagonal, diagonal] += damping[idxs, None] * jtj_diagonal
+        step = -np.linalg.solve(lhs, gradient[..., None])[..., 0]
+        new_params = params[idxs] + step * get_param_scales(params[idxs])
+
+        new_residuals = get_residuals(frequency[idxs], s21[idxs], new_params)
+        new_chisqr = np.sum(new_residuals**2, axis=1)
+        new_chisqr[~is_physical(new_params)] = np.inf
+        nfevs[idxs] += 1
+
+        is_improved = new_chisqr < chisqr[idxs]
+        has_converged = is_improved & (chisqr[idxs] - new_chisqr <= ftol * new_chisqr)
+
+        improved_idxs = idxs[is_improved]
+        params[improved_idxs] = new_params[is_improved]
+        residuals[improved_idxs] = new_residuals[is_improved]
+        chisqr[improved_idxs] = new_chisqr[is_improved]
+
+        damping[idxs] = np.where(is_improved, damping[idxs] / 10, damping[idxs] * 10)
+        damping[idxs] = np.maximum(damping[idxs], 1e-12)
+        has_converged |= damping[idxs] > MAX_DAMPING
+
+        is_converged[idxs[has_converged]] = True
+        is_running[idxs[has_converged]] = False
+
+    # wrap angles to (-pi, pi]
+    for name in ("phi", "alpha"):
+        idx = PARAM_NAMES.index(name)
+        params[:, idx] = np.angle(np.exp(1j * params[:, idx]))
+
+    # covariance scaled by the reduced chi-square, as done by lmfit
+    degrees_of_freedom = 2 * num_points - NUM_PARAMS
+    redchi = chisqr / degrees_of_freedom
+    jacobian = get_scaled_jacobian(frequency, params)
+    jtj = np.einsum("kmi,kmj->kij", jacobian, jacobian)
+    scaled_covariance = np.linalg.pinv(jtj) * redchi[:, None, None]
+    scales = get_param_scales(params)
+    stderr = np.sqrt(np.abs(scaled_covariance[:, diagonal, diagonal])) * scales
+
+    success = is_converged & is_physical(params) & np.isfinite(stderr).all(axis=1)
+    return HangerFitResult(params, stderr, chisqr, redchi, nfevs, success)
+
+
+def find_qi(params: np.ndarray, stderr: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Qi and its error from the diameter correction method, 1 / Qi = 1 / Ql - cos(phi) / absQc"""
+    _, Ql, absQc, phi, _, _ = params.T
+    Qi = 1 / (1 / Ql - np.cos(phi) / absQc)
+    partials = [Qi**2 / Ql**2, -(Qi**2) * np.cos(phi) / absQc**2, -(Qi**2) * np.sin(phi) / absQc]
+    errs = [stderr[:, idx] for idx in (1, 2, 3)]
+    return Qi, propagation.propagate_errors(partials, errs)
+
+
+def empty_result(num_traces: int) -> HangerFitResult:
+    """result of num_traces unfitted traces"""
+    return HangerFitResult(
+        params=np.full((num_traces, NUM_PARAMS), np.nan),
+        stderr=np.full((num_traces, NUM_PARAMS), np.nan),
+        chisqr=np.full(num_traces, np.nan),
+        redchi=np.full(num_traces, np.nan),
+        nfevs=np.zeros(num_traces, dtype=int),
+        success=np.zeros(num_traces, dtype=bool),
+    )
+
+
+def set_result(result: HangerFitResult, idxs, other: HangerFitResult, other_idxs=slice(None)):
+    """copy the results of the other_idxs traces in other to the idxs traces in result"""
+    result.params[idxs] = other.params[other_idxs]
+    result.stderr[idxs] = other.stderr[other_idxs]
+    result.chisqr[idxs] = other.chisqr[other_idxs]
+    result.redchi[idxs] = other.redchi[other_idxs]
+    result.nfevs[idxs] = other.nfevs[other_idxs]
+    result.success[idxs] = other.success[other_idxs]
+
+
+def fit_traces(traces: list[Trace], params: np.ndarray = None) -> HangerFitResult:
+    """
+    Fit all traces, stacked into one array per frequency grid size, without storing the
+    fitted values on the traces. Returns the fit results in the order of the traces.
+    """
+    result = empty_result(len(traces))
+
+    # key = number of points, value = indices of the traces with that many points
+    groups = defaultdict(list)
+    for idx, trace in enumerate(traces):
+        groups[len(trace.frequency)].append(idx)
+
+    for idxs in groups.values():
+        group = [traces[idx] for idx in idxs]
+        frequency = np.stack([trace.frequency for trace in group])
+        s21 = np.stack([trace.s21real + 1j * trace.s21imag for trace in group])
+        tau = np.array([trace.tau for trace in group])
+        s21 = remove_delay(frequency, s21, tau)
+
+        group_params = None if params is None else params[idxs]
+        set_result(result, idxs, fit_hanger_batch(frequency, s21, group_params))
+
+    return result
+
+
+def set_fitted_params(traces: list[Trace], result: HangerFitResult):
+    """store the fitted values on each trace, params of failed fits are set to None"""
+    Qi, Qi_err = find_qi(result.params, result.stderr)
+    for idx, trace in enumerate(traces):
+        values = dict(zip(PARAM_NAMES, result.params[idx]))
+        errs = dict(zip(PARAM_NAMES, result.stderr[idx]))
+        if not result.success[idx]:
+            values = dict.fromkeys(values)
+            errs = dict.fromkeys(errs)
+            Qi[idx], Qi_err[idx] = np.nan, np.nan
+
+        trace.background_amp = to_float(values["a"])
+        trace.background_phase = to_float(values["alpha"])
+        for name in ("fr", "Ql", "absQc", "phi"):
+            setattr(trace, name, to_float(values[name]))
+            setattr(trace, f"{name}_err", to_float(errs[name]))
+        trace.Qi, trace.Qi_err = to_float(Qi[idx]), to_float(Qi_err[idx])
+
+
+@instrument
+def fit_s21_batch(traces: list[Trace], params: np.ndarray = None) -> HangerFitResult:
+    """
+    Fit all traces at once and store the fitted values on each trace. Initial params of
+    shape (n, NUM_PARAMS) are optional. Returns the fit results in the order of the traces.
+    """
+    result = fit_traces(traces, params)
+    set_fitted_params(traces, result)
+    return result
+
+
+def to_float(value) -> float | None:
+    """NaN and None values become None"""
+    if value is None or np.isnan(value):
+        return None
+    return float(value)
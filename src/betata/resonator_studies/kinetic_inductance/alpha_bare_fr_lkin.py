@@ -5,12 +5,14 @@ Find bare resonator frequency and calculate kinetic inductance fraction alpha an
 """
 
 import numpy as np
-from uncertainties import ufloat
+import pandas as pd
 
+from betata import propagation
 from betata.resonator_studies.resonator import (
     Resonator,
     load_resonators,
-    save_resonator,
+    load_trace_table,
+    save_resonators,
 )
 
 # assign a reasonable-ish uncertainty for the simulated frequency
@@ -18,48 +20,79 @@ SIM_UNCERTAINTY = 0.05
 # since circle fit errors are negligible and do not capture the true uncertainty, assign a reasonable-ish uncertainty for measured frequency
 FR_BARE_UNCERTAINTY = 1e-5
 
-
-def find_alpha_bare(fr_geom: float, fr_bare: float) -> float:
-    """ """
-    return 1 - (fr_bare / fr_geom) ** 2
+# bare frequency is measured at highest power and lowest temperature
+MAX_TEMP = 15e-3
+MIN_POWER, MAX_POWER = -50, -40
 
 
-def find_l_kin(l_geom: float, alpha: float) -> float:
-    """ """
-    return (l_geom * alpha) / (1 - alpha)
+def find_frs_bare(trace_table: pd.DataFrame) -> pd.Series:
+    """mean fr of the included traces in the bare power/temperature window, per resonator"""
+    mask = (
+        ~trace_table["is_excluded"]
+        & (trace_table["temperature"] <= MAX_TEMP)
+        & (trace_table["power"] >= MIN_POWER)
+        & (trace_table["power"] <= MAX_POWER)
+    )
+    return trace_table[mask].groupby("resonator_name")["fr"].mean()
 
 
-def find_fr_bare(resonator: Resonator) -> float | None:
+def find_kinetic_inductance(
+    resonators: list[Resonator],
+    trace_table: pd.DataFrame,
+) -> list[Resonator]:
     """
+    Find fr_bare, alpha_bare, l_kin and l_sheet with errors for all resonators at once.
+    l_sheet is only found for resonators with N_sq, see the *_sheet_inductance notebooks.
     """
-    MAX_TEMP = 15e-3
-    MIN_POWER, MAX_POWER = -50, -40
-    # traces are pre-sorted by power (decreasing) and temperature (increasing)
-    frs_bare = []
-    for trace in resonator.traces:
-        if not trace.is_excluded:
-            if trace.temperature <= MAX_TEMP and MIN_POWER <= trace.power <= MAX_POWER:
-                frs_bare.append(trace.fr)
-    return np.mean(np.array(frs_bare))
+    frs_bare = find_frs_bare(trace_table)
+    names = [resonator.name for resonator in resonators]
+
+    def to_array(attr):
+        """missing (None) values become NaN"""
+        values = [getattr(resonator, attr) for resonator in resonators]
+        return np.array([np.nan if v is None else v for v in values], dtype=float)
+
+    fr_bare = frs_bare.reindex(names).to_numpy(dtype=float)
+    fr_geom, l_geom = to_array("fr_geom"), to_array("l_geom")
+    N_sq, N_sq_err = to_array("N_sq"), to_array("N_sq_err")
+
+    fr_bare_err = FR_BARE_UNCERTAINTY * fr_bare
+    fr_geom_err = SIM_UNCERTAINTY * fr_geom
+    l_geom_err = SIM_UNCERTAINTY * l_geom
+
+    alpha_bare, alpha_bare_err = propagation.alpha_bare(
+        fr_geom, fr_geom_err, fr_bare, fr_bare_err
+    )
+    l_kin, l_kin_err = propagation.l_kin(
+        l_geom, l_geom_err, fr_geom, fr_geom_err, fr_bare, fr_bare_err
+    )
+    l_sheet, l_sheet_err = propagation.l_sheet(
+        l_kin, l_kin_err, N_sq, SIM_UNCERTAINTY * N_sq + N_sq_err
+    )
+
+    results = {
+        "fr_bare": fr_bare,
+        "alpha_bare": alpha_bare,
+        "alpha_bare_err": alpha_bare_err,
+        "l_kin": l_kin,
+        "l_kin_err": l_kin_err,
+        "l_sheet": l_sheet,
+        "l_sheet_err": l_sheet_err,
+    }
+    for attr, values in results.items():
+        for resonator, value in zip(resonators, values):
+            # handle NaN values -> saved as None
+            setattr(resonator, attr, None if np.isnan(value) else float(value))
+
+    return resonators
 
 
 if __name__ == "__main__":
     """ """
 
-    resonators: list[Resonator] = load_resonators()
-
-    for resonator in resonators:
-        fr_bare = find_fr_bare(resonator)
-        u_fr_bare = ufloat(fr_bare, FR_BARE_UNCERTAINTY * fr_bare)
-        u_fr_geom = ufloat(resonator.fr_geom, SIM_UNCERTAINTY * resonator.fr_geom)
-        u_alpha_bare = find_alpha_bare(u_fr_geom, u_fr_bare)
-        u_l_geom = ufloat(resonator.l_geom, SIM_UNCERTAINTY * resonator.l_geom)
-        u_l_kin = find_l_kin(u_l_geom, u_alpha_bare)
+    resonators: list[Resonator] = load_resonators(with_traces=False)
+    trace_table = load_trace_table()
 
-        resonator.fr_bare = u_fr_bare.n
-        resonator.alpha_bare = u_alpha_bare.n
-        resonator.alpha_bare_err = u_alpha_bare.s
-        resonator.l_kin = u_l_kin.n
-        resonator.l_kin_err = u_l_kin.s
+    resonators = find_kinetic_inductance(resonators, trace_table)
 
-        save_resonator(resonator)
+    save_resonators(resonators)
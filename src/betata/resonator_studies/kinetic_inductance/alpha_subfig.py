@@ -16,32 +16,29 @@ from betata.resonator_studies.resonator import Resonator, load_resonators
 
 FIGSIZE = (8, 4)
 
-if __name__ == "__main__":
-    """ """
+# only use CPW resonators from certain films for this subfigure, for neatness
+INCLUDED_FILMS = ["F1", "F2", "F5", "F8", "F9", "F11", "F14"]
 
-    resonator_folder = Path(__file__).parents[4] / "out/resonator_studies"
-    figsavepath = resonator_folder / "alpha_pitch_fr_thickness.png"
 
-    resonators: list[Resonator] = load_resonators()
+def get_data(resonators: list[Resonator]) -> tuple[dict, dict]:
+    """fr_bare vs fr_geom and alpha_bare vs pitch, keyed by film thickness"""
     data_freq = defaultdict(dict)  # key=thickness, {key=fr_bare, value=fr_geom}
     data_alpha = defaultdict(dict)
 
-    # only use CPW resonators from certain films for this subfigure, for neatness
-    included_films = ["F1", "F2", "F5", "F8", "F9", "F11", "F14"]
     for resonator in resonators:
         film_name = resonator.name.split("_")[1]
-        if resonator.type == "CPW" and film_name in included_films:
+        if resonator.type == "CPW" and film_name in INCLUDED_FILMS:
             thickness = resonator.film_thickness
 
             data_freq[thickness][resonator.fr_bare] = resonator.fr_geom
             data_alpha[thickness][resonator.pitch] = resonator.alpha_bare
 
-    # create subfigure
-    fig, (ax_freq, ax_alpha) = plt.subplots(1, 2, figsize=FIGSIZE)
-    num_series = len(data_freq.keys())
-    blues = get_blues(num_series, start=0.35, stop=0.95)
+    return data_freq, data_alpha
+
 
-    # make fr_geom vs fr_bare subplot
+def plot_freq(data_freq: dict, ax_freq):
+    """fr_geom vs fr_bare subplot"""
+    blues = get_blues(len(data_freq), start=0.35, stop=0.95)
     sorted_data_freq = dict(sorted(data_freq.items()))
     for idx, (thickness, inner_dict) in enumerate(sorted_data_freq.items()):
         fr_bares_ghz = np.array(list(inner_dict.keys())) * 1e-9
@@ -64,7 +61,10 @@ if __name__ == "__main__":
     ax_freq.set_xticks([3, 5, 10, 15, 20, 25, 30])
     ax_freq.set_yticks([3, 4, 5, 6, 7, 8])
 
-    # make alpha vs pitch vs thickness subplot
+
+def plot_alpha(data_alpha: dict, ax_alpha):
+    """alpha vs pitch vs thickness subplot"""
+    blues = get_blues(len(data_alpha), start=0.35, stop=0.95)
     sorted_data_alpha = dict(sorted(data_alpha.items()))
     for idx, (thickness, inner_dict) in enumerate(sorted_data_alpha.items()):
         pitches_um = np.array(list(inner_dict.keys())) * 1e6
@@ -80,6 +80,22 @@ if __name__ == "__main__":
     ax_alpha.set_xticks([0, 2, 4, 6, 8, 10, 12, 14, 16])
     ax_alpha.set_yticks([0, 0.2, 0.4, 0.6, 0.8, 1.0])
 
+
+if __name__ == "__main__":
+    """ """
+
+    resonator_folder = Path(__file__).parents[4] / "out/resonator_studies"
+    figsavepath = resonator_folder / "alpha_pitch_fr_thickness.png"
+
+    resonators: list[Resonator] = load_resonators(with_traces=False)
+    data_freq, data_alpha = get_data(resonators)
+    num_series = len(data_freq.keys())
+
+    # create subfigure
+    fig, (ax_freq, ax_alpha) = plt.subplots(1, 2, figsize=FIGSIZE)
+    plot_freq(data_freq, ax_freq)
+    plot_alpha(data_alpha, ax_alpha)
+
     # add common legend
     #handles, labels = ax_freq.get_legend_handles_labels()
     #fig.legend(
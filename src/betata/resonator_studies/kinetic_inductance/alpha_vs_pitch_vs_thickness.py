@@ -11,7 +11,7 @@ import numpy as np
 from matplotlib import ticker
 
 from betata import plt, get_blues
-from betata.resonator_studies.resonator import Resonator, load_resonators
+from betata.resonator_studies.resonator import ResonatorFilter, iter_resonators
 
 if __name__ == "__main__":
     """ """
@@ -19,19 +19,17 @@ if __name__ == "__main__":
     resonator_folder = Path(__file__).parents[4] / "out/resonator_studies"
     figsavepath = resonator_folder / "alpha_vs_pitch.png"
 
-    resonators: list[Resonator] = load_resonators()
     data = defaultdict(dict)
 
     # only use CPW resonators from certain films for this subfigure, for neatness
-    included_films = ["F1", "F2", "F5", "F8", "F9", "F11", "F14"]
-    for resonator in resonators:
-        film_name = resonator.name.split("_")[1]
-        if resonator.type == "CPW" and film_name in included_films:
-            thickness = resonator.film_thickness
-            pitch = resonator.pitch
-            alpha = resonator.alpha_bare
-            alpha_err = resonator.alpha_bare_err
-            data[thickness][pitch] = (alpha, alpha_err)
+    included_films = ("F1", "F2", "F5", "F8", "F9", "F11", "F14")
+    resonator_filter = ResonatorFilter(types=("CPW",), films=included_films)
+    for resonator in iter_resonators(resonator_filter):
+        thickness = resonator.film_thickness
+        pitch = resonator.pitch
+        alpha = resonator.alpha_bare
+        alpha_err = resonator.alpha_bare_err
+        data[thickness][pitch] = (alpha, alpha_err)
 
     sorted_data = dict(sorted(data.items()))
 
@@ -0,0 +1,228 @@
+"""
+Sheet inductance vs film thickness of CPW resonators, fitted for the penetration depth.
+
+Ported from the fitting and plotting cells of sheet_inductance_vs_thickness.ipynb so that
+the panel can be drawn into a composite figure. As in the notebook, the weighted least
+squares fit seeds an emcee run and the panel reports the median and standard deviation of
+the posterior of the penetration depth. The seeded posterior is cached to out/cache and
+only resampled when the data or the emcee settings change.
+"""
+
+import hashlib
+import json
+from pathlib import Path
+
+import lmfit
+import matplotlib.ticker as ticker
+import numpy as np
+from scipy.constants import mu_0
+
+from betata import plt, get_blues
+from betata.profiling import instrument
+from betata.resonator_studies.resonator import Resonator, load_resonators
+
+PEN_DEPTH_FILEPATH = Path(__file__).parents[4] / "out/cache/penetration_depth.json"
+
+FIGSIZE = (8, 5)
+PEN_DEPTH_GUESS = 1.63e-6  # m
+PEN_DEPTH_BOUNDS = (1e-7, 1e-5)  # m, prior of the emcee run
+EMCEE_KWS = {
+    "nwalkers": 250,
+    "burn": 1000,
+    "steps": 10000,
+    "thin": 20,
+    "is_weighted": False,
+}
+EMCEE_SEED = 0
+# upper edges in μm of the film thickness bins, one color of the series per bin
+THICKNESS_BINS = [0.025, 0.06, 0.15, 0.3, 0.5, 1.2]
+
+
+def get_data(resonators: list[Resonator]) -> tuple[np.ndarray, ...]:
+    """thickness, l_sheet and l_sheet_err of the CPW resonators, sorted by thickness"""
+    data = [
+        (resonator.film_thickness, resonator.l_sheet, resonator.l_sheet_err)
+        for resonator in resonators
+        if resonator.type == "CPW"
+        and None not in [resonator.l_sheet, resonator.l_sheet_err]
+    ]
+    thicknesses, l_sheets, l_sheet_errs = np.array(sorted(data)).T
+    return thicknesses, l_sheets, l_sheet_errs
+
+
+def pen_depth_fit_fn(x, pen_depth):
+    """ """
+    return (mu_0 * pen_depth) / np.tanh(x / pen_depth)
+
+
+@instrument
+def fit_pen_depth(thicknesses, l_sheets, l_sheet_errs) -> lmfit.model.ModelResult:
+    """ """
+    return lmfit.Model(pen_depth_fit_fn).fit(
+        l_sheets,
+        x=thicknesses,
+        weights=1 / l_sheet_errs,
+        pen_depth=PEN_DEPTH_GUESS,
+    )
+
+
+def pen_depth_error_fn(params, x, data, l_sheet_errs):
+    """ """
+    pen_depth = params["pen_depth"].value
+    return (data - pen_depth_fit_fn(x, pen_depth)) / l_sheet_errs
+
+
+@instrument
+def sample_pen_depth(
+    thicknesses,
+    l_sheets,
+    l_sheet_errs,
+    result: lmfit.model.ModelResult,
+    seed: int = None,
+) -> lmfit.minimizer.MinimizerResult:
+    """emcee posterior of the penetration depth around the least squares fit result"""
+    params = result.params.copy()
+    params.add("__lnsigma", value=np.log(0.1), min=-np.inf, max=np.inf)
+    params["pen_depth"].set(min=PEN_DEPTH_BOUNDS[0], max=PEN_DEPTH_BOUNDS[1])
+    return lmfit.minimize(
+        pen_depth_error_fn,
+        params=params,
+        args=(thicknesses, l_sheets, l_sheet_errs),
+        method="emcee",
+        nan_policy="omit",
+        seed=seed,
+        **EMCEE_KWS,
+    )
+
+
+@instrument
+def plot_data(thicknesses, l_sheets, l_sheet_errs, pen_depth, pen_depth_err, ax=None):
+    """draws into ax if given, e.g. a panel of a composite figure"""
+    is_new_figure = ax is None
+    if is_new_figure:
+        fig, ax = plt.subplots(figsize=FIGSIZE)
+    else:
+        fig = ax.figure
+
+    blues = get_blues(len(THICKNESS_BINS) + 1, start=0.35, stop=0.95)
+    fit_color = get_blues(1, 1.0, 1.0)[0]
+
+    thicknesses_um = thicknesses * 1e6
+    color_idx = np.digitize(thicknesses_um, THICKNESS_BINS)
+    for thickness, idx in zip(*np.unique(thicknesses_um, return_index=True)):
+        is_thickness = thicknesses_um == thickness
+        ax.errorbar(
+            thicknesses_um[is_thickness],
+            l_sheets[is_thickness] * 1e12,
+            yerr=l_sheet_errs[is_thickness] * 1e12,
+            ls="",
+            color=blues[color_idx[idx]],
+            marker="o",
+            label="data",
+        )
+
+    thicknesses_dummy = np.linspace(20e-9, 2e-6, 101)
+    ax.plot(
+        thicknesses_dummy * 1e6,
+        pen_depth_fit_fn(thicknesses_dummy, pen_depth) * 1e12,
+        color=fit_color,
+        label="model",
+    )
+    ax.axhline(y=mu_0 * pen_depth * 1e12, color="k", linestyle="--", alpha=0.85)
+
+    ax.set_ylabel(r"$L_\mathrm{k/◻}$ (pH/$◻$)")
+    ax.set_xlabel(r"Film thickness (μm)")
+
+    ax.set_xscale("log")
+    ax.set_yscale("log")
+
+    pen_depth_str = (
+        r"$\mathrm{\lambda}$"
+        + f" = {pen_depth * 1e6:.2f} ± {pen_depth_err * 1e6:.2f} μm"
+    )
+    ax.text(
+        0.9,
+        0.95,
+        pen_depth_str,
+        horizontalalignment="right",
+        verticalalignment="top",
+        transform=ax.transAxes,
+    )
+
+    ax.set_ylim(1, 350)
+
+    ax.set_xticks([0.01, 0.1, 1.0])
+    ax.get_xaxis().set_major_formatter(ticker.ScalarFormatter())
+
+    ax.set_yticks([1, 3, 10, 30, 100, 300])
+    ax.get_yaxis().set_major_formatter(ticker.ScalarFormatter())
+
+    if is_new_figure:
+        fig.tight_layout()
+
+    return fig, ax
+
+
+def get_cache_key(thicknesses, l_sheets, l_sheet_errs, seed: int) -> str:
+    """hash of the data and emcee settings the posterior was sampled with"""
+    content = {
+        "data": [np.asarray(x).tolist() for x in (thicknesses, l_sheets, l_sheet_errs)],
+        "guess": PEN_DEPTH_GUESS,
+        "bounds": PEN_DEPTH_BOUNDS,
+        "emcee": EMCEE_KWS,
+        "seed": seed,
+    }
+    content_str = json.dumps(content, sort_keys=True)
+    return hashlib.sha256(content_str.encode()).hexdigest()
+
+
+def get_pen_depth(
+    thicknesses,
+    l_sheets,
+    l_sheet_errs,
+    seed: int = EMCEE_SEED,
+    filepath: Path = None,
+) -> tuple[float, float]:
+    """emcee median and stderr of the penetration depth, sampled once and cached to disk"""
+    filepath = PEN_DEPTH_FILEPATH if filepath is None else Path(filepath)
+    key = get_cache_key(thicknesses, l_sheets, l_sheet_errs, seed)
+    if filepath.exists():
+        with open(filepath) as file:
+            cache = json.load(file)
+        if cache["key"] == key:
+            return cache["pen_depth"], cache["pen_depth_err"]
+
+    result = fit_pen_depth(thicknesses, l_sheets, l_sheet_errs)
+    emcee_result = sample_pen_depth(thicknesses, l_sheets, l_sheet_errs, result, seed)
+    pen_depth = emcee_result.params["pen_depth"]
+    cache = {
+        "key": key,
+        "pen_depth": pen_depth.value,
+        "pen_depth_err": pen_depth.stderr,
+    }
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    with open(filepath, "w") as file:
+        json.dump(cache, file, indent=4)
+    return pen_depth.value, pen_depth.stderr
+
+
+def plot_panel(data: tuple[np.ndarray, ...], pen_depth, pen_depth_err, ax=None):
+    """sheet inductance vs film thickness with the cached emcee penetration depth"""
+    thicknesses, l_sheets, l_sheet_errs = data
+    return plot_data(
+        thicknesses, l_sheets, l_sheet_errs, pen_depth, pen_depth_err, ax=ax
+    )
+
+
+if __name__ == "__main__":
+    """ """
+
+    data = get_data(load_resonators(with_traces=False))
+    plot_panel(data, *get_pen_depth(*data))
+
+    figsavepath = (
+        Path(__file__).parents[4] / "out/resonator_studies/penetration_depth.png"
+    )
+    plt.savefig(figsavepath, dpi=300, bbox_inches="tight")
+
+    plt.show()
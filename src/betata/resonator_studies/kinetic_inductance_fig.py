@@ -1,68 +1,39 @@
 """ """
 
-from betata import plt
 from pathlib import Path
-from PIL import Image
+
+from betata import plt
+from betata.compose import compose_figure
+from betata.resonator_studies.kinetic_inductance import alpha_subfig, penetration_depth
+from betata.resonator_studies.resonator import load_resonators
 
 if __name__ == "__main__":
     """ """
 
-    fig_folder = Path(__file__).parents[3] / "out/resonator_studies"
-    fig_2ab_path = fig_folder / "alpha_pitch_fr_thickness.png"
-    fig_2c_path = fig_folder / "penetration_depth.png"
-
-    image_2ab = Image.open(fig_2ab_path)
-    image_2c = Image.open(fig_2c_path)
-    image_2c = image_2c.resize((image_2ab.width, image_2c.height))
-
-    fig, axes = plt.subplots(
-        nrows=2,
-        ncols=1,
-        height_ratios=(image_2ab.height, image_2c.height),
+    resonators = load_resonators(with_traces=False)
+    data_freq, data_alpha = alpha_subfig.get_data(resonators)
+    data_pen_depth = penetration_depth.get_data(resonators)
+    pen_depth, pen_depth_err = penetration_depth.get_pen_depth(*data_pen_depth)
+
+    # each panel is drawn straight into its subfigure
+    fig = compose_figure(
+        [
+            [
+                lambda subfig: alpha_subfig.plot_freq(data_freq, subfig.subplots()),
+                lambda subfig: alpha_subfig.plot_alpha(data_alpha, subfig.subplots()),
+            ],
+            [
+                lambda subfig: penetration_depth.plot_panel(
+                    data_pen_depth, pen_depth, pen_depth_err, ax=subfig.subplots()
+                )
+            ],
+        ],
         figsize=(8, 8),
+        labels=[["(a)", "(b)"], ["(c)"]],
+        height_ratios=(4, 5),
     )
 
-    # place images
-    images = [image_2ab, image_2c]
-    for i, ax in enumerate(axes.flat):
-        ax.imshow(images[i])
-        ax.axis("off")
-
-    label_fontsize = 16
-
-    # place text
-    axes[0].text(
-        -0.06,
-        0.97,
-        "(a)",
-        transform=axes[0].transAxes,
-        size=label_fontsize,
-        va="top",
-        ha="left",
-    )
-
-    axes[0].text(
-        0.44,
-        0.97,
-        "(b)",
-        transform=axes[0].transAxes,
-        size=label_fontsize,
-        va="top",
-        ha="left",
-    )
-
-    axes[1].text(
-        -0.06,
-        0.99,
-        "(c)",
-        transform=axes[1].transAxes,
-        size=label_fontsize,
-        va="top",
-        ha="left",
-    )
-
-    fig.tight_layout()
-    figsavepath = Path(__file__).parents[3] / "out/resonator_studies/fig2.png"
-    plt.savefig(figsavepath, dpi=600, bbox_inches="tight")
+    figsavepath = Path(__file__).parents[3] / "out/resonator_studies/fig2.pdf"
+    fig.savefig(figsavepath)
 
     plt.show()
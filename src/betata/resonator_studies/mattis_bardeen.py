@@ -0,0 +1,261 @@
+"""
+Tabulated Mattis-Bardeen kernels and a vectorized Q_int(T) evaluator for QPT fits.
+
+The quasiparticle loss and frequency shift depend on temperature and frequency only through
+t = T / Tc and x = hf / (k Tc). Both kernels are computed once on a dense (1 / t, log x) grid
+from the Mattis-Bardeen integrals with the BCS gap Delta(T), cached to disk, and then
+evaluated for any number of (T, f) points with one interpolation:
+
+    loss kernel  = (pi / 4) sigma_1 / sigma_2, which tends to exp(-Delta / kT) sinh(xi) K0(xi)
+                   with xi = hf / 2kT at low temperature
+    shift kernel = (sigma_2(T) - sigma_2(0)) / sigma_2(0), so that df / f = (alpha / 2) * shift
+
+Energies are in units of k Tc throughout. The grid covers hf < 2 Delta(T), i.e. no pair
+breaking. Below the lowest tabulated temperature, the log kernels are extrapolated linearly
+in 1 / t, following their exp(-Delta / kT) dependence.
+"""
+
+import functools
+from pathlib import Path
+
+import numpy as np
+from scipy.constants import h, hbar, k
+from scipy.integrate import quad
+from scipy.interpolate import RegularGridInterpolator
+from scipy.optimize import brentq
+from scipy.special import expit
+
+from betata.profiling import instrument
+
+KERNEL_FILEPATH = Path(__file__).parents[3] / "out/cache/mattis_bardeen_kernels.npz"
+
+GAP_0 = np.pi * np.exp(-np.euler_gamma)  # BCS gap at T = 0, ~1.764 k Tc
+
+# (T / Tc, hf / k Tc) grid, uniform in log(T / Tc) and log(hf / k Tc)
+T_MIN, T_MAX, NUM_T = 0.01, 0.95, 400
+X_MIN, X_MAX, NUM_X = 1e-3, 1.0, 120
+NUM_NODES = 256  # Gauss-Legendre nodes of the kernel integrals
+E_CUTOFF = 40  # occupation integrals stop at Delta + E_CUTOFF * kT
+
+# fixed-point iterations of the self-consistent photon number
+NUM_PHOTON_ITERATIONS = 20
+
+
+def fermi(energy, t):
+    """Fermi-Dirac occupation 1 / (exp(E / kT) + 1)"""
+    return expit(-energy / t)
+
+
+def get_gap_log_ratio(gap, t: float) -> float:
+    """
+    log(GAP_0 / gap) implied by the BCS gap equation at temperature t for a trial gap,
+    2 * integral of f(E) over v with E = gap * cosh(v)
+    """
+    v_max = np.arccosh(1 + E_CUTOFF * t / gap)
+    integral, _ = quad(lambda v: fermi(gap * np.cosh(v), t), 0, v_max, epsabs=0, limit=200)
+    return 2 * integral
+
+
+def find_gap(t: float) -> tuple[float, float]:
+    """BCS gap at temperature t, and log(GAP_0 / gap) found from the gap equation"""
+    if t >= 1:
+        return 0.0, np.inf
+    gap = brentq(
+        lambda gap: np.log(GAP_0 / gap) - get_gap_log_ratio(gap, t),
+        1e-9 * GAP_0,
+        GAP_0,
+        xtol=1e-15,
+    )
+    # the log ratio is computed from the occupations, so it stays exact when it is tiny
+    return gap, get_gap_log_ratio(gap, t)
+
+
+def get_quadrature(lower: np.ndarray, upper: np.ndarray):
+    """Gauss-Legendre nodes and weights of shape (..., NUM_NODES) on [lower, upper]"""
+    nodes, weights = np.polynomial.legendre.leggauss(NUM_NODES)
+    half_width = (np.asarray(upper) - np.asarray(lower))[..., None] / 2
+    midpoint = (np.asarray(upper) + np.asarray(lower))[..., None] / 2
+    return midpoint + half_width * nodes, half_width * weights
+
+
+def get_sigma_1(gap: np.ndarray, t: np.ndarray, x: np.ndarray) -> np.ndarray:
+    """sigma_1 / sigma_n, with E = gap * cosh(u) absorbing the 1 / sqrt(E^2 - gap^2) edge"""
+    u_max = np.arccosh(1 + E_CUTOFF * t / gap)
+    u, weights = get_quadrature(np.zeros_like(u_max), u_max)
+    gap, t, x = gap[..., None], t[..., None], x[..., None]
+
+    energy = gap * np.cosh(u)
+    occupation = fermi(energy, t) - fermi(energy + x, t)
+    density = (energy**2 + gap**2 + x * energy) / np.sqrt((energy + x) ** 2 - gap**2)
+    return (2 / x[..., 0]) * np.sum(weights * occupation * density, axis=-1)
+
+
+def get_sigma_2(gap: np.ndarray, t: np.ndarray, x: np.ndarray, thermal_only=False):
+    """
+    sigma_2 / sigma_n, with E = gap - x / 2 + (x / 2) * cos(theta) absorbing the inverse
+    square root edges at both ends of [gap - x, gap]. If thermal_only, only the (negative)
+    contribution of the thermal occupation f(E + x) is returned.
+    """
+    theta, weights = get_quadrature(np.zeros_like(gap), np.full_like(gap, np.pi))
+    gap, t, x = gap[..., None], t[..., None], x[..., None]
+
+    energy = gap - x / 2 + (x / 2) * np.cos(theta)
+    if thermal_only:
+        occupation = -2 * fermi(energy + x, t)
+    else:
+        occupation = 1 - 2 * fermi(energy + x, t)
+    density = (energy**2 + gap**2 + x * energy) / np.sqrt((gap + energy) * (energy + x + gap))
+    return (1 / x[..., 0]) * np.sum(weights * occupation * density, axis=-1)
+
+
+def compute_kernel_row(t: float, gap: float, gap_log_ratio: float, x: np.ndarray):
+    """(pi / 4) sigma_1 / sigma_2 and (sigma_2(T) - sigma_2(0)) / sigma_2(0) at t for all x"""
+    t_row, zero_t_row = np.full_like(x, t), np.full_like(x, 1e-12)
+    gap_row, gap_0_row = np.full_like(x, gap), np.full_like(x, GAP_0)
+
+    sigma_1 = get_sigma_1(gap_row, t_row, x)
+    sigma_2 = get_sigma_2(gap_row, t_row, x)
+    sigma_2_0 = get_sigma_2(gap_0_row, zero_t_row, x)
+
+    # sigma_2(T) - sigma_2(0) = thermal term + change of the T = 0 term with the gap.
+    # Where the gap barely moves, the latter is linearized to avoid cancellation.
+    thermal_shift = get_sigma_2(gap_row, t_row, x, thermal_only=True)
+    gap_shift = GAP_0 * np.expm1(-gap_log_ratio)
+    if abs(gap_shift) < 1e-4 * GAP_0:
+        d_gap = 1e-6 * GAP_0
+        d_sigma_2_d_gap = (
+            get_sigma_2(gap_0_row + d_gap, zero_t_row, x)
+            - get_sigma_2(gap_0_row - d_gap, zero_t_row, x)
+        ) / (2 * d_gap)
+        gap_term = d_sigma_2_d_gap * gap_shift
+    else:
+        gap_term = get_sigma_2(gap_row, zero_t_row, x) - sigma_2_0
+
+    loss = np.pi / 4 * sigma_1 / sigma_2
+    shift = (thermal_shift + gap_term) / sigma_2_0
+    return loss, shift
+
+
+def get_grid() -> tuple[np.ndarray, np.ndarray]:
+    """increasing Tc / T and log(hf / k Tc) grid points of the kernels"""
+    inverse_t = 1 / np.geomspace(T_MAX, T_MIN, NUM_T)
+    log_x = np.linspace(np.log(X_MIN), np.log(X_MAX), NUM_X)
+    return inverse_t, log_x
+
+
+@instrument
+def compute_kernels() -> dict[str, np.ndarray]:
+    """log loss and log(-shift) kernels on the (Tc / T, log(hf / k Tc)) grid"""
+    inverse_t, log_x = get_grid()
+    x = np.exp(log_x)
+
+    gaps = np.zeros(NUM_T)
+    log_loss = np.zeros((NUM_T, NUM_X))
+    log_neg_shift = np.zeros((NUM_T, NUM_X))
+    for idx, t in enumerate(1 / inverse_t):
+        gaps[idx], gap_log_ratio = find_gap(t)
+        loss, shift = compute_kernel_row(t, gaps[idx], gap_log_ratio, x)
+        log_loss[idx], log_neg_shift[idx] = np.log(loss), np.log(-shift)
+
+    return {
+        "inverse_t": inverse_t,
+        "log_x": log_x,
+        "gap": gaps,
+        "log_loss": log_loss,
+        "log_neg_shift": log_neg_shift,
+    }
+
+
+@functools.cache
+def load_kernels(filepath: Path = None) -> dict[str, RegularGridInterpolator]:
+    """interpolators of the log kernels, computed and cached to disk on first use"""
+    filepath = KERNEL_FILEPATH if filepath is None else Path(filepath)
+    kernels = None
+    if filepath.exists():
+        kernels = dict(np.load(filepath))
+        # recompute if the grid constants have changed since the kernels were cached
+        grid = get_grid()
+        is_same_grid = all(
+            kernels[name].shape == points.shape and np.allclose(kernels[name], points)
+            for name, points in zip(("inverse_t", "log_x"), grid)
+        )
+        if not is_same_grid:
+            kernels = None
+
+    if kernels is None:
+        kernels = compute_kernels()
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(filepath, **kernels)
+
+    grid = (kernels["inverse_t"], kernels["log_x"])
+    return {
+        name: RegularGridInterpolator(grid, kernels[name], bounds_error=False, fill_value=None)
+        for name in ("log_loss", "log_neg_shift")
+    }
+
+
+def evaluate_kernel(name: str, temperature, frequency, tc) -> np.ndarray:
+    """kernel at broadcast arrays of temperature (K), frequency (Hz) and tc (K)"""
+    temperature, frequency, tc = np.broadcast_arrays(temperature, frequency, tc)
+    inverse_t = np.clip(tc / temperature, 1 / T_MAX, None)
+    log_x = np.clip(np.log(h * frequency / (k * tc)), np.log(X_MIN), np.log(X_MAX))
+    points = np.stack([inverse_t.ravel(), log_x.ravel()], axis=-1)
+    log_kernel = load_kernels()[name](points).reshape(temperature.shape)
+    return np.exp(log_kernel)
+
+
+def qp_loss(temperature, frequency, tc) -> np.ndarray:
+    """(pi / 4) sigma_1 / sigma_2, so that 1 / Q_QP = delta_QP0 * qp_loss"""
+    return evaluate_kernel("log_loss", temperature, frequency, tc)
+
+
+def qp_frequency_shift(temperature, frequency, tc) -> np.ndarray:
+    """(sigma_2(T) - sigma_2(0)) / sigma_2(0), so that df / f = (alpha / 2) * shift"""
+    return -evaluate_kernel("log_neg_shift", temperature, frequency, tc)
+
+
+def photon_number(power, frequency, ql, qc):
+    """average photon number in a hanger resonator driven with power (W) at its frequency"""
+    omega = 2 * np.pi * np.asarray(frequency)
+    return 2 * np.asarray(ql) ** 2 * np.asarray(power) / (np.asarray(qc) * hbar * omega**2)
+
+
+def tls_loss(temperature, frequency, n, Q_TLS0, D_0, beta, beta2):
+    """
+    1 / Q_TLS = tanh(hf / 2kT) / (Q_TLS0 * (1 + n / n_c) ** beta), with the saturation
+    photon number n_c = D_0 * (T / 1 K) ** beta2
+    """
+    thermal = np.tanh(h * np.asarray(frequency) / (2 * k * np.asarray(temperature)))
+    n_c = D_0 * np.asarray(temperature) ** beta2
+    return thermal / (Q_TLS0 * (1 + np.asarray(n) / n_c) ** beta)
+
+
+@instrument
+def qint_vs_temp(temps, fit_params: dict, frs, powers, qc, qints=None) -> np.ndarray:
+    """
+    Q_int at broadcast arrays of temperatures (K), resonance frequencies (Hz) and powers at
+    the device (W), for QPT fit params (delta_QP0, Q_TLS0, D_0, tc, Q_other, beta, beta2),
+    1 / Q_int = 1 / Q_TLS + delta_QP0 * qp_loss + 1 / Q_other.
+    The photon number is found from the measured qints if given, otherwise
+    self-consistently from the model Q_int. Meant as a drop-in for rrfit's
+    QIntVsTemp_consistent, which the QPT fits and figures still use until
+    qpt_sweep_representative.get_qint_fit_deviation shows the two agree on stored fits.
+    """
+    temps, frs, powers, qc = np.broadcast_arrays(temps, frs, powers, qc)
+    params = {name: fit_params[name] for name in ("Q_TLS0", "D_0", "beta", "beta2")}
+    other_loss = fit_params["delta_QP0"] * qp_loss(temps, frs, fit_params["tc"])
+    other_loss = other_loss + 1 / fit_params["Q_other"]
+
+    def get_qint(qint_for_photons):
+        """ """
+        ql = 1 / (1 / qint_for_photons + 1 / qc)
+        n = photon_number(powers, frs, ql, qc)
+        return 1 / (tls_loss(temps, frs, n, **params) + other_loss)
+
+    if qints is not None:
+        return get_qint(np.broadcast_to(qints, temps.shape))
+
+    qint = 1 / (tls_loss(temps, frs, 0, **params) + other_loss)  # unsaturated start
+    for _ in range(NUM_PHOTON_ITERATIONS):
+        qint = get_qint(qint)
+    return qint
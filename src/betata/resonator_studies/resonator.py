@@ -1,14 +1,20 @@
 """ """
 
+from collections import defaultdict
 from dataclasses import dataclass
+import functools
 import json
 from pathlib import Path
+from typing import Iterator
 
 import h5py
 import lmfit
 import numpy as np
 import pandas as pd
 
+from betata.bootstrap import BootstrapResult, attach_intervals, bootstrap_batch
+from betata.h5io import atomic_write
+from betata.profiling import instrument
 from betata.resonator_studies.trace import Trace, load_fitted_traces
 
 DATA_FOLDER = Path(__file__).parents[3] / "data/resonator_studies"
@@ -79,40 +85,39 @@ class Resonator:
     ffs_fit_trace_ids: list[int] = None
 
 
-def load_resonator(filepath: Path) -> Resonator:
+def read_resonator(file: h5py.File) -> Resonator:
     """ """
-    with h5py.File(filepath, "a") as file:
-        resonator = Resonator(
-            name=file.attrs["name"],
-            type=file.attrs["type"],
-            design_name=file.attrs["design_name"],
-            cooldown_name=file.attrs["cooldown_name"],
-            film_thickness=file.attrs["film_thickness"],
-            pitch=file.attrs["pitch"],
-            length=file.attrs.get("length"),
-            width=file.attrs.get("width"),
-            fr_geom=file.attrs.get("fr_geom"),
-            l_geom=file.attrs.get("l_geom"),
-            fr_bare=file.attrs.get("fr_bare"),
-            l_kin=file.attrs.get("l_kin"),
-            l_kin_err=file.attrs.get("l_kin_err"),
-            alpha_bare=file.attrs.get("alpha_bare"),
-            alpha_bare_err=file.attrs.get("alpha_bare_err"),
-            N_sq=file.attrs.get("N_sq"),
-            N_sq_err=file.attrs.get("N_sq_err"),
-            l_sheet=file.attrs.get("l_sheet"),
-            l_sheet_err=file.attrs.get("l_sheet_err"),
-            p_ms=file.attrs.get("p_ms"),
-            p_ma=file.attrs.get("p_ma"),
-            p_sa=file.attrs.get("p_sa"),
-            p_sub=file.attrs.get("p_sub"),
-            line_attenuation=file.attrs.get("line_attenuation"),
-            traces=file.attrs.get("traces"),
-            qpt_fit_params=file.attrs.get("qpt_fit_params"),
-            ffs_fit_params=file.attrs.get("ffs_fit_params"),
-            qpt_fit_trace_ids=file.attrs.get("qpt_fit_trace_ids"),
-            ffs_fit_trace_ids=file.attrs.get("ffs_fit_trace_ids"),
-        )
+    resonator = Resonator(
+        name=file.attrs["name"],
+        type=file.attrs["type"],
+        design_name=file.attrs["design_name"],
+        cooldown_name=file.attrs["cooldown_name"],
+        film_thickness=file.attrs["film_thickness"],
+        pitch=file.attrs["pitch"],
+        length=file.attrs.get("length"),
+        width=file.attrs.get("width"),
+        fr_geom=file.attrs.get("fr_geom"),
+        l_geom=file.attrs.get("l_geom"),
+        fr_bare=file.attrs.get("fr_bare"),
+        l_kin=file.attrs.get("l_kin"),
+        l_kin_err=file.attrs.get("l_kin_err"),
+        alpha_bare=file.attrs.get("alpha_bare"),
+        alpha_bare_err=file.attrs.get("alpha_bare_err"),
+        N_sq=file.attrs.get("N_sq"),
+        N_sq_err=file.attrs.get("N_sq_err"),
+        l_sheet=file.attrs.get("l_sheet"),
+        l_sheet_err=file.attrs.get("l_sheet_err"),
+        p_ms=file.attrs.get("p_ms"),
+        p_ma=file.attrs.get("p_ma"),
+        p_sa=file.attrs.get("p_sa"),
+        p_sub=file.attrs.get("p_sub"),
+        line_attenuation=file.attrs.get("line_attenuation"),
+        traces=file.attrs.get("traces"),
+        qpt_fit_params=file.attrs.get("qpt_fit_params"),
+        ffs_fit_params=file.attrs.get("ffs_fit_params"),
+        qpt_fit_trace_ids=file.attrs.get("qpt_fit_trace_ids"),
+        ffs_fit_trace_ids=file.attrs.get("ffs_fit_trace_ids"),
+    )
 
     # handle None values
     for k, v in resonator.__dict__.items():
@@ -128,22 +133,124 @@ def load_resonator(filepath: Path) -> Resonator:
     return resonator
 
 
-def load_resonators() -> list[Resonator]:
+@instrument
+def load_resonator(filepath: Path) -> Resonator:
     """ """
-    resonators: list[Resonator] = []
+    with h5py.File(filepath, "r") as file:
+        return read_resonator(file)
+
+
+def get_attr(file: h5py.File, key: str):
+    """attribute value, None if it is missing or empty"""
+    value = file.attrs.get(key)
+    if isinstance(value, h5py._hl.base.Empty):
+        return None
+    return value
+
 
+@dataclass
+class ResonatorFilter:
+    """
+    Resonators to keep, checked against the file attributes before any object is built.
+    Fields left as None are not filtered on. film_thickness is an open (min, max) range,
+    as filtered by the scripts it replaces.
+    """
+
+    types: tuple[str, ...] = None
+    films: tuple[str, ...] = None  # e.g. ("F1", "F2"), the second field of the name
+    design_names: tuple[str, ...] = None
+    film_thickness: tuple[float, float] = None
+    has_qpt_fit_params: bool = None
+    has_ffs_fit_params: bool = None
+
+    def matches(self, file: h5py.File) -> bool:
+        """ """
+        if self.types is not None and get_attr(file, "type") not in self.types:
+            return False
+        if self.films is not None:
+            name_parts = str(get_attr(file, "name")).split("_")
+            if len(name_parts) < 2 or name_parts[1] not in self.films:
+                return False
+        if self.design_names is not None:
+            if get_attr(file, "design_name") not in self.design_names:
+                return False
+        if self.film_thickness is not None:
+            thickness = get_attr(file, "film_thickness")
+            min_thickness, max_thickness = self.film_thickness
+            if thickness is None or not min_thickness < thickness < max_thickness:
+                return False
+        for key in ("qpt_fit_params", "ffs_fit_params"):
+            has_key = getattr(self, f"has_{key}")
+            if has_key is not None and (get_attr(file, key) is not None) != has_key:
+                return False
+        return True
+
+
+@instrument
+def load_resonators(
+    with_traces: bool = True,
+    folder: Path = OUTPUT_FOLDER,
+) -> list[Resonator]:
+    """ """
+    return list(iter_resonators(with_traces=with_traces, folder=folder))
+
+
+def iter_resonators(
+    filter: ResonatorFilter = None,
+    with_traces: bool = False,
+    folder: Path = OUTPUT_FOLDER,
+) -> Iterator[Resonator]:
+    """
+    resonators in the folder that match the filter, one at a time. Files that do not match
+    are skipped after reading only the filtered attributes.
+    """
     # each file in the output folder is an hdf5 file storing resonator metadata
-    for resonator_file in OUTPUT_FOLDER.iterdir():
+    for resonator_file in folder.iterdir():
         if resonator_file.suffix not in (".h5", ".hdf5"):
             continue
 
-        resonator = load_resonator(resonator_file)
-        resonator.traces = load_fitted_traces(resonator_file)
-        resonators.append(resonator)
+        with h5py.File(resonator_file, "r") as file:
+            if filter is not None and not filter.matches(file):
+                continue
+            resonator = read_resonator(file)
+
+        if with_traces:
+            resonator.traces = load_fitted_traces(resonator_file)
+        yield resonator
+
+
+@instrument
+def load_trace_table(
+    folder: Path = OUTPUT_FOLDER,
+    columns: tuple[str, ...] = ("id", "power", "temperature", "fr", "is_excluded"),
+) -> pd.DataFrame:
+    """
+    Consolidated table of fitted trace attributes for all resonators in the folder, with
+    one row per trace. Traces are read as attributes only, no Trace objects are created.
+    """
+    table = {"resonator_name": []}
+    table.update({column: [] for column in columns})
+
+    for resonator_file in folder.iterdir():
+        if resonator_file.suffix not in (".h5", ".hdf5"):
+            continue
 
-    return resonators
+        with h5py.File(resonator_file, "r") as file:
+            for trace_data in file.values():
+                table["resonator_name"].append(resonator_file.stem)
+                for column in columns:
+                    value = trace_data.attrs.get(column)
+                    if isinstance(value, h5py._hl.base.Empty):
+                        value = None
+                    table[column].append(value)
 
+    trace_table = pd.DataFrame(table)
+    if "is_excluded" in trace_table:
+        trace_table["is_excluded"] = trace_table["is_excluded"].fillna(False).astype(bool)
+    return trace_table
 
+
+@instrument
 def save_resonator(resonator: Resonator, filepath: Path = None):
     """ """
 
@@ -153,7 +260,7 @@ def save_resonator(resonator: Resonator, filepath: Path = None):
                 filepath = resonator_file
                 break
 
-    with h5py.File(filepath, "a") as file:
+    with atomic_write(filepath) as file:
         for key, value in resonator.__dict__.items():
             # ignore these attributes
             if key in ["traces"]:
@@ -170,27 +277,97 @@ def save_resonator(resonator: Resonator, filepath: Path = None):
             file.attrs[key] = value
 
 
+@instrument
+def save_resonators(resonators: list[Resonator], folder: Path = OUTPUT_FOLDER):
+    """save many resonators, scanning the output folder only once to find their files"""
+    resonator_files = {
+        file.stem: file
+        for file in folder.iterdir()
+        if file.suffix in (".h5", ".hdf5")
+    }
+    for resonator in resonators:
+        save_resonator(resonator, resonator_files[resonator.name])
+
+
+@functools.cache
+def load_sim_table(design_name: str = None) -> pd.DataFrame:
+    """
+    Simulation table, read from disk once per session and indexed for lookup.
+    design_name = None returns the surface participation ratio table indexed by pitch,
+    otherwise the design's inductance table indexed by (l_s, pitch).
+    """
+    if design_name is None:
+        dataframe = pd.read_csv(SPR_SIM_FILEPATH)
+        return dataframe.set_index("pitch (um)").sort_index()
+
+    dataframe = pd.read_csv(DATA_FOLDER / f"{design_name}_lk_sim.csv")
+    return dataframe.set_index(["l_s (pH/sq)", "pitch (um)"]).sort_index()
+
+
+def interpolate_sim_table(
+    table: pd.DataFrame,
+    pitches_um: np.ndarray,
+    columns: list[str],
+) -> dict[str, np.ndarray]:
+    """
+    Linearly interpolate the columns of a table indexed by pitch at the given pitches.
+    Exact grid points return the tabulated values.
+    """
+    grid = table.index.to_numpy(dtype=float)
+    pitches_um = np.asarray(pitches_um, dtype=float)
+    if np.any((pitches_um < grid[0]) | (pitches_um > grid[-1])):
+        raise ValueError(f"Pitches {pitches_um} outside simulated range {grid[[0, -1]]} um")
+    return {col: np.interp(pitches_um, grid, table[col].to_numpy()) for col in columns}
+
+
+def add_spr_metadata_batch(resonators: list[Resonator]) -> list[Resonator]:
+    """ """
+    # round to suppress floating point error in the unit conversion
+    pitches_um = [round(resonator.pitch * 1e6, 6) for resonator in resonators]
+    columns = ["width (um)", "p_ms", "p_ma", "p_sa", "p_sub"]
+    spr = interpolate_sim_table(load_sim_table(), pitches_um, columns)
+    for idx, resonator in enumerate(resonators):
+        resonator.width = spr["width (um)"][idx] * 1e-6
+        resonator.p_ms = spr["p_ms"][idx]
+        resonator.p_ma = spr["p_ma"][idx]
+        resonator.p_sa = spr["p_sa"][idx]
+        resonator.p_sub = spr["p_sub"][idx]
+    return resonators
+
+
+def add_inductance_metadata_batch(resonators: list[Resonator]) -> list[Resonator]:
+    """ """
+    resonators_by_design = defaultdict(list)
+    for resonator in resonators:
+        resonators_by_design[resonator.design_name].append(resonator)
+
+    for design_name, design_resonators in resonators_by_design.items():
+        # geometric values are simulated with zero sheet inductance
+        table = load_sim_table(design_name).loc[0]
+        pitches_um = [round(resonator.pitch * 1e6, 6) for resonator in design_resonators]
+        lk = interpolate_sim_table(table, pitches_um, ["fr_geom (GHz)", "l (nH)"])
+        for idx, resonator in enumerate(design_resonators):
+            resonator.fr_geom = lk["fr_geom (GHz)"][idx] * 1e9
+            resonator.l_geom = lk["l (nH)"][idx] * 1e-9
+    return resonators
+
+
+@instrument
+def add_metadata(resonators: list[Resonator]) -> list[Resonator]:
+    """add simulated spr and inductance metadata to many resonators at once"""
+    resonators = add_spr_metadata_batch(resonators)
+    return add_inductance_metadata_batch(resonators)
+
+
 def add_spr_metadata(resonator: Resonator):
     """ """
-    df = pd.read_csv(SPR_SIM_FILEPATH)
-    pitch_um = round(resonator.pitch * 1e6)
-    metadata_row = df.loc[df["pitch (um)"] == pitch_um]
-    (resonator.width,) = metadata_row["width (um)"] * 1e-6
-    (resonator.p_ms,) = metadata_row["p_ms"]
-    (resonator.p_ma,) = metadata_row["p_ma"]
-    (resonator.p_sa,) = metadata_row["p_sa"]
-    (resonator.p_sub,) = metadata_row["p_sub"]
+    (resonator,) = add_spr_metadata_batch([resonator])
     return resonator
 
 
 def add_inductance_metadata(resonator: Resonator):
     """ """
-    lk_sim_filepath = DATA_FOLDER / f"{resonator.design_name}_lk_sim.csv"
-    df = pd.read_csv(lk_sim_filepath)
-    pitch_um = round(resonator.pitch * 1e6)
-    metadata_row = df.loc[(df["pitch (um)"] == pitch_um) & (df["l_s (pH/sq)"] == 0)]
-    (resonator.fr_geom,) = metadata_row["fr_geom (GHz)"] * 1e9
-    (resonator.l_geom,) = metadata_row["l (nH)"] * 1e-9
+    (resonator,) = add_inductance_metadata_batch([resonator])
     return resonator
 
 
@@ -212,23 +389,158 @@ def add_qpt_fit_params(resonator: Resonator, fit_params: lmfit.Parameters):
             delattr(resonator, attr)
 
 
-def map_ls_to_lk(
-    dataframe: pd.DataFrame,
-) -> dict[int, (np.ndarray, np.ndarray, lmfit.model.ModelResult)]:
+def add_ffs_fit_params(resonator: Resonator, fit_params: lmfit.Parameters):
     """ """
-    result = {}
+    fit_params_dict = {}
+    for param in fit_params.values():
+        param: lmfit.Parameter
+        fit_params_dict[param.name] = {}
+        fit_params_dict[param.name]["value"] = param.value
+        fit_params_dict[param.name]["stderr"] = param.stderr
+        fit_params_dict[param.name]["correl"] = param.correl
+    resonator.ffs_fit_params = fit_params_dict
+
 
-    def fit_fn(x, nsq):
-        return x * nsq * 1e-3  # convert pH to nH
+@dataclass
+class SheetInductanceFit:
+    """
+    Least squares fit of l_kin (nH) = l_sheet (pH/sq) * nsq * 1e-3, solved in closed form.
+    Mirrors the lmfit.model.ModelResult attributes used by the sheet inductance notebooks.
+    """
+
+    nsq: float
+    nsq_err: float
+    best_fit: np.ndarray
+    chisqr: float
+    ndata: int
+    ci_out: dict = None  # bootstrap intervals, in the format of lmfit's conf_interval
+    bootstrap: BootstrapResult = None
+
+    @property
+    def best_values(self) -> dict[str, float]:
+        """ """
+        return {"nsq": self.nsq}
+
+    @property
+    def params(self) -> lmfit.Parameters:
+        """ """
+        params = lmfit.Parameters()
+        params.add("nsq", value=self.nsq)
+        params["nsq"].stderr = self.nsq_err
+        return params
+
+    def fit_report(self) -> str:
+        """ """
+        nfree = self.ndata - 1
+        redchi = self.chisqr / nfree if nfree > 0 else np.nan
+        nsq_err_str = "None" if self.nsq_err is None else f"{self.nsq_err:.8g}"
+        return (
+            "[[Fit Statistics]]\n"
+            f"    # data points      = {self.ndata}\n"
+            f"    # variables        = 1\n"
+            f"    chi-square         = {self.chisqr:.8g}\n"
+            f"    reduced chi-square = {redchi:.8g}\n"
+            "[[Variables]]\n"
+            f"    nsq:  {self.nsq:.8g} +/- {nsq_err_str}"
+        )
 
-    for pitch, group in dataframe.groupby("pitch (um)"):
-        sorted_group = group.sort_values(by="l_s (pH/sq)", ascending=True)
-        l_sheet = np.array(sorted_group["l_s (pH/sq)"])
-        L = np.array(sorted_group["l (nH)"])
-        l_geom = L[0]
-        l_kin = L - l_geom
 
-        fit_result = lmfit.Model(fit_fn).fit(l_kin, x=l_sheet, nsq=50)
-        result[pitch] = (l_sheet, l_kin, fit_result)
+def fit_ls_to_lk(
+    dataframe: pd.DataFrame,
+    by: list[str],
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Fit N_sq for every group in `by` at once. Returns the input rows sorted by group and
+    l_s with added "l_kin (nH)" and "best_fit (nH)" columns, and a table of N_sq, N_sq_err,
+    chisqr and ndata per group.
+    """
+    rows = dataframe.sort_values(by=[*by, "l_s (pH/sq)"], ascending=True)
+    keys = [rows[col] for col in by]
+
+    # kinetic inductance is the increase over the geometric (l_s = 0) inductance
+    l_geom = rows["l (nH)"].groupby(keys).transform("first")
+    l_kin = rows["l (nH)"] - l_geom
+    x = rows["l_s (pH/sq)"] * 1e-3  # convert pH to nH
+
+    sum_xy = (x * l_kin).groupby(keys).transform("sum")
+    sum_xx = (x * x).groupby(keys).transform("sum")
+    best_fit = x * (sum_xy / sum_xx)
+    residual = l_kin - best_fit
+
+    per_group = pd.DataFrame(
+        {"sum_xy": x * l_kin, "sum_xx": x * x, "chisqr": residual**2, "ndata": 1}
+    ).groupby(keys).sum()
+    nsq = per_group["sum_xy"] / per_group["sum_xx"]
+
+    # stderr scaled by reduced chi-square, as in lmfit
+    nfree = per_group["ndata"] - 1
+    redchi = per_group["chisqr"] / nfree.where(nfree > 0)
+    nsq_err = np.sqrt(redchi / per_group["sum_xx"])
+
+    rows = rows.assign(**{"l_kin (nH)": l_kin, "best_fit (nH)": best_fit})
+    fits = pd.DataFrame(
+        {
+            "N_sq": nsq,
+            "N_sq_err": nsq_err,
+            "chisqr": per_group["chisqr"],
+            "ndata": per_group["ndata"],
+        }
+    )
+    return rows, fits
+
+
+def ls_to_lk_fit_fn(l_s, nsq):
+    """l_kin = N_sq * l_s"""
+    return nsq * l_s
+
+
+@instrument
+def map_ls_to_lk(
+    dataframe: pd.DataFrame,
+    num_replicates: int = 0,
+    seed: int = None,
+) -> dict[int, (np.ndarray, np.ndarray, SheetInductanceFit)]:
+    """bootstrap intervals of N_sq are attached to the fit results if num_replicates > 0"""
+    rows, fits = fit_ls_to_lk(dataframe, by=["pitch (um)"])
+    rng = np.random.default_rng(seed)
+
+    result = {}
+    for pitch, group in rows.groupby("pitch (um)", sort=True):
+        fit = fits.loc[pitch]
+        fit_result = SheetInductanceFit(
+            nsq=fit["N_sq"],
+            nsq_err=None if np.isnan(fit["N_sq_err"]) else fit["N_sq_err"],
+            best_fit=np.array(group["best_fit (nH)"]),
+            chisqr=fit["chisqr"],
+            ndata=int(fit["ndata"]),
+        )
+        if num_replicates > 0:
+            bootstrap = bootstrap_batch(
+                ls_to_lk_fit_fn,
+                np.array(group["l_s (pH/sq)"]) * 1e-3,  # convert pH to nH
+                np.array(group["l_kin (nH)"]),
+                [fit_result.nsq],
+                names=["nsq"],
+                num_replicates=num_replicates,
+                seed=rng,
+            )
+            attach_intervals(fit_result, bootstrap)
+        result[pitch] = (
+            np.array(group["l_s (pH/sq)"]),
+            np.array(group["l_kin (nH)"]),
+            fit_result,
+        )
 
     return result
+
+
+@instrument
+def map_ls_to_lk_designs(design_names: list[str]) -> pd.DataFrame:
+    """N_sq and N_sq_err for all pitches of all designs, fitted in a single pass"""
+    dataframe = pd.concat(
+        [load_sim_table(name).reset_index() for name in design_names],
+        keys=design_names,
+        names=["design_name", None],
+    ).reset_index(level="design_name")
+    _, fits = fit_ls_to_lk(dataframe, by=["design_name", "pitch (um)"])
+    return fits
@@ -7,7 +7,9 @@ import numpy as np
 from uncertainties import ufloat
 
 from betata import plt, get_purples
-from betata.resonator_studies.resonator import Resonator, load_resonator
+from betata.bootstrap import attach_intervals, bootstrap_model_result
+from betata.profiling import instrument
+from betata.resonator_studies.resonator import ResonatorFilter, iter_resonators
 
 ATA_COLOR = "darkorange"  # "#FF7900"
 BTA_COLOR = get_purples(1, 1.0, 1.0)[0]
@@ -22,23 +24,12 @@ P_SUB = 0.90  # assume negligible variation across resonator types/pitches
 REJECTION_THRESHOLD = 0.80  # relative error
 
 
-def load_resonators(folder: Path) -> list[Resonator]:
-    """ """
-    resonators = []
-    for file in folder.iterdir():
-        if file.suffix not in [".h5", ".hdf5"]:
-            continue
-
-        resonator = load_resonator(file)
-        resonators.append(resonator)
-    return resonators
-
-
 def fit_delta_surf_sub(x, tan_delta_surf, tan_delta_sub, p_sub):
     """ """
     return 1 / (x * tan_delta_surf + p_sub * tan_delta_sub)
 
 
+@instrument
 def plot_data(x, y, yerr, figsize=(9, 6), ylim=(1e5, 2e7), xlim=(3e-3, 0.5e-4)):
     """ """
 
@@ -121,19 +112,16 @@ if __name__ == "__main__":
     """ """
 
     resonator_folder = Path(__file__).parents[4] / "out/resonator_studies"
-    resonators = load_resonators(resonator_folder)
     figsavepath = resonator_folder / "wang_plot.png"
 
     min_thickness, max_thickness = 0e-9, 2000e-9
+    resonator_filter = ResonatorFilter(
+        film_thickness=(min_thickness, max_thickness),
+        has_qpt_fit_params=True,
+    )
 
     p_ms, q_tls0, q_tls0_err = [], [], []
-    for resonator in resonators:
-        if resonator.qpt_fit_params is None:
-            continue
-
-        if not min_thickness < resonator.film_thickness < max_thickness:
-            continue
-
+    for resonator in iter_resonators(resonator_filter, folder=resonator_folder):
         q_tls0_param = resonator.qpt_fit_params["Q_TLS0"]
 
         if q_tls0_param["stderr"] / q_tls0_param["value"] > REJECTION_THRESHOLD:
@@ -171,6 +159,10 @@ if __name__ == "__main__":
     print(result.fit_report())
     print(result.params.pretty_print())
 
+    # stderr of a one parameter fit to few resonators is unreliable, so bootstrap it too
+    attach_intervals(result, bootstrap_model_result(result, seed=0))
+    print(f"tan_delta_surf bootstrap interval: {result.ci_out['tan_delta_surf']}")
+
     axis = add_bulk_loss_tangent(
         SAPPHIRE_TAN_DELTA.n,
         axis,
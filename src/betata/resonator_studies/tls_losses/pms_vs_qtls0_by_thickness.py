@@ -7,7 +7,7 @@ import numpy as np
 from uncertainties import ufloat
 
 from betata import plt
-from betata.resonator_studies.resonator import Resonator, load_resonator
+from betata.resonator_studies.resonator import ResonatorFilter, iter_resonators
 
 ATA_COLOR = "#FF7900"
 BTA_COLOR = "#762A83"
@@ -31,18 +31,6 @@ COLOR_LIST = [
 ]
 
 
-def load_resonators(folder: Path) -> list[Resonator]:
-    """ """
-    resonators = []
-    for file in folder.iterdir():
-        if file.suffix not in [".h5", ".hdf5"]:
-            continue
-
-        resonator = load_resonator(file)
-        resonators.append(resonator)
-    return resonators
-
-
 def fit_delta_surf_sub(x, tan_delta_surf, tan_delta_sub, p_sub):
     """ """
     return 1 / (x * tan_delta_surf + p_sub * tan_delta_sub)
@@ -148,21 +136,18 @@ if __name__ == "__main__":
     """ """
 
     resonator_folder = Path(__file__).parents[4] / "out/resonator_studies"
-    resonators = load_resonators(resonator_folder)
     figsavepath = resonator_folder / "wang_plot_by_thickness.png"
 
     min_thickness, max_thickness = -np.inf, np.inf
+    resonator_filter = ResonatorFilter(
+        film_thickness=(min_thickness, max_thickness),
+        has_qpt_fit_params=True,
+    )
 
     # key: thickness, value: dict of lists p_ms, q_tls0, q_tls0_err
     data = defaultdict(lambda: defaultdict(list))
-    for resonator in resonators:
-        if resonator.qpt_fit_params is None:
-            continue
-
+    for resonator in iter_resonators(resonator_filter, folder=resonator_folder):
         thickness = resonator.film_thickness
-        if not min_thickness < thickness < max_thickness:
-            continue
-
         q_tls0_param = resonator.qpt_fit_params["Q_TLS0"]
     
         if q_tls0_param["stderr"] / q_tls0_param["value"] > REJECTION_THRESHOLD:
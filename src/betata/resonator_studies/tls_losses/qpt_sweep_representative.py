@@ -11,6 +11,7 @@ from rrfit.fitfns import dBmtoW
 from rrfit.waterfall import QIntVsTemp_consistent
 
 from betata import plt, get_purples
+from betata.resonator_studies.mattis_bardeen import qint_vs_temp
 from betata.resonator_studies.resonator import Resonator, load_resonator
 from betata.resonator_studies.trace import Trace, load_fitted_traces
 
@@ -48,6 +49,24 @@ def get_qint_fit(resonator, temps, frs, qints, power, qc):
     return temps_dummy, np.array(qint_fit)
 
 
+def get_qint_fit_deviation(resonator, temps, frs, qints, power, qc) -> float:
+    """
+    largest relative difference between the Q_int fit of get_qint_fit (rrfit) and
+    mattis_bardeen.qint_vs_temp evaluated with the same params and inputs
+    """
+    temps_dummy, qint_fit = get_qint_fit(resonator, temps, frs, qints, power, qc)
+    fit_params = {name: value["value"] for name, value in resonator.qpt_fit_params.items()}
+    qint_model = qint_vs_temp(
+        temps_dummy,
+        fit_params,
+        np.interp(temps_dummy, temps, frs),
+        dBmtoW(power - resonator.line_attenuation),
+        qc,
+        np.interp(temps_dummy, temps, qints),
+    )
+    return float(np.max(np.abs(qint_model / qint_fit - 1)))
+
+
 if __name__ == "__main__":
     """ """
 
@@ -83,6 +102,8 @@ if __name__ == "__main__":
         temps_mK = temps * 1e3
 
         temps_dummy, qint_fit = get_qint_fit(resonator, temps, frs, qints, power, qc)
+        deviation = get_qint_fit_deviation(resonator, temps, frs, qints, power, qc)
+        print(f"{power} dBm: qint_vs_temp deviates from rrfit by up to {deviation:.1e}")
         temps_dummy_mK = temps_dummy * 1e3
 
         ax.errorbar(
@@ -3,11 +3,16 @@
 from dataclasses import dataclass
 from pathlib import Path
 from operator import attrgetter
+from typing import Iterator
 
 import h5py
 import numpy as np
 from rrfit.plotfns import plot_hangerfit
 
+from betata.h5io import atomic_write
+from betata.prefetch import iter_prefetched, list_data_files, sort_files
+from betata.profiling import instrument
+
 
 @dataclass
 class Trace:
@@ -43,9 +48,10 @@ class Trace:
     is_excluded: bool = None
 
 
+@instrument
 def load_trace(filepath: Path):
     """ """
-    with h5py.File(filepath) as file:
+    with h5py.File(filepath, "r") as file:
         trace = Trace(
             filename=filepath.stem,
             resonator_name=file.attrs["resonator_name"],
@@ -70,6 +76,7 @@ def sort_traces_pt(traces: list[Trace]):
     return sorted(traces, key=sort_fn)
 
 
+@instrument
 def load_traces(folder: Path):
     """ """
     traces = []
@@ -85,10 +92,28 @@ def load_traces(folder: Path):
     return sorted_traces
 
 
+def read_power_temperature(filepath: Path) -> tuple[float, float]:
+    """sort key of a raw data trace, power (decreasing) then temperature (increasing)"""
+    with h5py.File(filepath, "r") as file:
+        return -file.attrs["power"], np.mean(file["temperature"][:])
+
+
+def iter_traces(folder: Path, prefetch: int = 4) -> Iterator[Trace]:
+    """
+    raw data traces in the order and with the ids of `load_traces`, loaded up to prefetch
+    files ahead of the consumer
+    """
+    filepaths = sort_files(list_data_files(folder), read_power_temperature)
+    for idx, trace in enumerate(iter_prefetched(filepaths, load_trace, prefetch)):
+        trace.id = idx
+        yield trace
+
+
+@instrument
 def load_fitted_traces(filepath: Path):
     """ """
     traces = []
-    with h5py.File(filepath) as file:
+    with h5py.File(filepath, "r") as file:
         for trace_name in file.keys():
             trace_data = file[trace_name]
             trace = Trace(
@@ -117,9 +142,10 @@ def load_fitted_traces(filepath: Path):
     return sort_traces_pt(traces)
 
 
+@instrument
 def save_traces(traces: list[Trace], filepath: Path):
     """ """
-    with h5py.File(filepath, "a") as file:
+    with atomic_write(filepath) as file:
         for trace in traces:
             trace_group = file.require_group(trace.filename)
             for key, value in trace.__dict__.items():
@@ -131,12 +157,13 @@ def save_traces(traces: list[Trace], filepath: Path):
                     trace_group.attrs[key] = value
 
 
+@instrument
 def plot_fitted_trace(trace: Trace, resonator_name: str):
     """ """
     folder = Path(__file__).parents[3] / f"data/resonator_studies/{resonator_name}"
     for filepath in folder.iterdir():
         if filepath.stem == trace.filename:
-            with h5py.File(filepath) as file:
+            with h5py.File(filepath, "r") as file:
                 trace.frequency = file["frequency"][:]
                 trace.s21imag = file["s21imag"][:]
                 trace.s21real = file["s21real"][:]
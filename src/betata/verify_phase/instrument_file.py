@@ -0,0 +1,99 @@
+"""Read column data from instrument text exports (XRD .dql, PPMS .dat)"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from betata.profiling import instrument
+
+DATA_HEADER = "[Data]"
+CHUNKSIZE = 100_000  # rows parsed per chunk
+
+
+def find_data_offset(filepath: Path, header: str = DATA_HEADER) -> int | None:
+    """
+    Return the byte offset of the first line after `header` (the column names row),
+    found in a single streaming pass that stops as soon as the header is seen.
+    """
+    with open(filepath, "rb") as file:
+        header_bytes = header.encode()
+        for line in iter(file.readline, b""):
+            if line.startswith(header_bytes):
+                return file.tell()
+    return None
+
+
+def get_cache_path(filepath: Path, usecols: tuple[int, ...]) -> Path:
+    """cached columns are stored next to the source file, keyed by the column indices"""
+    cols_str = "_".join(str(col) for col in usecols)
+    return filepath.with_name(f"{filepath.name}.cols_{cols_str}.npy")
+
+
+@instrument
+def read_columns(
+    filepath: Path,
+    usecols: tuple[int, ...],
+    header: str = DATA_HEADER,
+    chunksize: int = CHUNKSIZE,
+    cache: bool = True,
+) -> np.ndarray:
+    """
+    Return a 2D float array of shape (num_rows, len(usecols)) with columns in the order
+    given by `usecols`. Only the requested columns are parsed. Empty fields become NaN.
+    """
+    filepath = Path(filepath)
+    usecols = tuple(usecols)
+    cache_path = get_cache_path(filepath, usecols)
+
+    # reuse cached columns unless the source file has changed since they were cached
+    if cache and cache_path.exists():
+        if cache_path.stat().st_mtime >= filepath.stat().st_mtime:
+            return np.load(cache_path)
+
+    offset = find_data_offset(filepath, header)
+    if offset is None:
+        raise ValueError(f"Header '{header}' not found in {filepath}")
+
+    with open(filepath, "rb") as file:
+        file.seek(offset)
+        reader = pd.read_csv(
+            file,
+            sep=",",
+            header=None,
+            skiprows=1,  # column names row
+            usecols=usecols,
+            dtype=np.float64,
+            engine="c",
+            chunksize=chunksize,
+        )
+        # pandas returns usecols in file order, reorder to match the requested order
+        chunks = [chunk[list(usecols)].to_numpy() for chunk in reader]
+
+    if chunks:
+        data = np.concatenate(chunks)
+    else:
+        data = np.empty((0, len(usecols)))
+
+    if cache:
+        np.save(cache_path, data)
+
+    return data
+
+
+def read_instrument_file(
+    filepath: Path,
+    colmap: dict[int, str],
+    header: str = DATA_HEADER,
+    chunksize: int = CHUNKSIZE,
+    cache: bool = True,
+) -> pd.DataFrame:
+    """colmap: key = column index in the file, value = column name in the returned DataFrame"""
+    data = read_columns(
+        filepath,
+        usecols=tuple(colmap.keys()),
+        header=header,
+        chunksize=chunksize,
+        cache=cache,
+    )
+    return pd.DataFrame(data, columns=list(colmap.values()))
@@ -0,0 +1,204 @@
+"""
+Superconducting transition temperatures of all hall bar samples measured in the PPMS.
+
+The transport files of every sample listed in ppms_samples.toml are combined, sorted by
+temperature and stacked into NaN padded arrays, so the resistivity, the normal state
+resistivity and the transition temperatures of all samples are computed at once. The
+normal state resistivity is the median over NORMAL_RANGE times the temperature of the
+steepest rise in resistivity (or over the sample's normal_range), and Tc at a fraction
+of it is interpolated at the last crossing below that window.
+
+    python -m betata.verify_phase.ppms
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+import tomllib
+
+import numpy as np
+import pandas as pd
+
+from betata import propagation
+from betata.profiling import instrument
+from betata.resonator_studies.resonator import Resonator
+from betata.verify_phase.instrument_file import read_instrument_file
+
+DATA_FOLDER = Path(__file__).parents[3] / "data/verify_phase"
+OUTPUT_FOLDER = Path(__file__).parents[3] / "out/verify_phase"
+SAMPLES_FILEPATH = Path(__file__).parent / "ppms_samples.toml"
+
+COLMAP = {3: "temperature", 20: "resistance", 15: "resistance_std"}
+FRACTIONS = (0.1, 0.5, 0.9)  # of the normal state resistivity
+NORMAL_RANGE = (1.2, 1.6)  # relative to the temperature of the steepest rise
+SLOPE_SPAN = 5  # points the slope of the resistivity is taken over
+THICKNESS_TOLERANCE = 10e-9  # m, for matching samples to resonators by film thickness
+
+
+@dataclass
+class PPMSSample:
+    """ """
+
+    name: str
+    film_thickness: float  # m
+    channel_length: float  # m
+    channel_width: float  # m
+    files: list[str]
+    normal_range: tuple[float, float] = None  # K
+
+    @property
+    def resistivity_factor(self) -> float:
+        """from resistance in ohm to resistivity in microohm.cm"""
+        return self.film_thickness * self.channel_width / self.channel_length * 1e8
+
+
+def load_samples(filepath: Path = SAMPLES_FILEPATH) -> list[PPMSSample]:
+    """ """
+    with open(filepath, "rb") as file:
+        samples = tomllib.load(file)["samples"]
+    return [PPMSSample(name=name, **sample) for name, sample in samples.items()]
+
+
+@instrument
+def load_transport(
+    samples: list[PPMSSample], folder: Path = DATA_FOLDER
+) -> dict[str, np.ndarray]:
+    """
+    temperature, resistance and resistance_std of all samples, each of shape
+    (num_samples, max_num_points), sorted by temperature and padded with NaN
+    """
+    tables = []
+    for sample in samples:
+        data = [
+            read_instrument_file(Path(folder) / name, COLMAP) for name in sample.files
+        ]
+        data = pd.concat(data).dropna(subset=["temperature", "resistance"])
+        tables.append(data.sort_values(by="temperature"))
+
+    max_num_points = max(len(table) for table in tables)
+    transport = {}
+    for column in COLMAP.values():
+        transport[column] = np.full((len(samples), max_num_points), np.nan)
+        for idx, table in enumerate(tables):
+            transport[column][idx, : len(table)] = table[column].to_numpy()
+    return transport
+
+
+def get_steepest_temperature(temperature: np.ndarray, resistivity: np.ndarray):
+    """temperature of the largest slope of each row, over SLOPE_SPAN points"""
+    span = min(SLOPE_SPAN, temperature.shape[-1] - 1)
+    d_temperature = temperature[:, span:] - temperature[:, :-span]
+    d_resistivity = resistivity[:, span:] - resistivity[:, :-span]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.where(d_temperature > 0, d_resistivity / d_temperature, np.nan)
+    idx = np.nanargmax(slope, axis=-1)
+    rows = np.arange(len(temperature))
+    return (temperature[rows, idx] + temperature[rows, idx + span]) / 2
+
+
+def get_normal_state(
+    temperature: np.ndarray, resistivity: np.ndarray, samples: list[PPMSSample]
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """normal state resistivity, its standard error and the window it is taken over"""
+    steepest = get_steepest_temperature(temperature, resistivity)
+    window = steepest[:, None] * np.array(NORMAL_RANGE)
+    for idx, sample in enumerate(samples):
+        if sample.normal_range is not None:
+            window[idx] = sample.normal_range
+
+    is_normal = (temperature >= window[:, :1]) & (temperature <= window[:, 1:])
+    normal = np.where(is_normal, resistivity, np.nan)
+    count = np.sum(is_normal, axis=-1)
+    rho_n = np.nanmedian(normal, axis=-1)
+    rho_n_err = np.nanstd(normal, axis=-1) / np.sqrt(np.maximum(count, 1))
+    return rho_n, rho_n_err, window
+
+
+def get_transition_temperatures(
+    temperature: np.ndarray,
+    resistivity: np.ndarray,
+    rho_n: np.ndarray,
+    max_temperature: np.ndarray,
+    fractions: tuple[float, ...] = FRACTIONS,
+) -> np.ndarray:
+    """
+    temperatures of shape (num_fractions, num_samples) at which the resistivity last
+    crosses each fraction of rho_n below max_temperature, linearly interpolated
+    """
+    level = np.array(fractions)[:, None, None] * rho_n[None, :, None]
+    is_below = (resistivity < level) & (temperature < max_temperature[:, None])
+
+    num_points = temperature.shape[-1]
+    idx = num_points - 1 - np.argmax(is_below[..., ::-1], axis=-1)
+    idx = np.minimum(idx, num_points - 2)
+    t_0 = np.take_along_axis(temperature[None], idx[..., None], axis=-1)[..., 0]
+    t_1 = np.take_along_axis(temperature[None], idx[..., None] + 1, axis=-1)[..., 0]
+    r_0 = np.take_along_axis(resistivity[None], idx[..., None], axis=-1)[..., 0]
+    r_1 = np.take_along_axis(resistivity[None], idx[..., None] + 1, axis=-1)[..., 0]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tc = t_0 + (level[..., 0] - r_0) * (t_1 - t_0) / (r_1 - r_0)
+    return np.where(np.any(is_below, axis=-1), tc, np.nan)
+
+
+@instrument
+def get_tc_table(samples: list[PPMSSample], folder: Path = DATA_FOLDER) -> pd.DataFrame:
+    """one row per sample with rho_n (microohm.cm), Tc at FRACTIONS and the width"""
+    transport = load_transport(samples, folder)
+    factor = np.array([sample.resistivity_factor for sample in samples])[:, None]
+    resistivity, _ = propagation.scale(
+        transport["resistance"], transport["resistance_std"], factor
+    )
+    temperature = transport["temperature"]
+
+    rho_n, rho_n_err, window = get_normal_state(temperature, resistivity, samples)
+    tc = get_transition_temperatures(temperature, resistivity, rho_n, window[:, 0])
+
+    table = pd.DataFrame(
+        {
+            "film_thickness": [sample.film_thickness for sample in samples],
+            "rho_n": rho_n,
+            "rho_n_err": rho_n_err,
+        },
+        index=pd.Index([sample.name for sample in samples], name="sample"),
+    )
+    for fraction, tc_fraction in zip(FRACTIONS, tc):
+        table[f"Tc_{100 * fraction:.0f}"] = tc_fraction
+    table["width"] = table[f"Tc_{100 * max(FRACTIONS):.0f}"]
+    table["width"] -= table[f"Tc_{100 * min(FRACTIONS):.0f}"]
+    return table
+
+
+def link_resonators(
+    tc_table: pd.DataFrame,
+    resonators: list[Resonator],
+    tolerance: float = THICKNESS_TOLERANCE,
+) -> pd.DataFrame:
+    """
+    one row per resonator with its film thickness and the transition of the sample with
+    the nearest film thickness, NaN if none is within tolerance (m)
+    """
+    resonator_table = pd.DataFrame(
+        {
+            "resonator_name": [resonator.name for resonator in resonators],
+            "film_thickness": [resonator.film_thickness for resonator in resonators],
+        }
+    ).astype({"film_thickness": float})
+    return pd.merge_asof(
+        resonator_table.sort_values(by="film_thickness"),
+        tc_table.reset_index().sort_values(by="film_thickness"),
+        on="film_thickness",
+        direction="nearest",
+        tolerance=tolerance,
+    )
+
+
+if __name__ == "__main__":
+    """ """
+
+    tc_table = get_tc_table(load_samples())
+
+    OUTPUT_FOLDER.mkdir(parents=True, exist_ok=True)
+    tc_table.to_csv(OUTPUT_FOLDER / "ppms_tc.csv")
+
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(tc_table)
@@ -2,43 +2,26 @@
 
 from pathlib import Path
 
-from betata import plt, get_purples
+from betata import plt, get_purples, propagation
+from betata.profiling import instrument
 import pandas as pd
-import numpy as np
 import matplotlib.ticker as tck
-from uncertainties import unumpy
+from betata.verify_phase.instrument_file import read_instrument_file
+from betata.verify_phase.ppms import get_tc_table, load_samples
 
 TRACE_COLOR = get_purples(1, 1.0, 1.0)[0]
 TRANSPARENCY = 0.85
 
 
-def find_header_row(filepath, header="[Data]"):
-    """ """
-    header_row_num = None
-    with open(filepath) as file:
-        for idx, line in enumerate(file.readlines(), start=1):
-            if line.startswith(header):
-                header_row_num = idx
-                break
-    return header_row_num
-
-
-def extract_data(filepath, skip_header=None, usecols=None, names=True):
-    """ """
-    data = np.genfromtxt(
-        filepath,
-        delimiter=",",
-        skip_header=skip_header,
-        usecols=usecols,
-        names=names,
-    )
-    return pd.DataFrame(data)
-
+@instrument
+def plot_data(x, y, yerr, figsize=(6, 6), ax=None):
+    """draws into ax if given, e.g. a panel of a composite figure"""
 
-def plot_data(x, y, yerr, figsize=(6, 6)):
-    """ """
-
-    fig, ax = plt.subplots(figsize=figsize)
+    is_new_figure = ax is None
+    if is_new_figure:
+        fig, ax = plt.subplots(figsize=figsize)
+    else:
+        fig = ax.figure
 
     ax.set_xlabel("Temperature (K)")
     ax.set_ylabel(r"Resistivity ($\mathrm{\mu \Omega}$.cm)")
@@ -51,22 +34,25 @@ def plot_data(x, y, yerr, figsize=(6, 6)):
     ax.yaxis.set_major_locator(tck.MultipleLocator(50))
     ax.yaxis.set_minor_locator(tck.MultipleLocator(10))
 
-    fig.tight_layout()
+    if is_new_figure:
+        fig.tight_layout()
 
     return fig, ax
 
 
-if __name__ == "__main__":
-    """ """
-
+def plot_panel(ax=None):
+    """low temperature resistivity of the hall bar, labelled with its Tc"""
     # hall bar dimensions in m
     film_thickness = 240e-9
     channel_length = 370e-6
     channel_width = 25e-6
     x_section_area = film_thickness * channel_width
 
-    # tc is determined by reading off the interpolated temperature at 50% rho_n
-    tc_str = r"$\mathrm{T_c \sim}$ 0.69 K"
+    # tc is the interpolated temperature at 50% rho_n
+    tc_table = get_tc_table(
+        [sample for sample in load_samples() if sample.name == "ch1_130_c2_230"]
+    )
+    tc_str = r"$\mathrm{T_c \sim}$ " + f"{tc_table['Tc_50'].iloc[0]:.2f} K"
 
     # we combine data from the full range (fr) and low temp (lt) scans
     datafolder = Path(__file__).parents[3] / "data/verify_phase"
@@ -79,42 +65,26 @@ if __name__ == "__main__":
         15: "resistance_std",
     }
 
-    # extract full range data
-    skip_header_fr = find_header_row(filepath_fr)
-    data_fr = extract_data(
-        filepath_fr,
-        skip_header=skip_header_fr + 1,  # + 1 to handle NaN values for custom names
-        usecols=colmap.keys(),
-        names=colmap.values(),
-    )
-
-    # extract low temp data
-    skip_header_lt = find_header_row(filepath_lt)
-    data_lt = extract_data(
-        filepath_lt,
-        skip_header=skip_header_lt + 1,  # + 1 to handle NaN values for custom names
-        usecols=colmap.keys(),
-        names=colmap.values(),
-    )
+    # extract full range and low temp data
+    data_fr = read_instrument_file(filepath_fr, colmap)
+    data_lt = read_instrument_file(filepath_lt, colmap)
 
     # combine both datasets and trim temperature domain to below 1.5K
     data = pd.concat([data_fr[data_fr["temperature"] < 1.5], data_lt])
     data = data.sort_values(by="temperature")
 
-    # convert resistance to resistivity
-    resistance_uarr = unumpy.uarray(data["resistance"], data["resistance_std"])
-    resistivity_uarr = resistance_uarr * x_section_area / channel_length
-    # change resistivity units to microohm.cm
-    resistivity_uarr *= 1e8
-
-    data["resistivity"] = unumpy.nominal_values(resistivity_uarr)
-    data["resistivity_std"] = unumpy.std_devs(resistivity_uarr)
+    # convert resistance to resistivity, in units of microohm.cm
+    resistivity_factor = (x_section_area / channel_length) * 1e8
+    data["resistivity"], data["resistivity_std"] = propagation.scale(
+        data["resistance"], data["resistance_std"], resistivity_factor
+    )
 
     figure, axis = plot_data(
         data["temperature"],
         data["resistivity"],
         data["resistivity_std"],
         figsize=(6, 5),
+        ax=ax,
     )
 
     axis.text(
@@ -126,6 +96,14 @@ if __name__ == "__main__":
         transform=axis.transAxes,
     )
 
+    return figure, axis
+
+
+if __name__ == "__main__":
+    """ """
+
+    figure, axis = plot_panel()
+
     figsavepath = Path(__file__).parents[3] / "out/verify_phase/PPMS.png"
 
     plt.savefig(figsavepath, dpi=300, bbox_inches="tight")
@@ -0,0 +1,321 @@
+"""
+Lazy processing of large TEM micrographs, with the FFT inset computed in the package.
+
+A micrograph is decoded once into a grayscale .npy cache next to its source file and
+memory-mapped after that. Cropping then reads only the rows it needs, and downsampling
+for display goes through the crop in bands of TILE_ROWS rows. The power spectrum of the
+central FFT_SIZE pixels of the crop is computed with numpy at full resolution and shown
+as an inset. Scale bars are drawn from the pixel size or scale listed in
+tem_micrographs.toml, or the calibration of the image file. A folder of micrographs is
+rendered across a process pool.
+
+    python -m betata.verify_phase.tem        # micrographs listed in tem_micrographs.toml
+    python -m betata.verify_phase.tem --all  # and every other image in data/verify_phase
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+import os
+from pathlib import Path
+import re
+import tomllib
+
+from mpl_toolkits.axes_grid1.anchored_artists import AnchoredSizeBar
+import numpy as np
+from PIL import Image
+from scipy import fft
+
+from betata import plt
+from betata.profiling import instrument
+
+DATA_FOLDER = Path(__file__).parents[3] / "data/verify_phase"
+OUTPUT_FOLDER = Path(__file__).parents[3] / "out/verify_phase"
+MICROGRAPHS_FILEPATH = Path(__file__).parent / "tem_micrographs.toml"
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".tif", ".tiff")
+TILE_ROWS = 1024  # rows of the full resolution image read at a time
+MAX_DISPLAY_SIZE = 2048  # pixels a side, larger crops are downsampled for display
+FFT_SIZE = 2048  # pixels a side of the central region the power spectrum is taken of
+INSET_SIZE = 0.32  # of the axes
+INSET_ZOOM = 0.2  # fraction of the power spectrum around zero frequency shown
+SPECTRUM_PERCENTILES = (50, 99.9)  # color limits of the power spectrum
+SCALE_BAR_FRACTION = 0.2  # of the image width, rounded down to 1, 2 or 5 times 10^n
+SCALE_BAR_COLOR = "white"
+DPI = 600
+
+# length units of the calibration ImageJ writes to the TIFF image description
+UNITS = {"m": 1, "cm": 1e-2, "mm": 1e-3, "um": 1e-6, "micron": 1e-6, "µm": 1e-6}
+UNITS |= {"nm": 1e-9, "A": 1e-10, "Å": 1e-10}
+
+
+@dataclass
+class Micrograph:
+    """ """
+
+    name: str
+    file: str
+    pixel_size: float = None  # m
+    # (length in m, pixels, width): a scale bar of length spans pixels in the image
+    # rescaled to width pixels wide, for calibrations read off a downsampled copy
+    scale: tuple[float, float, int] = None
+    crop: tuple[int, int, int, int] = None  # x, y, width, height in pixels
+
+
+def get_micrographs(
+    folder: Path = DATA_FOLDER,
+    filepath: Path = MICROGRAPHS_FILEPATH,
+    include_unlisted: bool = False,
+) -> list[Micrograph]:
+    """
+    micrographs listed in filepath, then the unlisted image files in folder if
+    include_unlisted, which also picks up exported FFTs and other non-micrographs
+    """
+    with open(filepath, "rb") as file:
+        listed = tomllib.load(file)["micrographs"]
+    micrographs = [Micrograph(name=name, **spec) for name, spec in listed.items()]
+    if not include_unlisted:
+        return micrographs
+
+    listed_files = {micrograph.file for micrograph in micrographs}
+    for path in sorted(Path(folder).iterdir()):
+        if path.suffix.lower() in IMAGE_SUFFIXES and path.name not in listed_files:
+            micrographs.append(Micrograph(name=path.stem, file=path.name))
+    return micrographs
+
+
+def read_pixel_size(filepath: Path) -> float | None:
+    """pixel size (m) from the calibration ImageJ writes to TIFF tags, None if absent"""
+    with Image.open(filepath) as image:
+        tags = getattr(image, "tag_v2", {})
+        description = str(tags.get(270, ""))
+        x_resolution = tags.get(282)  # pixels per unit
+
+    match = re.search(r"unit=(\S+)", description)
+    if not x_resolution or match is None:
+        return None
+    unit = match.group(1).replace("\\u00B5", "µ")
+    return UNITS[unit] / float(x_resolution) if unit in UNITS else None
+
+
+def get_pixel_size(micrograph: Micrograph, filepath: Path, image_width: int) -> float | None:
+    """
+    pixel size (m) of the full resolution image, from the micrograph's pixel_size or
+    scale if given, otherwise from the calibration of the image file
+    """
+    if micrograph.pixel_size is not None:
+        return micrograph.pixel_size
+    if micrograph.scale is not None:
+        length, pixels, width = micrograph.scale
+        return length * width / (pixels * image_width)
+    return read_pixel_size(filepath)
+
+
+def get_cache_path(filepath: Path) -> Path:
+    """ """
+    return filepath.with_name(f"{filepath.name}.gray.npy")
+
+
+@instrument
+def load_image(filepath: Path, cache: bool = True) -> np.ndarray:
+    """
+    grayscale image as a read only memory map of its .npy cache, which is written the
+    first time and whenever the source file changes
+    """
+    filepath = Path(filepath)
+    if filepath.suffix == ".npy":
+        return np.load(filepath, mmap_mode="r")
+
+    cache_path = get_cache_path(filepath)
+    if cache and cache_path.exists():
+        if cache_path.stat().st_mtime >= filepath.stat().st_mtime:
+            return np.load(cache_path, mmap_mode="r")
+
+    with Image.open(filepath) as image:
+        if image.mode not in ("L", "I;16", "F"):
+            image = image.convert("L" if len(image.getbands()) > 1 else "F")
+        data = np.asarray(image)
+    if not cache:
+        return data
+
+    # written under a temporary name so parallel workers never read a partial cache
+    temp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    with open(temp_path, "wb") as file:
+        np.save(file, data)
+    os.replace(temp_path, cache_path)
+    return np.load(cache_path, mmap_mode="r")
+
+
+def crop(image: np.ndarray, box: tuple[int, int, int, int] = None) -> np.ndarray:
+    """view of the (x, y, width, height) box of image, the whole image if None"""
+    if box is None:
+        return image
+    x, y, width, height = box
+    return image[y : y + height, x : x + width]
+
+
+def downsample(
+    image: np.ndarray, factor: int, tile_rows: int = TILE_ROWS
+) -> np.ndarray:
+    """mean over blocks of factor x factor pixels, reading tile_rows rows at a time"""
+    if factor <= 1:
+        return np.asarray(image, dtype=np.float32)
+
+    num_rows, num_cols = image.shape[0] // factor, image.shape[1] // factor
+    downsampled = np.empty((num_rows, num_cols), dtype=np.float32)
+    band_rows = max(tile_rows // factor, 1)
+    for start in range(0, num_rows, band_rows):
+        stop = min(start + band_rows, num_rows)
+        band = image[start * factor : stop * factor, : num_cols * factor]
+        band = np.asarray(band, dtype=np.float32)
+        band = band.reshape(stop - start, factor, num_cols, factor)
+        downsampled[start:stop] = band.mean(axis=(1, 3))
+    return downsampled
+
+
+def get_power_spectrum(region: np.ndarray, size: int = FFT_SIZE) -> np.ndarray:
+    """
+    log power spectrum of the central square of region, at most size pixels a side,
+    Hann windowed and with zero frequency at the center. Its frequency step is
+    1 / (len(spectrum) * pixel_size).
+    """
+    size = min(size, *region.shape)
+    y, x = (region.shape[0] - size) // 2, (region.shape[1] - size) // 2
+    square = np.asarray(region[y : y + size, x : x + size], dtype=np.float32)
+
+    window = np.hanning(size).astype(np.float32)
+    square = (square - square.mean()) * window[:, None] * window[None, :]
+    spectrum = fft.fftshift(fft.fft2(square, workers=-1))
+    return np.log1p(np.abs(spectrum) ** 2)
+
+
+def get_scale_bar_length(width: float) -> float:
+    """1, 2 or 5 times a power of ten, at most SCALE_BAR_FRACTION of width"""
+    target = SCALE_BAR_FRACTION * width
+    power = 10 ** np.floor(np.log10(target))
+    return max(n * power for n in (1, 2, 5) if n * power <= target)
+
+
+def add_scale_bar(
+    ax, pixel_size: float, num_pixels: int, reciprocal: bool = False
+) -> AnchoredSizeBar:
+    """
+    scale bar of an image num_pixels wide with pixel_size m per pixel shown, or 1/m per
+    pixel if reciprocal
+    """
+    length = get_scale_bar_length(pixel_size * num_pixels)
+    if reciprocal:
+        label = f"{length * 1e-9:g} nm$^{{-1}}$"
+    elif length < 1e-6:
+        label = f"{length * 1e9:g} nm"
+    else:
+        label = f"{length * 1e6:g} µm"
+
+    scale_bar = AnchoredSizeBar(
+        ax.transData,
+        length / pixel_size,
+        label,
+        loc="lower left",
+        pad=0.5,
+        color=SCALE_BAR_COLOR,
+        frameon=False,
+        size_vertical=num_pixels / 60,
+        label_top=True,
+    )
+    ax.add_artist(scale_bar)
+    return scale_bar
+
+
+@instrument
+def plot_micrograph(
+    micrograph: Micrograph,
+    folder: Path = DATA_FOLDER,
+    ax=None,
+    max_display_size: int = MAX_DISPLAY_SIZE,
+    inset: bool = True,
+):
+    """
+    crop of the micrograph downsampled to at most max_display_size pixels a side, with
+    its power spectrum as an inset, and scale bars if the pixel size is known
+    """
+    filepath = Path(folder) / micrograph.file
+    image = load_image(filepath)
+    region = crop(image, micrograph.crop)
+    factor = max(int(np.ceil(max(region.shape) / max_display_size)), 1)
+    shown = downsample(region, factor)
+    pixel_size = get_pixel_size(micrograph, filepath, image.shape[1])
+
+    if ax is None:
+        fig, ax = plt.subplots(figsize=(8, 8))
+    else:
+        fig = ax.figure
+
+    ax.imshow(shown, cmap="gray")
+    ax.axis("off")
+    if pixel_size is not None:
+        add_scale_bar(ax, pixel_size * factor, shown.shape[1])
+
+    if inset:
+        spectrum = get_power_spectrum(region)
+        center, half = len(spectrum) // 2, max(int(len(spectrum) * INSET_ZOOM / 2), 1)
+        zoom = spectrum[center - half : center + half, center - half : center + half]
+        vmin, vmax = np.percentile(zoom, SPECTRUM_PERCENTILES)
+
+        inset_ax = ax.inset_axes([1 - INSET_SIZE, 0, INSET_SIZE, INSET_SIZE])
+        inset_ax.imshow(zoom, cmap="gray", vmin=vmin, vmax=vmax)
+        inset_ax.axis("off")
+        if pixel_size is not None:
+            frequency_step = 1 / (len(spectrum) * pixel_size)
+            add_scale_bar(inset_ax, frequency_step, len(zoom), reciprocal=True)
+
+    return fig, ax
+
+
+def save_micrograph(
+    micrograph: Micrograph,
+    folder: Path = DATA_FOLDER,
+    output_folder: Path = OUTPUT_FOLDER,
+) -> Path:
+    """ """
+    fig, _ = plot_micrograph(micrograph, folder)
+    output_folder.mkdir(parents=True, exist_ok=True)
+    figsavepath = output_folder / f"{micrograph.name}.png"
+    fig.savefig(figsavepath, dpi=DPI, bbox_inches="tight", pad_inches=0)
+    plt.close(fig)
+    return figsavepath
+
+
+@instrument
+def save_micrographs(
+    micrographs: list[Micrograph],
+    folder: Path = DATA_FOLDER,
+    output_folder: Path = OUTPUT_FOLDER,
+    jobs: int = None,
+) -> list[Path]:
+    """save all micrographs, in parallel over `jobs` processes (default = all cores)"""
+    jobs = jobs or os.cpu_count()
+    if jobs == 1 or len(micrographs) <= 1:
+        return [save_micrograph(m, folder, output_folder) for m in micrographs]
+
+    with ProcessPoolExecutor(max_workers=min(jobs, len(micrographs))) as executor:
+        futures = [
+            executor.submit(save_micrograph, micrograph, folder, output_folder)
+            for micrograph in micrographs
+        ]
+        return [future.result() for future in futures]
+
+
+if __name__ == "__main__":
+    """ """
+
+    parser = argparse.ArgumentParser(description="Render the TEM micrographs.")
+    parser.add_argument("folder", nargs="?", type=Path, default=DATA_FOLDER)
+    parser.add_argument("-j", "--jobs", type=int, help="number of parallel processes")
+    parser.add_argument(
+        "--all", action="store_true", help="also render images not listed in the toml"
+    )
+    args = parser.parse_args()
+
+    micrographs = get_micrographs(args.folder, include_unlisted=args.all)
+    for figsavepath in save_micrographs(micrographs, args.folder, jobs=args.jobs):
+        print(figsavepath)
@@ -0,0 +1,184 @@
+"""
+Batched pseudo-Voigt fits of XRD peaks across many scans, to screen the phase of films.
+
+All scans are stacked on a common 2theta grid, so the window of a peak covers the same
+points in every scan and its profile is fitted in all scans at once with the vectorized
+least squares solver of `betata.batch_fit`. Each peak is a pseudo-Voigt profile on a
+linear background. The fitted FWHM gives the crystallite size by the Scherrer equation.
+The alpha area ratio, the alpha peak's share of the alpha and beta peak areas, screens the
+phase. It is not a phase fraction, since no reference intensity ratios are applied.
+
+    python -m betata.verify_phase.xrd  # all .dql scans in data/verify_phase
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from betata.batch_fit import fit_batch
+from betata.profiling import instrument
+from betata.verify_phase.instrument_file import read_columns
+
+DATA_FOLDER = Path(__file__).parents[3] / "data/verify_phase"
+OUTPUT_FOLDER = Path(__file__).parents[3] / "out/verify_phase"
+
+WAVELENGTH = 1.5406e-10  # m, Cu K-alpha 1
+SCHERRER_K = 0.9
+INSTRUMENT_FWHM = 0.0  # degrees, subtracted in quadrature before the Scherrer equation
+# peak height over the residual noise for a peak to be detected
+DETECTION_THRESHOLD = 5.0
+
+PARAM_NAMES = ("area", "center", "fwhm", "eta", "bg_offset", "bg_slope")
+
+
+@dataclass
+class PeakSpec:
+    """ """
+
+    label: str
+    # 2theta window in degrees that the profile is fitted in
+    domain: tuple[float, float]
+
+
+PEAKS = [
+    PeakSpec("alpha-Ta (110)", (37.5, 39.0)),
+    PeakSpec("beta-Ta (002)", (33.0, 34.5)),
+    PeakSpec("Al2O3 (0006)", (41.2, 42.2)),
+]
+ALPHA_PEAK, BETA_PEAK = "alpha-Ta (110)", "beta-Ta (002)"
+
+
+def list_scans(folder: Path = DATA_FOLDER) -> list[Path]:
+    """ """
+    return sorted(path for path in Path(folder).iterdir() if path.suffix == ".dql")
+
+
+@instrument
+def load_scans(filepaths: list[Path]) -> tuple[list[str], np.ndarray, np.ndarray]:
+    """
+    scan names, the common 2theta grid and the intensities of shape (num_scans,
+    num_points). Scans on different grids are interpolated onto the overlap of their
+    ranges at the finest step among them.
+    """
+    scans = [read_columns(filepath, usecols=(0, 1)) for filepath in filepaths]
+    names = [Path(filepath).stem for filepath in filepaths]
+
+    angle = scans[0][:, 0]
+    if all(np.array_equal(scan[:, 0], angle) for scan in scans):
+        return names, angle, np.stack([scan[:, 1] for scan in scans])
+
+    start = max(scan[0, 0] for scan in scans)
+    stop = min(scan[-1, 0] for scan in scans)
+    step = min(np.median(np.diff(scan[:, 0])) for scan in scans)
+    angle = np.arange(start, stop + step / 2, step)
+    intensity = np.stack([np.interp(angle, scan[:, 0], scan[:, 1]) for scan in scans])
+    return names, angle, intensity
+
+
+def pseudo_voigt(x, area, center, fwhm, eta, bg_offset, bg_slope):
+    """area normalized pseudo-Voigt profile on a linear background"""
+    u = 2 * (x - center) / fwhm
+    gaussian = np.sqrt(4 * np.log(2) / np.pi) / fwhm * np.exp(-np.log(2) * u**2)
+    lorentzian = 2 / (np.pi * fwhm) / (1 + u**2)
+    return area * (eta * lorentzian + (1 - eta) * gaussian) + bg_offset + bg_slope * x
+
+
+def guess_params(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """initial parameters of the profiles in windows y of shape (num_scans, n)"""
+    bg_slope = (y[:, -1] - y[:, 0]) / (x[-1] - x[0])
+    bg_offset = y[:, 0] - bg_slope * x[0]
+    signal = y - (bg_offset[:, None] + bg_slope[:, None] * x)
+
+    peak_idx = np.argmax(signal, axis=-1)
+    height = np.take_along_axis(signal, peak_idx[:, None], axis=-1)[:, 0]
+    step = np.median(np.diff(x))
+    fwhm = np.maximum(np.sum(signal > height[:, None] / 2, axis=-1), 2) * step
+    area = np.maximum(height, 0) * fwhm * 1.06  # gaussian area to height ratio
+
+    eta = np.full(len(y), 0.5)
+    return np.stack([area, x[peak_idx], fwhm, eta, bg_offset, bg_slope], axis=-1)
+
+
+def get_scherrer_size(center, fwhm, instrument_fwhm: float = INSTRUMENT_FWHM):
+    """crystallite size (m) from the peak position and FWHM in degrees 2theta"""
+    broadening = np.sqrt(np.maximum(fwhm**2 - instrument_fwhm**2, 0))
+    theta = np.radians(center) / 2
+    with np.errstate(divide="ignore"):
+        return SCHERRER_K * WAVELENGTH / (np.radians(broadening) * np.cos(theta))
+
+
+@instrument
+def fit_peaks(
+    names: list[str],
+    angle: np.ndarray,
+    intensity: np.ndarray,
+    peaks: list[PeakSpec] = PEAKS,
+    instrument_fwhm: float = INSTRUMENT_FWHM,
+) -> pd.DataFrame:
+    """
+    one row per scan and peak with the fitted parameters, the Scherrer size and whether
+    the peak is detected, with the profile of each peak fitted in all scans at once
+    """
+    tables = []
+    for peak in peaks:
+        is_in_window = (angle >= peak.domain[0]) & (angle <= peak.domain[1])
+        x, y = angle[is_in_window], intensity[:, is_in_window]
+
+        step, width = np.median(np.diff(x)), peak.domain[1] - peak.domain[0]
+        lower = [0, peak.domain[0], step / 2, 0, -np.inf, -np.inf]
+        upper = [np.inf, peak.domain[1], width, 1, np.inf, np.inf]
+        params = fit_batch(pseudo_voigt, x, y, guess_params(x, y), lower, upper)
+
+        table = pd.DataFrame(params, columns=PARAM_NAMES)
+        residuals = y - pseudo_voigt(x, *params.T[..., None])
+        noise = np.std(residuals, axis=-1)
+        # height of the profile above the background at its center
+        area, fwhm, eta = table["area"], table["fwhm"], table["eta"]
+        gaussian_peak = np.sqrt(4 * np.log(2) / np.pi)
+        height = area / fwhm * (eta * 2 / np.pi + (1 - eta) * gaussian_peak)
+        table.insert(0, "peak", peak.label)
+        table.insert(0, "scan", names)
+        table["height"] = height
+        table["is_detected"] = height > DETECTION_THRESHOLD * noise
+        table["size (nm)"] = 1e9 * get_scherrer_size(
+            table["center"], table["fwhm"], instrument_fwhm
+        )
+        tables.append(table)
+
+    return pd.concat(tables, ignore_index=True)
+
+
+def get_phase_table(fits: pd.DataFrame) -> pd.DataFrame:
+    """
+    one row per scan with the area (0 if not detected) and size (NaN if not detected) of
+    each peak, and the alpha area ratio area_alpha / (area_alpha + area_beta)
+    """
+    detected = fits.assign(
+        area=fits["area"].where(fits["is_detected"], 0),
+        size=fits["size (nm)"].where(fits["is_detected"]),
+    )
+    table = detected.pivot(index="scan", columns="peak", values=["area", "size"])
+    table.columns = [f"{peak} {value}" for value, peak in table.columns]
+
+    area_alpha = table[f"{ALPHA_PEAK} area"]
+    area_beta = table[f"{BETA_PEAK} area"]
+    with np.errstate(invalid="ignore"):
+        table["alpha area ratio"] = area_alpha / (area_alpha + area_beta)
+    return table
+
+
+if __name__ == "__main__":
+    """ """
+
+    names, angle, intensity = load_scans(list_scans())
+    fits = fit_peaks(names, angle, intensity)
+    phase_table = get_phase_table(fits)
+
+    OUTPUT_FOLDER.mkdir(parents=True, exist_ok=True)
+    fits.to_csv(OUTPUT_FOLDER / "xrd_peak_fits.csv", index=False)
+    phase_table.to_csv(OUTPUT_FOLDER / "xrd_phase.csv")
+
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(phase_table)
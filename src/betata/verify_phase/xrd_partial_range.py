@@ -5,6 +5,8 @@ from pathlib import Path
 import numpy as np
 
 from betata import plt, get_purples
+from betata.profiling import instrument
+from betata.verify_phase.instrument_file import read_columns
 import matplotlib.ticker as tck
 
 TRACE_COLOR = get_purples(1, 1.0, 1.0)[0]
@@ -31,40 +33,30 @@ class RefPeak:
     label_yloc: float = None
 
 
+@instrument
 def extract_data(filepath):
     """ """
-    header = "[Data]"
-    header_idx = None
-
-    with open(filepath) as file:
-        for idx, line in enumerate(file.readlines(), start=1):
-            if line.startswith(header):
-                header_idx = idx
-                break
-
-    data = np.genfromtxt(
-        filepath,
-        skip_header=header_idx,
-        usecols=(0, 1),
-        delimiter=",",
-        names=True,
-    )
-
-    data.dtype.names = "2θ", "Intensity"
-    angle, intensity = data["2θ"], data["Intensity"]
+    data = read_columns(filepath, usecols=(0, 1))
+    angle, intensity = data[:, 0], data[:, 1]
     return angle, intensity
 
 
+@instrument
 def plot_data(
     scan: XRDScan,
     ref_peaks: list[RefPeak] = None,
     figsize=(6, 6),
     yscale="log",
+    ax=None,
 ):
-    """ """
+    """draws into ax if given, e.g. a panel of a composite figure"""
     ref_peaks = [] if ref_peaks is None else ref_peaks
 
-    fig, ax = plt.subplots(1, 1, figsize=figsize)
+    is_new_figure = ax is None
+    if is_new_figure:
+        fig, ax = plt.subplots(1, 1, figsize=figsize)
+    else:
+        fig = ax.figure
     ax.set_yscale(yscale)
     ax.set_xlabel(r"2$\mathrm{\theta}$ (°)")
     ax.set_ylabel("Intensity (A.U.)")
@@ -95,14 +87,14 @@ def plot_data(
     ax.xaxis.set_major_locator(tck.MultipleLocator(2))
     ax.xaxis.set_minor_locator(tck.MultipleLocator(0.2))
 
-    fig.tight_layout()
+    if is_new_figure:
+        fig.tight_layout()
 
     return fig
 
 
-if __name__ == "__main__":
-    """ """
-
+def plot_panel(ax=None):
+    """XRD scan of the film with its alpha-Ta, beta-Ta and substrate peaks"""
     scan = XRDScan(
         path=Path(__file__).parents[3] / "data/verify_phase/XRD_066.dql",
         domain=[30, 46],
@@ -140,13 +132,20 @@ if __name__ == "__main__":
 
     print(AL2O3110)
 
-    figure = plot_data(
+    return plot_data(
         scan,
         ref_peaks=[ATA110, BTA002, AL2O3110],
         yscale="linear",
         figsize=(8, 5),
+        ax=ax,
     )
 
+
+if __name__ == "__main__":
+    """ """
+
+    figure = plot_panel()
+
     figsavepath = Path(__file__).parents[3] / "out/verify_phase/XRD.png"
 
     plt.savefig(figsavepath, dpi=300, bbox_inches="tight")